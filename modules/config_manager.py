@@ -1,6 +1,29 @@
+import threading
+import time
 from typing import Dict, Any, Optional
 from modules.database import DatabaseConnection
-from modules.sensor_registry import SensorRegistry
+from modules.sensor_registry import SensorRegistry, resolve_sensor_name
+
+
+# --- METADATOS DE DISPOSITIVOS (caché compartida del proceso) ---
+# Una lectura de 'devices' por TTL para todas las sesiones, vistas y tarjetas, en vez de
+# un find_one por tarjeta en cada render / refresh del fragmento del dashboard.
+# Se invalida explícitamente al guardar alias, ubicación o umbrales desde Configuración.
+DEVICE_METADATA_TTL_SECONDS = 300
+
+_DEVICE_METADATA: Dict[tuple, Dict[str, Any]] = {}  # fuentes -> {"meta", "loaded_at"}
+_DEVICE_METADATA_LOCK = threading.Lock()
+DEVICE_METADATA_STATS = {"hits": 0, "loads": 0}
+
+
+def _device_sources_key(db: DatabaseConnection) -> tuple:
+    return tuple((s.get("name"), s.get("db"), s.get("coll_devices")) for s in db.sources)
+
+
+def invalidate_device_metadata():
+    """Descarta los metadatos cacheados; la próxima lectura vuelve a la base de datos."""
+    with _DEVICE_METADATA_LOCK:
+        _DEVICE_METADATA.clear()
 
 
 class ConfigManager:
@@ -10,8 +33,6 @@ class ConfigManager:
     def __init__(self, db: DatabaseConnection):
         self.db = db
         self._cached_config = None
-        # Cache para metadatos de dispositivos para evitar queries constantes en bucles
-        self._cached_devices_meta = None
     
     def get_sensor_config(self, force_refresh: bool = False) -> Dict[str, Any]:
         """Obtiene la configuración GLOBAL de sensores (defaults)."""
@@ -133,11 +154,27 @@ class ConfigManager:
     
     # --- MÉTODOS DE METADATOS Y DISPOSITIVOS (NUEVO ESQUEMA) ---
 
-    def get_device_metadata(self) -> Dict[str, Dict[str, Any]]:
+    def get_device_metadata(self, force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
         """
-        Recupera metadatos de la colección 'devices'.
+        Recupera metadatos de la colección 'devices' (caché compartida con TTL).
         Retorna un dict: {device_id: {alias: ..., location: ..., thresholds: ...}}
+        No modificar el dict retornado: es el mismo para todas las sesiones.
         """
+        key = _device_sources_key(self.db)
+        with _DEVICE_METADATA_LOCK:
+            entry = _DEVICE_METADATA.get(key)
+            if (entry is not None and not force_refresh
+                    and time.time() - entry["loaded_at"] < DEVICE_METADATA_TTL_SECONDS):
+                DEVICE_METADATA_STATS["hits"] += 1
+                return entry["meta"]
+
+            # Bajo el lock: sesiones concurrentes esperan esta lectura en vez de repetirla
+            meta_map = self._load_device_metadata()
+            _DEVICE_METADATA[key] = {"meta": meta_map, "loaded_at": time.time()}
+            DEVICE_METADATA_STATS["loads"] += 1
+            return meta_map
+
+    def _load_device_metadata(self) -> Dict[str, Dict[str, Any]]:
         raw_devices = self.db.get_all_registered_devices()
         meta_map = {}
         for d in raw_devices:
@@ -166,9 +203,11 @@ class ConfigManager:
         """Convierte formato plano (ph_min) a anidado ({ph: {min: ...}}) si es necesario."""
         normalized = {}
         for k, v in raw.items():
-            # Si ya es un dict, asumimos formato correcto (nested)
+            # Si ya es un dict, asumimos formato correcto (nested); el nombre estándar gana sobre sus alias
             if isinstance(v, dict):
-                normalized[k] = v
+                sensor = resolve_sensor_name(k)
+                if sensor == k or sensor not in normalized:
+                    normalized[sensor] = v
                 continue
             
             # Intentar parsear keys planas: ph_min, temp_max, etc.
@@ -179,7 +218,7 @@ class ConfigManager:
                 sensor = "_".join(parts[:-1]) # ph, temp, dissolved_oxygen
                 
                 # Normalizar nombres de sensores comunes
-                if sensor in ['temp', 'temperatura']: sensor = 'temperature'
+                sensor = resolve_sensor_name(sensor)
                 
                 if sensor not in normalized: normalized[sensor] = {}
                 
@@ -202,15 +241,18 @@ class ConfigManager:
             "alias": alias,
             "location": location
         }
-        return self.db.update_device_doc(device_id, update_data)
+        success = self.db.update_device_doc(device_id, update_data)
+        if success:
+            invalidate_device_metadata()
+        return success
 
     def get_device_info(self, device_id: str) -> Dict[str, str]:
-        """Obtiene la info enriquecida de un dispositivo."""
-        doc = self.db.get_device_doc(device_id)
-        if doc:
+        """Obtiene la info enriquecida de un dispositivo (desde la caché de metadatos)."""
+        meta = self.get_device_metadata().get(device_id)
+        if meta:
             return {
-                "alias": doc.get("alias", device_id),
-                "location": doc.get("location", "Desconocido")
+                "alias": meta.get("alias", device_id),
+                "location": meta.get("location", "Desconocido")
             }
         return {"alias": device_id, "location": "Desconocido"}
         
@@ -226,4 +268,7 @@ class ConfigManager:
         # Se requiere "dot notation" para actualizar un campo anidado en Mongo sin borrar el resto
         # Ej: "umbrales.temperatura" = {...}
         key = f"umbrales.{sensor_name}"
-        return self.db.update_device_doc(device_id, {key: threshold_data})
\ No newline at end of file
+        success = self.db.update_device_doc(device_id, {key: threshold_data})
+        if success:
+            invalidate_device_metadata()
+        return success
\ No newline at end of file
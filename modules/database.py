@@ -4,11 +4,16 @@ import time
 import pandas as pd
 import streamlit as st
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, OperationFailure, ServerSelectionTimeoutError
 import certifi
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.downsampling import BUCKET_COLUMNS, bucket_frame, combine_buckets
+from modules.sensor_registry import resolve_sensor_name
+from modules.telemetry_normalizer import CHILE_TZ, normalize_documents, now_chile, timestamp_range_query
 
 # Cargar variables de entorno
 load_dotenv()
@@ -39,6 +44,8 @@ class DatabaseConnection:
 
     def __init__(self):
         self.sources = []
+        # Desglose de tiempos de la última llamada a get_latest_by_device (segundos)
+        self.last_timings: Dict[str, float] = {}
         
         # Cargar fuente de base de datos primaria
         self._add_source(
@@ -119,10 +126,7 @@ class DatabaseConnection:
         # 4. Normalizar Sensores (Flattening)
         normalized_sensors = {}
         for key, value in sensors.items():
-            norm_key = key.lower().strip()
-            
-            if norm_key in ["temp", "temperatura"]: norm_key = "temperature"
-            elif norm_key in ["oxigeno", "od", "do"]: norm_key = "oxygen"
+            norm_key = resolve_sensor_name(key)
             
             final_value = None
             if isinstance(value, dict):
@@ -186,33 +190,34 @@ class DatabaseConnection:
         }
 
     # --- MÉTODO PARA DASHBOARD (Multi-DB Telemetría + Registro + Historical Fallback) ---
-    def get_latest_by_device(self, retries: int = 2) -> pd.DataFrame:
+    def get_latest_by_device(self, retries: int = 2, debug: bool = False) -> pd.DataFrame:
         """
         Obtiene el estado más reciente de TODOS los dispositivos.
         Estrategia 'Registry-Historical': 
         1. Obtiene la lista maestra de dispositivos registrados (Metadata).
         2. Obtiene la telemetría reciente (Live).
         3. Para los faltantes, busca su ÚLTIMO dato histórico.
+        Los tiempos de cada etapa quedan en self.last_timings; con debug=True además se imprimen.
         """
         if not self.sources: return pd.DataFrame()
         
+        t0 = time.perf_counter()
+        timings = {}
+        
         # 1. Obtener Universo de Dispositivos Registrados (Master List)
         registered_devices = self.get_all_registered_devices()
         known_map = {d["_id"]: d for d in registered_devices}
+        timings["registry"] = time.perf_counter() - t0
         
         all_docs = []
         seen_devices = set()
         
-        # 2. Obtener Telemetría Reciente (Live Data)
+        # 2. Obtener Telemetría Reciente (Live Data): un documento por dispositivo y fuente
+        t_live = time.perf_counter()
         for source in self.sources:
             if not source["coll_telemetry"]: continue
             try:
-                db = source["client"][source["db"]]
-                collection = db[source["coll_telemetry"]]
-                
-                # Limitamos a 2000 para tener más chance de encontrar dispositivos "lentos"
-                cursor = collection.find({}).sort("timestamp", -1).limit(2000)
-                documents = list(cursor)
+                documents = self._fetch_latest_docs(source)
                 
                 for raw_doc in documents:
                     norm_doc = self._normalize_document(raw_doc)
@@ -233,48 +238,196 @@ class DatabaseConnection:
             except Exception as e:
                 print(f"Error fetching telemetry from {source['name']}: {str(e)}")
                 continue
+        timings["live"] = time.perf_counter() - t_live
 
-        # 3. Recuperar Dispositivos Faltantes (Historical Fetch)
-        for dev_id, meta in known_map.items():
-            if dev_id not in seen_devices:
-                # Buscar el último dato real en la historia
-                last_known_df = self.get_latest_for_single_device(dev_id)
-                reg_alias = meta.get("alias")
+        # 3. Recuperar Dispositivos Faltantes (Historical Fetch) en UNA consulta por fuente
+        t_hist = time.perf_counter()
+        missing_ids = [dev_id for dev_id in known_map if dev_id not in seen_devices]
+        historical = self.get_latest_for_devices(missing_ids) if missing_ids else {}
+        timings["historical"] = time.perf_counter() - t_hist
+        timings["historical_devices"] = len(missing_ids)
+        
+        for dev_id in missing_ids:
+            meta = known_map[dev_id]
+            reg_alias = meta.get("alias")
+            norm_doc = historical.get(dev_id)
+            
+            if norm_doc:
+                # Usar el último estado conocido
+                doc_struct = dict(norm_doc, _source_id="historical_fetch")
                 
-                if not last_known_df.empty:
-                    # Usar el último estado conocido
-                    rec = last_known_df.iloc[0].to_dict()
-                    
-                    # Asegurar ubicación de metadata si existe
-                    reg_loc = meta.get("location")
-                    if reg_loc: rec["location"] = reg_loc
-                    
-                    # Re-estructurar para all_docs
-                    doc_struct = {
-                        "device_id": rec["device_id"],
-                        "timestamp": rec["timestamp"],
-                        "location": rec["location"],
-                        "sensors": rec["sensor_data"], 
-                        "alerts": rec["alerts"], 
-                        "_source_id": "historical_fetch"
-                    }
-                    if reg_alias: doc_struct["external_alias"] = reg_alias
-                    all_docs.append(doc_struct)
-                else:
-                    # Solo falla a gris si NUNCA ha enviado datos
-                    doc_struct = {
-                        "device_id": dev_id,
-                        "timestamp": None,
-                        "location": meta.get("location", "Desconocido"),
-                        "sensors": {},
-                        "alerts": [],
-                        "_source_id": "registry_fallback"
-                    }
-                    if reg_alias: doc_struct["external_alias"] = reg_alias
-                    all_docs.append(doc_struct)
+                # Asegurar ubicación de metadata si existe
+                reg_loc = meta.get("location")
+                if reg_loc: doc_struct["location"] = reg_loc
+            else:
+                # Solo falla a gris si NUNCA ha enviado datos
+                doc_struct = {
+                    "device_id": dev_id,
+                    "timestamp": None,
+                    "location": meta.get("location", "Desconocido"),
+                    "sensors": {},
+                    "alerts": [],
+                    "_source_id": "registry_fallback"
+                }
+            if reg_alias: doc_struct["external_alias"] = reg_alias
+            all_docs.append(doc_struct)
+
+        timings["total"] = time.perf_counter() - t0
+        self.last_timings = timings
+        if debug:
+            print(
+                f"[database.py] get_latest_by_device: registro={timings['registry']:.3f}s | "
+                f"vivo={timings['live']:.3f}s | histórico={timings['historical']:.3f}s "
+                f"({len(missing_ids)} disp.) | total={timings['total']:.3f}s"
+            )
 
         return self._rows_to_dataframe_mixed(all_docs)
 
+    # --- MOTOR "ÚLTIMO POR DISPOSITIVO" ---
+    # Expresión que resuelve el ID de dispositivo en el servidor con la misma prioridad
+    # que _normalize_document: device_id > dispositivo_id > metadata.device_id
+    DEVICE_ID_EXPR = {"$ifNull": ["$device_id", {"$ifNull": ["$dispositivo_id", "$metadata.device_id"]}]}
+    # Campos donde cada esquema guarda el ID de dispositivo
+    DEVICE_ID_FIELDS = ("device_id", "dispositivo_id", "metadata.device_id")
+
+    @classmethod
+    def device_filter(cls, device_ids: List[str]) -> Dict[str, Any]:
+        """Filtro Mongo: documentos de cualquiera de los dispositivos, en cualquier esquema de ID."""
+        ids = list(device_ids)
+        return {"$or": [{field: {"$in": ids}} for field in cls.DEVICE_ID_FIELDS]}
+    
+    # Ventana del escaneo clásico (fallback para fuentes sin soporte de agregación)
+    LIVE_SCAN_LIMIT = 2000
+    # Ventana de la agregación "último por dispositivo": sólo se agrupan los documentos recientes.
+    # Los dispositivos registrados sin datos en la ventana salen de get_latest_for_devices.
+    LATEST_WINDOW = timedelta(hours=24)
+    # Códigos de OperationFailure que indican agregación NO soportada por el servidor
+    # (CommandNotSupported, InvalidPipelineOperator, etapa/operador desconocido)
+    AGGREGATION_UNSUPPORTED_CODES = {115, 168, 40324, 31325}
+
+    @classmethod
+    def _aggregation_unsupported(cls, error: Exception) -> bool:
+        """True si el error indica que la fuente no soporta la agregación (no un error transitorio)."""
+        if isinstance(error, NotImplementedError):  # mongomock y adaptadores sin agregación
+            return True
+        if not isinstance(error, OperationFailure):
+            return False
+        # mongomock responde a los operadores que no implementa sin código ("Unrecognized expression ...")
+        return error.code in cls.AGGREGATION_UNSUPPORTED_CODES or \
+            (error.code is None and str(error).startswith("Unrecognized"))
+
+    def _latest_per_device_pipeline(self) -> List[Dict[str, Any]]:
+        """Pipeline $sort/$group: exactamente un documento (el más reciente) por dispositivo."""
+        return [
+            {"$sort": {"timestamp": -1}},
+            {"$group": {"_id": self.DEVICE_ID_EXPR, "doc": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$doc"}},
+        ]
+
+    def _recent_latest_pipeline(self) -> List[Dict[str, Any]]:
+        """
+        Último documento por dispositivo dentro de LATEST_WINDOW: el $match por timestamp usa el
+        índice y acota el $sort/$group a la ventana en vez de recorrer toda la colección.
+        """
+        now = now_chile()
+        # Margen hacia el futuro por relojes de dispositivos adelantados
+        window = timestamp_range_query(now - self.LATEST_WINDOW, now + timedelta(days=1))
+        return [{"$match": window}] + self._latest_per_device_pipeline()
+
+    def _fetch_latest_docs(self, source: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Retorna los documentos CRUDOS más recientes de una fuente, uno por dispositivo con datos en
+        LATEST_WINDOW (el resto lo completa get_latest_by_device con get_latest_for_devices).
+        Estrategia 'aggregate' (por defecto): el servidor agrupa y devuelve un doc por ID.
+        Estrategia 'scan' (fallback): últimos LIVE_SCAN_LIMIT docs, de-duplicados en Python.
+        Sólo si el servidor no soporta la agregación la fuente queda marcada como 'scan';
+        ante un error transitorio (red, timeout) se escanea en esta llamada y se reintenta en la próxima.
+        """
+        collection = source["client"][source["db"]][source["coll_telemetry"]]
+        
+        if source.get("latest_strategy", "aggregate") == "aggregate":
+            try:
+                return list(collection.aggregate(self._recent_latest_pipeline(), allowDiskUse=True))
+            except Exception as e:
+                if self._aggregation_unsupported(e):
+                    print(f"Agregación no disponible en {source['name']}, usando escaneo: {str(e)[:100]}")
+                    source["latest_strategy"] = "scan"
+                else:
+                    print(f"Error en agregación de {source['name']}, escaneo sólo esta vez: {str(e)[:100]}")
+        
+        return self._scan_latest_docs(collection)
+
+    def _scan_latest_docs(self, collection) -> List[Dict[str, Any]]:
+        """Escaneo clásico: trae los últimos N documentos y se queda con el primero de cada ID."""
+        cursor = collection.find({}).sort("timestamp", -1).limit(self.LIVE_SCAN_LIMIT)
+        
+        latest = {}
+        for raw_doc in cursor:
+            dev_id = raw_doc.get("device_id") or raw_doc.get("dispositivo_id") or raw_doc.get("metadata", {}).get("device_id")
+            if dev_id and dev_id not in latest:
+                latest[dev_id] = raw_doc
+        return list(latest.values())
+
+    def get_latest_for_devices(self, device_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Último documento NORMALIZADO de cada dispositivo pedido: {device_id: norm_doc}.
+        Una sola consulta por fuente ($in + $group), con las fuentes en paralelo.
+        Ante IDs repetidos entre fuentes gana la primera fuente configurada.
+        """
+        if not self.sources or not device_ids: return {}
+        
+        telemetry_sources = [s for s in self.sources if s["coll_telemetry"]]
+        if not telemetry_sources: return {}
+        
+        def load_source(source):
+            try:
+                return self._fetch_latest_docs_for_ids(source, device_ids)
+            except Exception as e:
+                print(f"Error fetching historical telemetry from {source['name']}: {str(e)[:100]}")
+                return []
+        
+        with ThreadPoolExecutor(max_workers=len(telemetry_sources)) as executor:
+            per_source = list(executor.map(load_source, telemetry_sources))
+        
+        wanted = set(device_ids)
+        result = {}
+        for raw_docs in per_source:
+            for raw_doc in raw_docs:
+                norm_doc = self._normalize_document(raw_doc)
+                dev_id = norm_doc["device_id"]
+                if dev_id in wanted and dev_id not in result:
+                    result[dev_id] = norm_doc
+        return result
+
+    def get_latest_frame_for_devices(self, device_ids: List[str]) -> pd.DataFrame:
+        """Como get_latest_for_single_device, pero para varios IDs en una consulta por fuente."""
+        latest = self.get_latest_for_devices(device_ids)
+        if not latest: return pd.DataFrame()
+        return self._rows_to_dataframe(list(latest.values()))
+
+    def _fetch_latest_docs_for_ids(self, source: Dict[str, Any], device_ids: List[str]) -> List[Dict[str, Any]]:
+        """Último documento crudo de cada ID en una fuente (agregación, o find_one por ID como fallback)."""
+        collection = source["client"][source["db"]][source["coll_telemetry"]]
+        id_match = {"$or": [{"device_id": {"$in": device_ids}}, {"dispositivo_id": {"$in": device_ids}}]}
+        
+        if source.get("latest_strategy", "aggregate") == "aggregate":
+            try:
+                pipeline = [{"$match": id_match}] + self._latest_per_device_pipeline()
+                return list(collection.aggregate(pipeline, allowDiskUse=True))
+            except Exception as e:
+                if self._aggregation_unsupported(e):
+                    print(f"Agregación no disponible en {source['name']}, usando find_one: {str(e)[:100]}")
+                    source["latest_strategy"] = "scan"
+                else:
+                    print(f"Error en agregación de {source['name']}, find_one sólo esta vez: {str(e)[:100]}")
+        
+        docs = []
+        for device_id in device_ids:
+            query = {"$or": [{"device_id": device_id}, {"dispositivo_id": device_id}]}
+            doc = collection.find_one(query, sort=[("timestamp", -1)])
+            if doc: docs.append(doc)
+        return docs
+
     def get_latest_for_single_device(self, device_id: str) -> pd.DataFrame:
         """Busca el dispositivo en todas las fuentes hasta encontrarlo."""
         if not self.sources: return pd.DataFrame()
@@ -296,6 +449,249 @@ class DatabaseConnection:
                 continue
         return pd.DataFrame()
 
+    # --- MOTOR DE CARGA MASIVA (PROYECCIÓN PLANA EN EL SERVIDOR) ---
+    # Proyección clásica: subdocumentos completos (fallback)
+    TELEMETRY_PROJECTION = {
+        '_id': 1, 'timestamp': 1, 'device_id': 1, 'dispositivo_id': 1,
+        'sensors': 1, 'datos': 1, 'location': 1, 'metadata': 1
+    }
+
+    # Sensores de origen: 'sensors' si trae datos, si no 'datos' (mismo criterio que _normalize_document)
+    SENSOR_SOURCE_EXPR = {
+        "$cond": [
+            {"$gt": [{"$size": {"$objectToArray": {"$ifNull": ["$sensors", {}]}}}, 0]},
+            "$sensors",
+            {"$ifNull": ["$datos", {}]}
+        ]
+    }
+
+    # Cada sensor queda como escalar: número directo, o sensors.X.value convertido a double.
+    # Lo que _normalize_document descartaría (strings sueltos, bools, valores nulos) se filtra acá.
+    FLAT_SENSORS_EXPR = {
+        "$arrayToObject": {
+            "$filter": {
+                "input": {
+                    "$map": {
+                        "input": {"$objectToArray": SENSOR_SOURCE_EXPR},
+                        "as": "s",
+                        "in": {
+                            "k": "$$s.k",
+                            "v": {"$cond": [
+                                {"$isNumber": "$$s.v"},
+                                "$$s.v",
+                                {"$convert": {"input": "$$s.v.value", "to": "double", "onError": None, "onNull": None}}
+                            ]}
+                        }
+                    }
+                },
+                "as": "s",
+                "cond": {"$ne": ["$$s.v", None]}
+            }
+        }
+    }
+
+    def _flat_telemetry_pipeline(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Pipeline $match/$project: sólo los campos que usa normalize_documents, con sensores planos."""
+        return [
+            {"$match": query},
+            {"$project": {
+                "_id": 1, "timestamp": 1, "device_id": 1, "dispositivo_id": 1, "location": 1,
+                "metadata.device_id": 1,
+                "sensors": self.FLAT_SENSORS_EXPR,
+            }},
+        ]
+
+    def fetch_telemetry_docs(self, source: Dict[str, Any], query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Documentos CRUDOS de telemetría para cargas masivas (Gráficas / Datos).
+        Estrategia 'flat' (por defecto): el servidor aplana sensors.*.value y datos.* a escalares,
+        así viajan y se decodifican menos bytes. Si la fuente no soporta los operadores
+        ($isNumber / $convert, MongoDB < 4.4) se recuerda y se usa find() con la proyección clásica;
+        cualquier otro error se propaga sin cambiar la estrategia.
+        """
+        collection = source["client"][source["db"]][source["coll_telemetry"]]
+
+        if source.get("projection_strategy", "flat") == "flat":
+            try:
+                return list(collection.aggregate(self._flat_telemetry_pipeline(query), allowDiskUse=True))
+            except Exception as e:
+                # Un error transitorio (red, timeout) no degrada la fuente: lo maneja quien llama
+                if not self._aggregation_unsupported(e):
+                    raise
+                print(f"[database.py] Proyección plana no disponible en {source['name']} ({e}); usando find()")
+                source["projection_strategy"] = "find"
+
+        return list(collection.find(query, self.TELEMETRY_PROJECTION))
+
+    def iter_telemetry_docs(
+        self, source: Dict[str, Any], query: Dict[str, Any], batch_size: int = 5000
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Versión en STREAMING de fetch_telemetry_docs (exportaciones): recorre el cursor y entrega
+        lotes de hasta `batch_size` documentos crudos, sin juntar el resultado completo en memoria.
+        Mismas estrategias 'flat' / find() que fetch_telemetry_docs.
+        """
+        collection = source["client"][source["db"]][source["coll_telemetry"]]
+
+        cursor = None
+        if source.get("projection_strategy", "flat") == "flat":
+            try:
+                cursor = collection.aggregate(
+                    self._flat_telemetry_pipeline(query), allowDiskUse=True, batchSize=batch_size
+                )
+            except Exception as e:
+                if not self._aggregation_unsupported(e):
+                    raise
+                print(f"[database.py] Proyección plana no disponible en {source['name']} ({e}); usando find()")
+                source["projection_strategy"] = "find"
+        if cursor is None:
+            cursor = collection.find(query, self.TELEMETRY_PROJECTION).batch_size(batch_size)
+
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # --- MOTOR DE SERIES AGREGADAS (DOWNSAMPLING PARA GRÁFICAS) ---
+    # Offset fijo de Chile usado en toda la normalización (UTC-3)
+    CHILE_OFFSET = timedelta(hours=-3)
+
+    def _device_range_clause(self, device_id: str, ts_range: Dict[str, Any]) -> Dict[str, Any]:
+        """Documentos de un dispositivo (cualquier esquema de ID) dentro de un rango de timestamp."""
+        return {"$and": [
+            {"$or": [{"device_id": device_id}, {"dispositivo_id": device_id}, {"metadata.device_id": device_id}]},
+            {"timestamp": ts_range},
+        ]}
+
+    def _bucketed_pipeline(
+        self, match: Dict[str, Any], bucket_minutes: int,
+        sensor_aliases: Dict[str, str], value_bounds: Dict[str, Tuple[float, float]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Pipeline $dateTrunc/$group: min/mean/max por (dispositivo, bucket, sensor).
+        El nombre del sensor se normaliza en el servidor (lower/trim + alias) y los valores
+        fuera de los límites físicos se descartan antes de agregar.
+        """
+        key_expr = {"$let": {
+            "vars": {"k": {"$toLower": {"$trim": {"input": "$$s.k"}}}},
+            "in": {"$switch": {
+                "branches": [{"case": {"$eq": ["$$k", alias]}, "then": name} for alias, name in sensor_aliases.items()],
+                "default": "$$k"
+            }} if sensor_aliases else "$$k"
+        }}
+        in_bounds = [
+            {"$or": [{"$ne": ["$$s.k", name]}, {"$and": [{"$gte": ["$$s.v", lo]}, {"$lte": ["$$s.v", hi]}]}]}
+            for name, (lo, hi) in value_bounds.items()
+        ]
+        return [
+            {"$match": match},
+            {"$project": {
+                "_id": 0,
+                "device_id": self.DEVICE_ID_EXPR,
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": "minute", "binSize": bucket_minutes, "timezone": "-03:00"}},
+                "sensors": {"$filter": {
+                    "input": {"$map": {
+                        "input": {"$objectToArray": self.FLAT_SENSORS_EXPR},
+                        "as": "s",
+                        "in": {"k": key_expr, "v": "$$s.v"}
+                    }},
+                    "as": "s",
+                    "cond": {"$and": in_bounds} if in_bounds else True
+                }},
+            }},
+            {"$unwind": "$sensors"},
+            {"$group": {
+                "_id": {"device_id": "$device_id", "timestamp": "$bucket", "sensor": "$sensors.k"},
+                "min": {"$min": "$sensors.v"},
+                "mean": {"$avg": "$sensors.v"},
+                "max": {"$max": "$sensors.v"},
+                "count": {"$sum": 1},
+            }},
+        ]
+
+    def fetch_bucketed_telemetry(
+        self,
+        device_ranges: Dict[str, Tuple[datetime, datetime]],
+        bucket_minutes: int,
+        sensor_aliases: Optional[Dict[str, str]] = None,
+        value_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+    ) -> pd.DataFrame:
+        """
+        Series agregadas por bucket de tiempo para gráficas de rangos largos.
+        device_ranges: {device_id: (inicio, fin)} en hora local de Chile sin zona.
+        Retorna formato largo: device_id, timestamp (inicio del bucket), sensor, min, mean, max, count.
+
+        - Timestamps Date: $dateTrunc + $group en el servidor (estrategia 'server').
+        - Timestamps ISO string (o servidores sin $dateTrunc, MongoDB < 5.0): se traen los
+          documentos con la proyección plana y se agrupan en Python con el mismo alineamiento.
+        """
+        sensor_aliases = sensor_aliases or {}
+        value_bounds = value_bounds or {}
+        if not self.sources or not device_ranges:
+            return pd.DataFrame(columns=BUCKET_COLUMNS)
+
+        # Rangos en UTC para los Date; los strings ISO se consultan con 1 día de margen
+        # (pueden traer offset) y se recortan exacto después de normalizar.
+        date_match = {"$or": [
+            self._device_range_clause(dev, {"$gte": start - self.CHILE_OFFSET, "$lte": end - self.CHILE_OFFSET})
+            for dev, (start, end) in device_ranges.items()
+        ]}
+        iso_match = {"$or": [
+            self._device_range_clause(dev, {"$gte": (start - timedelta(days=1)).isoformat(),
+                                            "$lte": (end + timedelta(days=1)).isoformat()})
+            for dev, (start, end) in device_ranges.items()
+        ]}
+
+        def load_source(source):
+            frames = []
+            try:
+                collection = source["client"][source["db"]][source["coll_telemetry"]]
+                python_match = iso_match
+                if source.get("bucket_strategy", "server") == "server":
+                    try:
+                        pipeline = self._bucketed_pipeline(date_match, bucket_minutes, sensor_aliases, value_bounds)
+                        rows = list(collection.aggregate(pipeline, allowDiskUse=True))
+                        if rows:
+                            server_df = pd.DataFrame([dict(r["_id"], **{k: r[k] for k in ("min", "mean", "max", "count")}) for r in rows])
+                            server_df['timestamp'] = pd.to_datetime(server_df['timestamp'], utc=True).dt.tz_convert(CHILE_TZ).dt.tz_localize(None)
+                            frames.append(server_df)
+                    except Exception as e:
+                        # Sólo si el servidor no soporta el pipeline: agrupar en Python trae cada documento crudo.
+                        # Un error transitorio deja la fuente sin series en esta llamada y se reintenta en la próxima.
+                        if not self._aggregation_unsupported(e):
+                            raise
+                        print(f"[database.py] Agregación por buckets no disponible en {source['name']} ({e}); agrupando en Python")
+                        source["bucket_strategy"] = "python"
+                if source.get("bucket_strategy") == "python":
+                    python_match = {"$or": [date_match, iso_match]}
+
+                raw_docs = self.fetch_telemetry_docs(source, python_match)
+                df = normalize_documents(raw_docs)
+                if not df.empty:
+                    df = df[df['timestamp'].notna()]
+                    bounds = pd.DataFrame(
+                        [(dev, start, end) for dev, (start, end) in device_ranges.items()],
+                        columns=['device_id', '_start', '_end']
+                    )
+                    df = df.merge(bounds, on='device_id', how='inner')
+                    df = df[(df['timestamp'] >= df['_start']) & (df['timestamp'] <= df['_end'])].drop(columns=['_start', '_end'])
+                    frames.append(bucket_frame(df, bucket_minutes, sensor_aliases=sensor_aliases, value_bounds=value_bounds))
+            except Exception as e:
+                print(f"[database.py] ERROR agregando series de {source['name']}: {e}")
+            return frames
+
+        sources = [s for s in self.sources if s.get("coll_telemetry")]
+        with ThreadPoolExecutor(max_workers=max(len(sources), 1)) as executor:
+            frames = [f for source_frames in executor.map(load_source, sources) for f in source_frames if not f.empty]
+
+        if not frames:
+            return pd.DataFrame(columns=BUCKET_COLUMNS)
+        return combine_buckets(pd.concat(frames, ignore_index=True))
+
     # --- METODOS PARA HISTORIAL (Multi-DB) ---
     def fetch_data(self, start_date=None, end_date=None, device_ids=None, limit=5000) -> pd.DataFrame:
         if not self.sources: return pd.DataFrame()
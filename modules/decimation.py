@@ -0,0 +1,87 @@
+"""
+Decimación de series para trazos de Plotly.
+
+Reduce una serie (x, y) a un presupuesto de puntos sin perder su forma visual:
+- 'minmax': envolvente mínimo/máximo por bucket. Garantiza que cada pico (ej. un spike de
+  amoníaco) aparece en el gráfico; ideal para la línea de datos crudos.
+- 'lttb': Largest-Triangle-Three-Buckets. Elige en cada bucket el punto que forma el triángulo
+  de mayor área con sus vecinos; conserva la forma de curvas suaves (ej. la SMA).
+
+Ambos retornan ÍNDICES ordenados sobre la serie original, así se pueden aplicar a cualquier
+columna asociada (timestamps, valores, customdata...).
+"""
+from typing import Tuple
+
+import numpy as np
+
+# Presupuesto de puntos por traza por defecto
+DEFAULT_POINT_BUDGET = 2000
+
+
+def _as_float(x: np.ndarray) -> np.ndarray:
+    """Eje X numérico (datetime64 -> enteros) para el cálculo de áreas."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Índices del mínimo y máximo de cada bucket (n_out / 2 buckets), más los extremos de la serie."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+
+    n_buckets = max(n_out // 2, 1)
+    size = int(np.ceil(n / n_buckets))
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(n_buckets, size)
+    valid = ~np.isnan(rows).all(axis=1)
+    offsets = np.arange(n_buckets)[valid] * size
+
+    rows = rows[valid]
+    i_min = np.nanargmin(rows, axis=1) + offsets
+    i_max = np.nanargmax(rows, axis=1) + offsets
+    return np.unique(np.concatenate(([0, n - 1], i_min, i_max)))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Índices elegidos por Largest-Triangle-Three-Buckets (incluye el primer y último punto)."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    xf = _as_float(x)
+    # Bordes de los n_out - 2 buckets interiores (el primer y último punto van fijos)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Promedio del bucket siguiente (o el último punto para el bucket final)
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        if nlo >= nhi:
+            nlo, nhi = n - 1, n
+        avg_x, avg_y = xf[nlo:nhi].mean(), y[nlo:nhi].mean()
+
+        area = np.abs((xf[a] - avg_x) * (y[lo:hi] - y[a]) - (xf[a] - xf[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def decimate(x: np.ndarray, y: np.ndarray, n_out: int = DEFAULT_POINT_BUDGET, method: str = "minmax") -> Tuple[np.ndarray, np.ndarray]:
+    """Serie (x, y) reducida a ~n_out puntos con el método indicado ('minmax' o 'lttb')."""
+    x, y = np.asarray(x), np.asarray(y)
+    if method == "lttb":
+        idx = lttb_indices(x, y, n_out)
+    elif method == "minmax":
+        idx = minmax_indices(y, n_out)
+    else:
+        raise ValueError(f"Método de decimación desconocido: {method}")
+    return x[idx], y[idx]
@@ -1,8 +1,11 @@
+import json
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone, timedelta
 
 # --- ENUMS ---
@@ -27,6 +30,115 @@ class DeviceInfo:
     sensor_data: Dict[str, float] = field(default_factory=dict)
     alerts: List[str] = field(default_factory=list)
 
+# --- MATRIZ DE UMBRALES (compilada una vez por versión de configuración) ---
+# Nivel de salud por lectura: 0 = OK, 1 = WARNING, 2 = CRITICAL
+HEALTH_LEVELS = (HealthStatus.OK, HealthStatus.WARNING, HealthStatus.CRITICAL)
+
+
+class ThresholdMatrix:
+    """
+    Umbrales interpretados como arrays (fila = dispositivo, columna = sensor):
+    c_min / c_max (crítico) y o_min / o_max (óptimo). La fila 0 es la configuración global;
+    cada dispositivo con umbrales propios tiene su fila, con la global donde no define el sensor.
+    Misma interpretación que la evaluación por sensor anterior (ver _compile_config).
+    """
+
+    def __init__(self, global_thresholds: Dict[str, Any], device_specific_thresholds: Dict[str, Dict[str, Any]]):
+        # Claves de sensor en minúsculas (si dos colisionan, gana la última, como antes)
+        global_lower = {k.lower(): v for k, v in global_thresholds.items()}
+        device_lower = {
+            dev_id: {k.lower(): v for k, v in (raw if isinstance(raw, dict) else {}).items()}
+            for dev_id, raw in device_specific_thresholds.items()
+        }
+        device_lower = {dev_id: t for dev_id, t in device_lower.items() if t}
+
+        sensors = list(dict.fromkeys([*global_lower, *(k for t in device_lower.values() for k in t)]))
+        self.sensor_index = {sensor: i for i, sensor in enumerate(sensors)}
+        # Columna por nombre de sensor tal como llega en las lecturas (-1 = sin umbral)
+        self._key_cols: Dict[str, int] = {}
+        self.device_rows = {dev_id: i + 1 for i, dev_id in enumerate(device_lower)}
+
+        shape = (len(device_lower) + 1, len(sensors))
+        self.c_min = np.full(shape, np.nan)
+        self.c_max = np.full(shape, np.nan)
+        self.o_min = np.full(shape, np.nan)
+        self.o_max = np.full(shape, np.nan)
+        self.has = np.zeros(shape, dtype=bool)      # hay configuración para la celda
+        self.invalid = np.zeros(shape, dtype=bool)  # configuración no interpretable (float() falla)
+
+        for row, thresholds in [(0, {})] + [(self.device_rows[d], t) for d, t in device_lower.items()]:
+            for sensor, col in self.sensor_index.items():
+                # Específica > Global; una específica vacía anula la global (como antes)
+                self._compile_config(row, col, thresholds.get(sensor, global_lower.get(sensor)))
+
+    def _compile_config(self, row: int, col: int, config: Any):
+        if not config:
+            return
+        self.has[row, col] = True
+        try:
+            # Mapping robusto: Prioriza valores personalizados sobre defaults
+            # Personalizados: min_value, max_value, critical_min, critical_max
+            # Defaults JSON: min, max, optimal_min, optimal_max
+            self.c_min[row, col] = float(config.get("critical_min", config.get("min", -9999)))
+            self.c_max[row, col] = float(config.get("critical_max", config.get("max", 9999)))
+            self.o_min[row, col] = float(config.get("min_value", config.get("optimal_min", -9999)))
+            self.o_max[row, col] = float(config.get("max_value", config.get("optimal_max", 9999)))
+        except (AttributeError, TypeError, ValueError):
+            self.invalid[row, col] = True
+
+    def columns_for(self, keys: List[str]) -> np.ndarray:
+        """Columna de cada nombre de sensor (sin distinguir mayúsculas), -1 si no tiene umbral."""
+        key_cols = self._key_cols
+        for key in set(keys).difference(key_cols):
+            key_cols[key] = self.sensor_index.get(key.lower(), -1)
+        return np.array([key_cols[key] for key in keys], dtype=np.intp)
+
+    def classify(self, rows: np.ndarray, cols: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Nivel (0/1/2) de cada lectura (fila de la matriz, columna de sensor, valor).
+        Con valores float32 (historial compacto) los umbrales se comparan también en float32,
+        así una lectura igual al umbral sigue en el mismo lado que antes del redondeo.
+        """
+        has = self.has[rows, cols]
+        bad = has & self.invalid[rows, cols]
+        if bad.any():
+            i = int(np.argmax(bad))
+            sensor = list(self.sensor_index)[cols[i]]
+            raise ValueError(f"Umbral inválido para el sensor '{sensor}'")
+        dtype = np.float32 if values.dtype == np.float32 else np.float64
+        c_min, c_max = self.c_min[rows, cols].astype(dtype, copy=False), self.c_max[rows, cols].astype(dtype, copy=False)
+        o_min, o_max = self.o_min[rows, cols].astype(dtype, copy=False), self.o_max[rows, cols].astype(dtype, copy=False)
+        critical = has & ((values < c_min) | (values > c_max))
+        warning = has & ((values < o_min) | (values > o_max))
+        return np.where(critical, 2, np.where(warning, 1, 0)).astype(np.int8)
+
+
+_MATRICES: "OrderedDict[str, ThresholdMatrix]" = OrderedDict()
+_MATRICES_LOCK = threading.Lock()
+_MAX_MATRICES = 8
+
+
+def get_threshold_matrix(global_thresholds: Dict[str, Any],
+                         device_specific_thresholds: Dict[str, Dict[str, Any]]) -> ThresholdMatrix:
+    """Matriz compartida por proceso, recompilada sólo cuando cambia el contenido de la configuración."""
+    try:
+        version = json.dumps([global_thresholds, device_specific_thresholds], sort_keys=True, default=str)
+    except TypeError:
+        return ThresholdMatrix(global_thresholds, device_specific_thresholds)  # claves no ordenables
+
+    with _MATRICES_LOCK:
+        matrix = _MATRICES.get(version)
+        if matrix is not None:
+            _MATRICES.move_to_end(version)
+            return matrix
+    matrix = ThresholdMatrix(global_thresholds, device_specific_thresholds)
+    with _MATRICES_LOCK:
+        _MATRICES[version] = matrix
+        while len(_MATRICES) > _MAX_MATRICES:
+            _MATRICES.popitem(last=False)
+    return matrix
+
+
 # --- CLASE PRINCIPAL ---
 class DeviceManager:
     
@@ -48,7 +160,14 @@ class DeviceManager:
         if df is None or df.empty:
             return []
         records = df.to_dict('records')
-        return [self._process_single_record(row) for row in records]
+        devices = [self._process_single_record(row) for row in records]
+        
+        # Salud de todos los dispositivos en línea de una vez (offline queda UNKNOWN)
+        online = [d for d in devices if d.connection == ConnectionStatus.ONLINE]
+        for device, health in zip(online, self._evaluate_health_batch(online)):
+            device.health = health
+            self._previous_health[device.device_id] = health
+        return devices
     
     def _process_single_record(self, row: Dict) -> DeviceInfo:
         device_id = str(row.get("device_id", "Unknown"))
@@ -70,21 +189,16 @@ class DeviceManager:
         if isinstance(raw_alerts, list): alerts = [str(a) for a in raw_alerts]
         elif isinstance(raw_alerts, str): alerts = [raw_alerts]
         
-        # Evaluacion
+        # Evaluacion (la salud de los dispositivos en línea se calcula por lote)
         connection = self._evaluate_connection(timestamp)
         
-        if connection == ConnectionStatus.ONLINE:
-            health = self._evaluate_health(device_id, sensor_values, alerts)
-        else:
-            health = HealthStatus.UNKNOWN # O mantener previous si queremos "memoria"
-            # Para dashboard en tiempo real, si esta offline, el health es irrelevante o unknown
-        
         return DeviceInfo(
             device_id=device_id,
             location=location,
             last_update=timestamp,
             connection=connection,
-            health=health,
+            # Si esta offline, el health es irrelevante o unknown
+            health=HealthStatus.UNKNOWN,
             sensor_data=sensor_values,
             alerts=alerts
         )
@@ -98,7 +212,7 @@ class DeviceManager:
             if isinstance(v, dict) and 'value' in v: val = v['value']
             else: val = v
             
-            if isinstance(val, (int, float)) and not pd.isna(val):
+            if isinstance(val, (int, float)) and val == val:  # val == val descarta NaN
                 values[k] = float(val)
         return values
 
@@ -118,59 +232,35 @@ class DeviceManager:
             return ConnectionStatus.OFFLINE
         return ConnectionStatus.ONLINE
 
-    def _evaluate_health(self, device_id: str, sensors: Dict[str, float], alerts: List[str]) -> HealthStatus:
-        # 1. Alertas explicitas del dispositivo
-        if alerts:
-            self._previous_health[device_id] = HealthStatus.CRITICAL
-            return HealthStatus.CRITICAL
-            
-        new_health = HealthStatus.OK
-        
-        # Obtener Thresholds Específicos de este dispositivo (normalizar keys a lowercase)
-        raw_dev_thresholds = self.device_specific_thresholds.get(device_id, {})
-        dev_thresholds = {k.lower(): v for k, v in raw_dev_thresholds.items()}
+    def _evaluate_health_batch(self, devices: List[DeviceInfo]) -> List[HealthStatus]:
+        """
+        Salud de varios dispositivos con comparaciones NumPy sobre la matriz de umbrales.
+        Crítico si alguna lectura sale de [c_min, c_max] o el dispositivo trae alertas;
+        Warning si alguna sale de [o_min, o_max]; si no, OK.
+        """
+        matrix = get_threshold_matrix(self.global_thresholds, self.device_specific_thresholds)
+        levels = np.zeros(len(devices), dtype=np.int8)
         
-        # Normalizar global thresholds también
-        global_lower = {k.lower(): v for k, v in self.global_thresholds.items()}
+        # Formato largo: una entrada por (dispositivo, sensor); alertas explícitas = crítico directo
+        keys, values, counts, rows = [], [], [], []
+        for i, device in enumerate(devices):
+            readings = {} if device.alerts else device.sensor_data
+            if device.alerts:
+                levels[i] = 2
+            keys.extend(readings)
+            values.extend(readings.values())
+            counts.append(len(readings))
+            rows.append(matrix.device_rows.get(device.device_id, 0))
         
-        for sensor, value in sensors.items():
-            sensor_key = sensor.lower() # Normalizar nombre del sensor a lowercase
-            
-            # Buscar config: Específica > Global (ambas normalizadas)
-            config = dev_thresholds.get(sensor_key, global_lower.get(sensor_key))
-            
-            if not config: continue
-            
-            # Interpretar Configuración de Umbrales
-            
-            # Mapping robusto: Prioriza valores personalizados sobre defaults
-            # Personalizados: min_value, max_value, critical_min, critical_max
-            # Defaults JSON: min, max, optimal_min, optimal_max
-            
-            c_min = float(config.get("critical_min", config.get("min", -9999)))
-            c_max = float(config.get("critical_max", config.get("max", 9999)))
-            o_min = float(config.get("min_value", config.get("optimal_min", -9999))) 
-            o_max = float(config.get("max_value", config.get("optimal_max", 9999)))
-            
-            # Evaluación
-            state = HealthStatus.OK
-            
-            # Critico
-            if value < c_min or value > c_max:
-                state = HealthStatus.CRITICAL
-            # Warning (Zona entre Crítico y Óptimo)
-            elif value < o_min or value > o_max:
-                state = HealthStatus.WARNING
-            
+        if keys:
+            owners = np.repeat(np.arange(len(devices)), counts)
+            matrix_rows = np.repeat(np.array(rows, dtype=np.intp), counts)
+            cols = matrix.columns_for(keys)
+            known = cols >= 0  # sensores sin umbral no cuentan
+            reading_levels = matrix.classify(matrix_rows[known], cols[known], np.array(values, dtype=float)[known])
             # Prioridad de Estados: Critical > Warning > OK
-            if state == HealthStatus.CRITICAL:
-                new_health = HealthStatus.CRITICAL
-                break # Ya es crítico, no puede empeorar
-            elif state == HealthStatus.WARNING and new_health != HealthStatus.CRITICAL:
-                new_health = HealthStatus.WARNING
-        
-        self._previous_health[device_id] = new_health
-        return new_health
+            np.maximum.at(levels, owners[known], reading_levels)
+        return [HEALTH_LEVELS[level] for level in levels]
 
     def calculate_summary_metrics(self, devices: List[DeviceInfo]) -> Dict[str, int]:
         return {
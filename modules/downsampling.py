@@ -0,0 +1,95 @@
+"""
+Downsampling de series de telemetría para gráficas.
+
+Para rangos largos no tiene sentido mandar cada punto crudo a Plotly: el gráfico tiene
+unos ~1500 px de ancho. Acá se agrupan los datos en buckets de tiempo por dispositivo y
+sensor (min / mean / max / count), con el mismo alineamiento que $dateTrunc en MongoDB,
+para que los buckets calculados en el servidor y en Python sean intercambiables.
+"""
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+# Puntos objetivo por traza (~ancho en píxeles de un gráfico a pantalla completa)
+DEFAULT_TARGET_POINTS = 1500
+
+# Tamaños de bucket permitidos (minutos). Todos dividen 180, así el alineamiento
+# en hora de Chile (UTC-3) coincide con el de UTC.
+BUCKET_STEPS_MINUTES = (1, 2, 3, 5, 10, 15, 20, 30, 60, 90, 180)
+
+# Referencia de alineamiento de $dateTrunc
+BUCKET_ORIGIN = pd.Timestamp(datetime(2000, 1, 1))
+
+BUCKET_COLUMNS = ['device_id', 'timestamp', 'sensor', 'min', 'mean', 'max', 'count']
+
+
+def bucket_minutes_for(span: timedelta, target_points: int = DEFAULT_TARGET_POINTS) -> int:
+    """Tamaño de bucket (minutos) para que `span` quede en a lo más ~target_points puntos."""
+    needed = math.ceil(span.total_seconds() / 60 / max(target_points, 1))
+    for step in BUCKET_STEPS_MINUTES:
+        if step >= needed:
+            return step
+    return BUCKET_STEPS_MINUTES[-1]
+
+
+def floor_to_bucket(timestamps: pd.Series, bucket_minutes: int) -> pd.Series:
+    """Inicio del bucket de cada timestamp (hora local sin zona)."""
+    step = pd.Timedelta(minutes=bucket_minutes)
+    return BUCKET_ORIGIN + ((timestamps - BUCKET_ORIGIN) // step) * step
+
+
+def bucket_frame(
+    df: pd.DataFrame,
+    bucket_minutes: int,
+    sensors: Optional[Iterable[str]] = None,
+    sensor_aliases: Optional[Dict[str, str]] = None,
+    value_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+) -> pd.DataFrame:
+    """
+    DataFrame plano (timestamp, device_id, <sensores>...) -> formato largo por bucket:
+    device_id, timestamp (inicio del bucket), sensor, min, mean, max, count.
+    sensor_aliases renombra sensores antes de agrupar; value_bounds descarta valores fuera de rango.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=BUCKET_COLUMNS)
+
+    excluded = {'timestamp', 'device_id', 'location'}
+    if sensors is None:
+        sensors = [c for c in df.select_dtypes(include=['number']).columns if c not in excluded]
+    sensors = [s for s in sensors if s in df.columns]
+    if not sensors:
+        return pd.DataFrame(columns=BUCKET_COLUMNS)
+
+    long_df = df[['device_id', 'timestamp'] + sensors].melt(
+        id_vars=['device_id', 'timestamp'], var_name='sensor', value_name='value'
+    ).dropna(subset=['value'])
+    if sensor_aliases:
+        long_df['sensor'] = long_df['sensor'].map(lambda s: sensor_aliases.get(s, s))
+    for name, (lo, hi) in (value_bounds or {}).items():
+        is_sensor = long_df['sensor'] == name
+        long_df = long_df[~is_sensor | long_df['value'].between(lo, hi)]
+    long_df['timestamp'] = floor_to_bucket(long_df['timestamp'], bucket_minutes)
+
+    out = long_df.groupby(['device_id', 'timestamp', 'sensor'], sort=False)['value'].agg(
+        ['min', 'mean', 'max', 'count']
+    ).reset_index()
+    return out.sort_values(['device_id', 'sensor', 'timestamp'], kind='mergesort').reset_index(drop=True)
+
+
+def combine_buckets(buckets: pd.DataFrame) -> pd.DataFrame:
+    """
+    Une buckets repetidos (misma clave device/timestamp/sensor desde varias fuentes o alias):
+    min de los mínimos, max de los máximos y promedio ponderado por count.
+    """
+    if buckets.empty:
+        return pd.DataFrame(columns=BUCKET_COLUMNS)
+
+    df = buckets.assign(_sum=buckets['mean'] * buckets['count'])
+    out = df.groupby(['device_id', 'timestamp', 'sensor'], sort=False).agg(
+        min=('min', 'min'), _sum=('_sum', 'sum'), max=('max', 'max'), count=('count', 'sum')
+    ).reset_index()
+    out['mean'] = out['_sum'] / out['count']
+    out = out[BUCKET_COLUMNS]
+    return out.sort_values(['device_id', 'sensor', 'timestamp'], kind='mergesort').reset_index(drop=True)
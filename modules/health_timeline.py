@@ -0,0 +1,150 @@
+"""
+Línea de tiempo de salud sobre el historial (Gráficas).
+
+Clasifica CADA lectura del DataFrame de historial (formato ancho: timestamp, device_id y una
+columna por sensor) contra los mismos umbrales globales y por dispositivo del dashboard
+(ThresholdMatrix de modules/device_manager.py), sin recorrer filas en Python:
+
+- violation_intervals(): intervalos fuera de rango por dispositivo/sensor, codificados por
+  rachas (RLE) de lecturas consecutivas con el mismo nivel (alerta o crítico). Cada intervalo
+  trae inicio, fin, duración, valor pico (el más alejado del rango óptimo) y cantidad de lecturas.
+- time_out_of_range(): resumen por dispositivo/sensor del tiempo en alerta y en crítico.
+
+Una racha se corta si entre dos lecturas hay más de max_gap (dispositivo sin datos). El fin del
+intervalo es la lectura que volvió al rango, si llegó dentro de max_gap; si no, la última
+lectura fuera de rango.
+"""
+from datetime import timedelta
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from modules.device_manager import ThresholdMatrix
+
+# Nombre de cada nivel de la matriz de umbrales (0 = OK no genera intervalos)
+LEVEL_NAMES = {1: "warning", 2: "critical"}
+INTERVAL_COLUMNS = ["device_id", "sensor", "level", "start", "end", "duration", "peak", "samples"]
+# Hueco máximo entre lecturas de una misma racha
+MAX_GAP = timedelta(minutes=10)
+
+
+def _empty_intervals() -> pd.DataFrame:
+    return pd.DataFrame({
+        "device_id": pd.Series(dtype=object),
+        "sensor": pd.Series(dtype=object),
+        "level": pd.Series(dtype=object),
+        "start": pd.Series(dtype="datetime64[ns]"),
+        "end": pd.Series(dtype="datetime64[ns]"),
+        "duration": pd.Series(dtype="timedelta64[ns]"),
+        "peak": pd.Series(dtype=float),
+        "samples": pd.Series(dtype=int),
+    })
+
+
+def violation_intervals(df: pd.DataFrame, matrix: ThresholdMatrix, sensors: Optional[List[str]] = None,
+                        max_gap: timedelta = MAX_GAP) -> pd.DataFrame:
+    """
+    Intervalos fuera de rango de `sensors` (default: todas las columnas con umbral) en df.
+    Retorna un DataFrame con INTERVAL_COLUMNS, ordenado por sensor, dispositivo e inicio.
+    """
+    if df is None or df.empty:
+        return _empty_intervals()
+    if sensors is None:
+        sensors = [c for c in df.columns if c not in ("timestamp", "device_id")]
+    sensors = [s for s in sensors if s in df.columns and matrix.columns_for([s])[0] >= 0]
+    if not sensors:
+        return _empty_intervals()
+
+    # Un solo orden por dispositivo y tiempo para todos los sensores
+    ts_all = pd.to_datetime(df["timestamp"]).to_numpy(dtype="datetime64[ns]")
+    dev_codes, dev_names = pd.factorize(df["device_id"], sort=True)
+    # IDs como strings planos aunque el historial compacto los traiga como categóricos
+    dev_names = np.asarray(dev_names, dtype=object)
+    order = np.lexsort((ts_all, dev_codes))
+    ts_all, dev_codes = ts_all[order], dev_codes[order]
+    matrix_rows = np.array([matrix.device_rows.get(d, 0) for d in dev_names], dtype=np.intp)[dev_codes]
+    gap = np.timedelta64(int(max_gap.total_seconds() * 1e9), "ns")
+
+    parts = []
+    for sensor in sensors:
+        values = pd.to_numeric(df[sensor], errors="coerce")
+        # float32 del historial compacto se mantiene (classify compara en la misma precisión)
+        values = values.to_numpy(dtype=np.float32 if values.dtype == np.float32 else np.float64)[order]
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+        v, ts, dev, rows = values[valid], ts_all[valid], dev_codes[valid], matrix_rows[valid]
+        col = matrix.columns_for([sensor])[0]
+        cols = np.full(len(v), col, dtype=np.intp)
+        level = matrix.classify(rows, cols, v)
+        viol = level > 0
+        if not viol.any():
+            continue
+
+        # Rachas: cambia el nivel, el dispositivo, o hay un hueco de más de max_gap
+        breaks = np.ones(len(v) + 1, dtype=bool)
+        breaks[1:-1] = (level[1:] != level[:-1]) | (dev[1:] != dev[:-1]) | ((ts[1:] - ts[:-1]) > gap)
+        starts = np.flatnonzero(viol & breaks[:-1])
+        ends = np.flatnonzero(viol & breaks[1:])
+
+        # Pico: sobre las lecturas fuera de rango (contiguas por racha) min y max por racha
+        vi = np.flatnonzero(viol)
+        run_starts = np.searchsorted(vi, starts)
+        v_max = np.maximum.reduceat(v[vi], run_starts)
+        v_min = np.minimum.reduceat(v[vi], run_starts)
+        o_min, o_max = matrix.o_min[rows[starts], col], matrix.o_max[rows[starts], col]
+        peak = np.where(v_max - o_max >= o_min - v_min, v_max, v_min)
+
+        # Fin: la lectura que volvió al rango (mismo dispositivo, dentro de max_gap)
+        nxt = np.minimum(ends + 1, len(v) - 1)
+        closes = (ends + 1 < len(v)) & (dev[nxt] == dev[ends]) & ((ts[nxt] - ts[ends]) <= gap)
+        end_ts = np.where(closes, ts[nxt], ts[ends])
+
+        parts.append(pd.DataFrame({
+            "device_id": dev_names[dev[starts]],
+            "sensor": sensor,
+            "level": pd.Series(level[starts]).map(LEVEL_NAMES).to_numpy(),
+            "start": ts[starts],
+            "end": end_ts,
+            "duration": end_ts - ts[starts],
+            "peak": peak.astype(np.float64),
+            "samples": ends - starts + 1,
+        }))
+
+    if not parts:
+        return _empty_intervals()
+    return pd.concat(parts, ignore_index=True)[INTERVAL_COLUMNS]
+
+
+def time_out_of_range(intervals: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tiempo en alerta / crítico por dispositivo y sensor, y porcentaje del período observado
+    (primera a última lectura del dispositivo en df). Incluye el peor valor (pico crítico si hubo).
+    """
+    columns = ["device_id", "sensor", "warning", "critical", "episodes", "worst", "pct_out"]
+    if intervals is None or intervals.empty:
+        return pd.DataFrame(columns=columns)
+
+    # observed=True: con device_id categórico no aparecen dispositivos filtrados fuera (pandas 2)
+    totals = intervals.pivot_table(index=["device_id", "sensor"], columns="level", values="duration",
+                                   aggfunc="sum", fill_value=pd.Timedelta(0), observed=True)
+    summary = pd.DataFrame(index=totals.index)
+    for level in ("warning", "critical"):
+        summary[level] = totals[level] if level in totals.columns else pd.Timedelta(0)
+    summary["episodes"] = intervals.groupby(["device_id", "sensor"], observed=True).size()
+
+    # Peor valor: el pico del intervalo más severo y, a igual severidad, el más largo
+    ranked = intervals.assign(severity=intervals["level"].map({"warning": 1, "critical": 2}))
+    ranked = ranked.sort_values(["severity", "duration"], ascending=False)
+    summary["worst"] = ranked.groupby(["device_id", "sensor"], observed=True)["peak"].first()
+
+    ts = pd.to_datetime(df["timestamp"])
+    span = ts.groupby(df["device_id"], observed=True).agg(lambda s: s.max() - s.min())
+    observed = summary.index.get_level_values("device_id").map(span)
+    out = (summary["warning"] + summary["critical"]).to_numpy()
+    observed = pd.to_timedelta(observed).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(observed > np.timedelta64(0), out / observed * 100, np.nan)
+    summary["pct_out"] = np.minimum(pct, 100.0)
+    return summary.reset_index()[columns]
@@ -0,0 +1,245 @@
+"""
+Caché INCREMENTAL (append-only) del historial de telemetría.
+
+En vez de recargar toda la ventana cada vez, recuerda un high-water mark por fuente
+y en cada refresco trae sólo los documentos nuevos: `timestamp >= último timestamp visto - LATE_OVERLAP`
+para Date y para strings ISO (mismo $or que la carga completa), excluyendo los _id ya cargados
+en ese solape. El solape recoge los datos que llegan algo tarde (escritores concurrentes,
+gateways que reenvían); no se usa `_id > último ObjectId` porque un escritor con el reloj
+atrasado genera ObjectId menores y sus documentos se perderían.
+Las filas nuevas se anexan al DataFrame en memoria y las que salen de la ventana se descartan.
+Los documentos con timestamp posterior al corte (relojes adelantados) quedan pendientes
+hasta que su hora llega, igual que el tiempo de corte de la carga completa original.
+
+La carga completa lee primero los días cerrados desde la caché Parquet en disco
+(modules/parquet_store.py) y sólo consulta Mongo desde el primer día que falta.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from modules.history_layout import concat_history
+from modules.parquet_store import get_telemetry_store
+from modules.telemetry_normalizer import normalize_documents, now_chile, parse_timestamps
+
+# Solape de cada delta con lo ya cargado: documentos que llegan con hasta este retraso no se pierden
+LATE_OVERLAP = timedelta(minutes=15)
+
+
+class IncrementalHistoryCache:
+
+    def __init__(
+        self,
+        window: timedelta = timedelta(weeks=1, hours=1),
+        prepare: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+        min_refresh_seconds: float = 60.0,
+        persist: bool = True,
+    ):
+        """
+        window: antigüedad máxima de las filas que se mantienen en memoria.
+        prepare: transformación de cada lote nuevo antes de anexarlo (ej. prepare_history:
+                 alias + disposición compacta). Lo ya anexado no se vuelve a preparar.
+        min_refresh_seconds: intervalo mínimo entre refrescos automáticos.
+        persist: usar la caché Parquet en disco para los días cerrados.
+        """
+        self.window = window
+        self.prepare = prepare
+        self.min_refresh_seconds = min_refresh_seconds
+        self.persist = persist
+
+        self._lock = threading.Lock()
+        self._frame = pd.DataFrame()
+        self._marks: Dict[str, Dict[str, Any]] = {}
+        self.last_refresh: Optional[float] = None
+        # Inicio de la ventana en el último refresco: el frame tiene TODO lo posterior
+        self.covered_from: Optional[datetime] = None
+        self.stats = {"full_loads": 0, "delta_loads": 0, "last_delta_docs": 0, "last_duration_s": 0.0}
+
+    # --- API PÚBLICA ---
+    def get(self, db, force: bool = False) -> pd.DataFrame:
+        """Refresca (si corresponde) y retorna las filas de la ventana hasta la hora actual."""
+        if force or self._is_stale():
+            self.refresh(db, force=force)
+        return self.snapshot()
+
+    def snapshot(self) -> pd.DataFrame:
+        """Filas dentro de la ventana al momento del último refresco."""
+        return self._frame
+
+    def expire(self):
+        """El próximo get() refresca (delta) aunque no haya pasado min_refresh_seconds."""
+        self.last_refresh = None
+
+    def reset(self):
+        """Olvida todo: el próximo refresco vuelve a cargar la ventana completa."""
+        with self._lock:
+            self._frame = pd.DataFrame()
+            self._marks = {}
+            self.last_refresh = None
+            self.covered_from = None
+
+    def refresh(self, db, force: bool = True) -> pd.DataFrame:
+        """
+        Trae los documentos nuevos de cada fuente, los anexa y aplica la ventana.
+        Con force=False no consulta si otro hilo refrescó mientras se esperaba el lock.
+        """
+        with self._lock:
+            if not force and not self._is_stale():
+                return self._frame
+            t0 = time.time()
+            # Tiempo de corte común: lo posterior (relojes adelantados) queda pendiente
+            cut_off_time = now_chile()
+            window_start = cut_off_time - self.window
+            frames = [self._frame] if not self._frame.empty else []
+            is_full = not self._marks
+            delta_docs = 0
+
+            # Carga completa: días cerrados desde disco, Mongo sólo desde el primer día faltante
+            store = get_telemetry_store(db) if (is_full and self.persist) else None
+            fetch_start, missing_days = window_start, []
+            if store is not None:
+                cached_days, missing_days, open_from = store.plan(window_start, cut_off_time)
+                first_missing = missing_days[0] if missing_days else open_from
+                seed_days = [d for d in cached_days if d < first_missing]
+                fetch_start = first_missing
+                seed = store.read_days(seed_days)
+                if not seed.empty:
+                    seed = seed[seed['timestamp'] >= window_start]
+                    frames.append(self.prepare(seed) if self.prepare is not None else seed)
+                print(f"[history_cache] Disco: {len(seed_days)} días cerrados ({len(seed)} filas); Mongo desde {fetch_start}")
+
+            sources = [s for s in db.sources if s.get("coll_telemetry")]
+            keys = [f"{s['name']}|{s['db']}|{s['coll_telemetry']}" for s in sources]
+
+            def load(item):
+                source, key = item
+                try:
+                    return self._fetch_source(db, source, self._marks.get(key), fetch_start)
+                except Exception as e:
+                    print(f"[history_cache] ERROR cargando fuente {source['name']}: {e}")
+                    return None
+
+            # EJECUCIÓN PARALELA: todas las fuentes se consultan al mismo tiempo
+            with ThreadPoolExecutor(max_workers=max(len(sources), 1)) as executor:
+                results = list(executor.map(load, zip(sources, keys)))
+
+            normalized = []
+            for key, raw_docs in zip(keys, results):
+                if raw_docs is None:
+                    continue
+                mark = self._marks.get(key)
+                pending = mark["pending"] if mark else []
+                # Los pendientes pueden volver a llegar por la consulta de timestamp: deduplicar por _id
+                seen = {doc.get("_id") for doc in raw_docs}
+                raw_docs = raw_docs + [doc for doc in pending if doc.get("_id") not in seen]
+
+                ts = parse_timestamps([doc.get("timestamp") for doc in raw_docs])
+                is_future = ts > np.datetime64(cut_off_time, "us")
+                ready = [doc for doc, future in zip(raw_docs, is_future) if not future]
+                future_docs = [doc for doc, future in zip(raw_docs, is_future) if future]
+                # Timestamps ilegibles no deben mover el mark de strings ("no-es-fecha" > "2026-...")
+                valid = [(doc, t) for doc, t, future in zip(raw_docs, ts, is_future) if not future and not np.isnat(t)]
+
+                self._marks[key] = self._advance_mark(mark, valid)
+                self._marks[key]["pending"] = future_docs
+                delta_docs += len(ready)
+
+                batch = self._normalize_batch(ready)
+                if store is not None and not batch.empty:
+                    # La consulta es un superconjunto (Date en UTC vs hora local): lo anterior ya vino del disco
+                    batch = batch[batch['timestamp'] >= fetch_start]
+                if not batch.empty:
+                    normalized.append(batch)
+                    frames.append(self.prepare(batch) if self.prepare is not None else batch)
+
+            # Guardar en disco los días cerrados recién traídos (sólo si TODAS las fuentes respondieron)
+            if store is not None and missing_days and all(r is not None for r in results):
+                store.write_days(pd.concat(normalized, ignore_index=True) if normalized else pd.DataFrame(), missing_days)
+
+            # Lotes ya preparados: se unen al frame existente sin reprocesarlo (ver concat_history)
+            df = concat_history(frames)
+
+            # Ventana deslizante: descartar lo que ya quedó fuera (el orden de las filas se mantiene)
+            if not df.empty:
+                df = df[df['timestamp'] >= window_start]
+
+            self._frame = df
+            self.covered_from = window_start
+            self.last_refresh = time.time()
+            self.stats["full_loads" if is_full else "delta_loads"] += 1
+            self.stats["last_delta_docs"] = delta_docs
+            self.stats["last_duration_s"] = self.last_refresh - t0
+            print(f"[history_cache] {'Carga completa' if is_full else 'Delta'}: {delta_docs} docs nuevos, "
+                  f"{len(df)} filas en caché ({self.stats['last_duration_s']:.2f}s)")
+            return df
+
+    # --- HELPERS ---
+    def _is_stale(self) -> bool:
+        return self.last_refresh is None or (time.time() - self.last_refresh) >= self.min_refresh_seconds
+
+    def _fetch_source(self, db, source, mark: Optional[Dict[str, Any]], window_start: datetime) -> List[Dict[str, Any]]:
+        if mark is None:
+            # Primera carga: ventana completa o desde el primer día que falta en disco
+            # (soporta Date objects y strings ISO)
+            query = {
+                "$or": [
+                    {"timestamp": {"$gte": window_start}},
+                    {"timestamp": {"$gte": window_start.isoformat()}}
+                ]
+            }
+        else:
+            # Siempre ambos tipos: si uno aún no tiene mark (la fuente empieza a recibir el otro
+            # esquema), se consulta desde el inicio del solape del tipo que sí lo tiene
+            loaded = [parsed for seen in mark["seen"].values() for parsed, _ in seen.values()]
+            overlap_start = pd.Timestamp(min(loaded)).to_pydatetime() if loaded else window_start
+            ts_date = mark["ts_date"] if mark.get("ts_date") is not None else overlap_start
+            ts_str = mark["ts_str"] if mark.get("ts_str") is not None else overlap_start.isoformat()
+            query = {"$or": [{"timestamp": {"$gte": ts_date}}, {"timestamp": {"$gte": ts_str}}]}
+            loaded_ids = [_id for seen in mark["seen"].values() for _id in seen]
+            if loaded_ids:
+                query = {"$and": [query, {"_id": {"$nin": loaded_ids}}]}
+
+        return db.fetch_telemetry_docs(source, query)
+
+    def _advance_mark(self, mark: Optional[Dict[str, Any]], ready: List[Tuple[Dict[str, Any], Any]]) -> Dict[str, Any]:
+        """
+        Avanza el high-water mark de una fuente con los documentos ya cargados y válidos
+        (pares documento, timestamp parseado); los 'del futuro' quedan fuera para volver a consultarse.
+        Por tipo de timestamp guarda los _id leídos en los últimos LATE_OVERLAP respecto del más
+        reciente: el próximo delta consulta desde el más antiguo de ellos y los excluye por _id.
+        """
+        if mark:
+            mark = dict(mark, seen={k: dict(v) for k, v in mark["seen"].items()})
+        else:
+            mark = {"ts_date": None, "ts_str": None, "seen": {"ts_date": {}, "ts_str": {}}, "pending": []}
+        # seen[campo]: _id -> (timestamp parseado, timestamp tal como está en Mongo)
+        seen = mark["seen"]
+
+        for doc, parsed in ready:
+            ts = doc.get("timestamp")
+            if isinstance(ts, datetime):
+                seen["ts_date"][doc.get("_id")] = (parsed, ts)
+            elif isinstance(ts, str):
+                seen["ts_str"][doc.get("_id")] = (parsed, ts)
+
+        overlap = np.timedelta64(int(LATE_OVERLAP.total_seconds() * 1e6), "us")
+        for field, loaded in seen.items():
+            if not loaded:
+                continue
+            newest = max(parsed for parsed, _ in loaded.values())
+            seen[field] = {k: v for k, v in loaded.items() if v[0] >= newest - overlap}
+            # Límite inferior del próximo delta: el valor crudo más antiguo del solape
+            mark[field] = min(seen[field].values(), key=lambda v: v[0])[1]
+        return mark
+
+    def _normalize_batch(self, raw_docs: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Filas normalizadas válidas (sin `prepare`: así se guardan en disco)."""
+        df = normalize_documents(raw_docs)
+        if df.empty:
+            return df
+        return df[df['timestamp'].notna() & (df['device_id'] != "unknown")]
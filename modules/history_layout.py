@@ -0,0 +1,235 @@
+"""
+Disposición compacta en memoria del historial de Gráficas.
+
+El DataFrame de la última semana vive en el repositorio de telemetría mientras el proceso
+esté arriba y lo comparten todas las sesiones. Antes guardaba device_id / location como
+strings de Python (un objeto por fila) y cada sensor como float64. compact_history() lo deja:
+
+- device_id y location como categóricas (códigos enteros + un string por valor distinto).
+- Sensores en float32 cuando el redondeo no cambia la lectura en más de FLOAT32_TOLERANCE
+  y restore_float64 la recupera exacta (los sensores entregan 2-3 decimales); si no, la
+  columna queda en float64. expand_history() vuelve a los tipos planos para Datos/exportación.
+- Filas ordenadas por (device_id, timestamp): cada dispositivo es un bloque contiguo y
+  sus filas se recortan con slices (vistas) en vez de máscaras booleanas sobre todo el frame.
+
+device_blocks() da los offsets [inicio, fin) de cada dispositivo (un searchsorted sobre los códigos
+ordenados, memorizado por frame) y window_slices() recorta la ventana de tiempo de cada dispositivo
+con un searchsorted dentro de su bloque.
+
+La caché incremental (modules/history_cache.py) guarda DIRECTAMENTE este formato: cada lote
+nuevo pasa por prepare_history() y concat_history() lo une al frame ya compacto (unifica las
+categorías y reordena), sin volver a procesar la semana ni mantener una copia cruda aparte.
+
+memory_per_million_rows() reporta cuánto ocupa el frame normalizado por millón de filas.
+"""
+import threading
+import weakref
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from modules.telemetry_normalizer import normalize_sensor_columns
+
+# Error absoluto máximo aceptado al pasar una columna de sensor a float32
+FLOAT32_TOLERANCE = 1e-4
+# Dígitos significativos que float32 conserva: una lectura de hasta 7 dígitos vuelve exacta a float64
+FLOAT32_DIGITS = 7
+CATEGORY_COLUMNS = ("device_id", "location")
+BASE_COLUMNS = ("timestamp", "device_id", "location")
+
+
+def restore_float64(values: np.ndarray) -> np.ndarray:
+    """
+    float32 -> float64 redondeado a FLOAT32_DIGITS dígitos significativos: la lectura original
+    (7.2) y no la expansión binaria del float32 (7.199999809265137).
+    """
+    x = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        exponent = FLOAT32_DIGITS - 1 - np.floor(np.log10(np.abs(x)))
+        exponent = np.where(np.isfinite(exponent), exponent, 0.0)
+        # Potencias de 10 exactas: se multiplica o divide según el signo del exponente
+        scale = 10.0 ** np.abs(exponent)
+        return np.where(exponent >= 0, np.round(x * scale) / scale, np.round(x / scale) * scale)
+
+
+def _float32_if_lossless(values: pd.Series) -> pd.Series:
+    """
+    La columna en float32 si cada valor se conserva dentro de FLOAT32_TOLERANCE y además
+    restore_float64 lo devuelve EXACTO (así Datos y las exportaciones ven la lectura original).
+    """
+    raw = values.to_numpy(dtype=np.float64)
+    compact = raw.astype(np.float32)
+    with np.errstate(invalid="ignore", over="ignore"):
+        error = np.abs(compact.astype(np.float64) - raw)
+    if np.nanmax(error, initial=0.0) > FLOAT32_TOLERANCE:
+        return values
+    if not np.array_equal(restore_float64(compact), raw, equal_nan=True):
+        return values
+    return pd.Series(compact, index=values.index, name=values.name)
+
+
+def compact_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Historial plano (timestamp, device_id, location, <sensores>) en la disposición compacta.
+    Las columnas y sus nombres no cambian; sólo tipos y orden de filas.
+    """
+    if df.empty:
+        return df
+
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if col in CATEGORY_COLUMNS:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype("category")
+            # Sin categorías huérfanas de cargas anteriores (los filtros no muestran dispositivos sin filas)
+            values = values.cat.remove_unused_categories()
+        elif col not in BASE_COLUMNS and pd.api.types.is_float_dtype(values.dtype) and values.dtype != np.float32:
+            values = _float32_if_lossless(values)
+        data[col] = values
+    compact = pd.DataFrame(data, index=df.index)
+
+    if "device_id" in compact.columns and "timestamp" in compact.columns:
+        order = np.lexsort((compact["timestamp"].to_numpy(), compact["device_id"].cat.codes.to_numpy()))
+        compact = compact.take(order)
+    return compact.reset_index(drop=True)
+
+
+def prepare_history(batch: pd.DataFrame) -> pd.DataFrame:
+    """Lote normalizado -> nombres de sensor estándar y disposición compacta (lo que guarda la caché)."""
+    return compact_history(normalize_sensor_columns(batch))
+
+
+def concat_history(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Une el historial en memoria con los lotes nuevos. En disposición compacta unifica las
+    categorías (los códigos del frame existente no cambian), mantiene float32 y reordena por
+    (device_id, timestamp); si los frames no son compactos, los ordena por timestamp.
+    """
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+
+    compact = all(isinstance(f["device_id"].dtype, pd.CategoricalDtype) for f in frames if "device_id" in f.columns)
+    if not compact:
+        return pd.concat(frames, ignore_index=True).sort_values("timestamp", kind="mergesort").reset_index(drop=True)
+
+    categories = {
+        col: union_categoricals([f[col].array for f in frames]).categories
+        for col in CATEGORY_COLUMNS
+        if all(col in f.columns and isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames)
+    }
+    df = pd.concat([f.assign(**{col: f[col].cat.set_categories(cats) for col, cats in categories.items()})
+                    for f in frames], ignore_index=True)
+
+    # Un sensor ausente en algún lote llega como float64 (NaN): vuelve a float32 si lo era en los demás
+    for col in df.columns:
+        if col not in BASE_COLUMNS and df[col].dtype != np.float32 and \
+                all(f[col].dtype == np.float32 for f in frames if col in f.columns):
+            df[col] = df[col].astype(np.float32)
+
+    order = np.lexsort((df["timestamp"].to_numpy(), df["device_id"].cat.codes.to_numpy()))
+    return df.take(order).reset_index(drop=True)
+
+
+def expand_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Frame compacto -> los tipos del historial plano (strings y float64 con la lectura original),
+    para lo que sale de Gráficas: la vista de Datos y sus exportaciones CSV / Excel.
+    """
+    if df.empty:
+        return df
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+        elif values.dtype == np.float32:
+            values = pd.Series(restore_float64(values.to_numpy()), index=values.index, name=col)
+        data[col] = values
+    return pd.DataFrame(data, index=df.index)
+
+
+# Offsets del último frame consultado (el historial cacheado cambia sólo al refrescar)
+_BLOCKS_MEMO: Dict[str, object] = {"frame": None, "blocks": None}
+_BLOCKS_LOCK = threading.Lock()
+
+
+def _compute_blocks(df: pd.DataFrame) -> Optional[Dict[str, Tuple[int, int]]]:
+    """Offsets por dispositivo si df está en la disposición compacta; None si no está ordenado."""
+    if not {"device_id", "timestamp"}.issubset(df.columns) or not isinstance(df["device_id"].dtype, pd.CategoricalDtype):
+        return None
+    codes = df["device_id"].array.codes
+    if len(codes) and (codes[0] < 0 or (np.diff(codes) < 0).any()):
+        return None
+    bounds = np.searchsorted(codes, np.arange(len(df["device_id"].cat.categories) + 1), side="left")
+    ts = df["timestamp"].to_numpy()
+    # Dentro de cada bloque el tiempo debe ser creciente (los saltos sólo en cambios de dispositivo)
+    step_back = np.flatnonzero(ts[1:] < ts[:-1]) + 1
+    if not np.isin(step_back, bounds).all():
+        return None
+    return {
+        dev: (int(bounds[i]), int(bounds[i + 1]))
+        for i, dev in enumerate(df["device_id"].cat.categories)
+        if bounds[i + 1] > bounds[i]
+    }
+
+
+def device_blocks(df: pd.DataFrame) -> Optional[Dict[str, Tuple[int, int]]]:
+    """
+    Filas [inicio, fin) de cada dispositivo en un frame compacto (None si no está ordenado
+    por dispositivo y tiempo). Se calculan una vez por frame; las siguientes llamadas con el
+    mismo historial cacheado son un acceso al memo.
+    """
+    with _BLOCKS_LOCK:
+        ref = _BLOCKS_MEMO["frame"]
+        if ref is not None and ref() is df:
+            return _BLOCKS_MEMO["blocks"]
+    blocks = _compute_blocks(df)
+    with _BLOCKS_LOCK:
+        _BLOCKS_MEMO["frame"] = weakref.ref(df)
+        _BLOCKS_MEMO["blocks"] = blocks
+    return blocks
+
+
+def window_slices(df: pd.DataFrame, blocks: Dict[str, Tuple[int, int]], devices: Optional[List[str]],
+                  delta: Optional[timedelta]) -> List[pd.DataFrame]:
+    """
+    Por dispositivo (en el orden del frame), las filas desde su último dato - delta hasta el final
+    de su bloque, como slices sin copia. devices None/vacío = todos; delta None = bloque completo.
+    """
+    ts = df["timestamp"].to_numpy()
+    wanted = set(devices) if devices else None
+    window = None if delta is None else np.timedelta64(pd.Timedelta(delta).value, "ns")
+    parts = []
+    for dev, (lo, hi) in blocks.items():
+        if wanted is not None and dev not in wanted:
+            continue
+        if window is not None:
+            lo += int(np.searchsorted(ts[lo:hi], ts[hi - 1] - window, side="left"))
+        parts.append(df.iloc[lo:hi])
+    return parts
+
+
+def memory_per_million_rows(df: pd.DataFrame) -> float:
+    """Bytes reales (incluye strings de columnas object) por millón de filas."""
+    if df.empty:
+        return 0.0
+    return float(df.memory_usage(index=True, deep=True).sum()) * 1e6 / len(df)
+
+
+def layout_report(df: pd.DataFrame) -> Dict[str, float]:
+    """MB por millón de filas del frame y de su versión compacta, y cuántas veces se reduce."""
+    before = memory_per_million_rows(df)
+    after = memory_per_million_rows(compact_history(df))
+    return {
+        "rows": len(df),
+        "mb_per_million_before": before / 1e6,
+        "mb_per_million_after": after / 1e6,
+        "ratio": before / after if after else 0.0,
+    }
@@ -0,0 +1,379 @@
+"""
+Estado en vivo COMPARTIDO por proceso (dashboard).
+
+Antes cada sesión abierta (pestaña, pantalla de la sala de control, teléfonos) consultaba
+Mongo por su cuenta al cargar y en cada refresco de tarjetas: la carga crecía con la
+cantidad de sesiones. Ahora un único hilo en segundo plano, iniciado una vez por proceso
+con st.cache_resource, ejecuta get_latest_by_device cada LIVE_POLL_SECONDS y deja en
+memoria una foto con la última lectura de cada dispositivo. Las sesiones sólo leen la foto.
+
+- Sin lectores durante LIVE_IDLE_SECONDS el hilo deja de consultar; la próxima lectura
+  lo despierta (y, si la foto quedó vieja, la renueva antes de retornarla).
+- refresh(max_age) fuerza una consulta (botones "Actualizar") salvo que la foto tenga
+  menos de max_age segundos: varias sesiones pidiendo a la vez cuestan una sola consulta.
+- metrics() expone la antigüedad de la foto y la duración de la última consulta.
+
+Feed opcional (LIVE_FEED): un hilo por colección de telemetría empuja las lecturas nuevas a
+la foto apenas llegan, así el dashboard se actualiza en segundos:
+- 'auto' (por defecto): change streams (replica set / Atlas); si el servidor no los soporta
+  (ej. mongod standalone de pruebas), pasa solo a 'tail'.
+- 'tail': cada LIVE_TAIL_SECONDS pide sólo los documentos con _id mayor al último visto
+  (búsqueda por índice que normalmente trae unos pocos documentos).
+- 'off': sólo la consulta completa cada LIVE_POLL_SECONDS.
+Con el feed activo la consulta completa (registro, dispositivos sin datos recientes, alias)
+baja a una reconciliación cada LIVE_RECONCILE_SECONDS.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import streamlit as st
+from bson import ObjectId
+
+from modules.database import DatabaseConnection
+
+# Cada cuánto se consulta Mongo (una vez por proceso, no por sesión)
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "30"))
+# Sin lecturas durante este tiempo el hilo deja de consultar
+LIVE_IDLE_SECONDS = 600.0
+# Un refresh() forzado reutiliza la foto si es más reciente que esto
+MIN_REFRESH_SECONDS = 5.0
+
+# Feed de lecturas nuevas: auto | tail | off
+LIVE_FEED = os.getenv("LIVE_FEED", "auto").strip().lower()
+LIVE_TAIL_SECONDS = float(os.getenv("LIVE_TAIL_SECONDS", "5"))
+# Con el feed activo, la consulta completa sólo reconcilia
+LIVE_RECONCILE_SECONDS = 300.0
+# Máximo de documentos por consulta 'tail' / lote de eventos del change stream
+FEED_BATCH = 1000
+# Fallos seguidos del change stream (ya abierto antes) antes de pasar a 'tail'
+STREAM_MAX_FAILURES = 3
+
+# Columnas de la foto (las de get_latest_by_device)
+LIVE_COLUMNS = ["device_id", "timestamp", "location", "sensor_data", "alerts", "external_alias"]
+
+
+@dataclass
+class LiveSnapshot:
+    frame: pd.DataFrame                     # salida de get_latest_by_device: una fila por dispositivo
+    taken_at: float                         # time.time() al terminar la consulta
+    poll_seconds: float                     # duración de la consulta
+    version: int                            # crece con cada foto nueva
+    timings: Dict[str, float] = field(default_factory=dict)  # desglose de get_latest_by_device
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.taken_at
+
+
+class LiveStatePoller:
+    """Hilo que mantiene la foto del último estado de cada dispositivo para todas las sesiones."""
+
+    def __init__(self, db, interval_seconds: float = LIVE_POLL_SECONDS, idle_seconds: float = LIVE_IDLE_SECONDS,
+                 reconcile_seconds: float = LIVE_RECONCILE_SECONDS):
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self.idle_seconds = idle_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.feeds: List["LiveFeed"] = []
+        self._snapshot: Optional[LiveSnapshot] = None
+        # Una consulta a la vez (hilo y refresh() de las sesiones); reentrante para refresh() -> poll()
+        self._poll_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_read = time.time()
+        self._last_attempt = 0.0
+        self.stats = {"polls": 0, "forced": 0, "errors": 0, "reads": 0, "pushed": 0, "last_error": None}
+
+    # --- Hilo ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="live-state-poller", daemon=True)
+            self._thread.start()
+        return self
+
+    def start_feeds(self, use_change_stream: bool = True, tail_seconds: float = LIVE_TAIL_SECONDS):
+        """Un LiveFeed por fuente de telemetría del db (ver LIVE_FEED)."""
+        for source in getattr(self.db, "sources", []):
+            if source.get("coll_telemetry"):
+                self.feeds.append(LiveFeed(self, source, tail_seconds, use_change_stream).start())
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for feed in self.feeds:
+            feed.stop(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def full_interval(self) -> float:
+        """Cada cuánto va la consulta completa: reconciliación si algún feed empuja lecturas."""
+        return self.reconcile_seconds if any(f.running for f in self.feeds) else self.interval_seconds
+
+    def _idle(self) -> bool:
+        return time.time() - self._last_read > self.idle_seconds
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._idle():
+                # Nadie mira el dashboard: dormir hasta la próxima lectura
+                self._wake.wait()
+            else:
+                # Bajo el lock: si una sesión acaba de forzar una consulta, no repetirla
+                with self._poll_lock:
+                    interval = self.full_interval
+                    since = time.time() - self._last_attempt
+                    if since >= interval:
+                        self.poll()
+                        continue
+                self._wake.wait(interval - since)
+            self._wake.clear()
+
+    # --- Consultas ---
+    def poll(self) -> Optional[LiveSnapshot]:
+        """Consulta Mongo y publica una foto nueva. Si falla, se conserva la anterior."""
+        with self._poll_lock:
+            t0 = time.perf_counter()
+            try:
+                frame = self.db.get_latest_by_device()
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)[:200]
+                print(f"[live_state.py] Error consultando estado en vivo: {str(e)[:100]}")
+                return self._snapshot
+            finally:
+                self._last_attempt = time.time()
+
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            self._snapshot = LiveSnapshot(
+                frame=frame,
+                taken_at=time.time(),
+                poll_seconds=time.perf_counter() - t0,
+                version=version,
+                timings=dict(getattr(self.db, "last_timings", {}) or {}),
+            )
+            self.stats["polls"] += 1
+            return self._snapshot
+
+    def apply_documents(self, raw_docs: List[Dict[str, Any]]) -> int:
+        """
+        Incorpora a la foto documentos crudos nuevos (del feed). Cada dispositivo se actualiza
+        sólo si la lectura es más reciente que la de la foto; se conservan ubicación y alias
+        del registro. Retorna cuántos dispositivos cambiaron (si alguno, la foto sube de versión).
+        """
+        newest: Dict[str, Dict[str, Any]] = {}
+        for raw in raw_docs:
+            norm = self.db._normalize_document(raw)
+            dev_id, ts = norm.get("device_id"), norm.get("timestamp")
+            if not dev_id or dev_id == "unknown" or ts is None:
+                continue
+            if dev_id not in newest or ts > newest[dev_id]["timestamp"]:
+                newest[dev_id] = norm
+        if not newest:
+            return 0
+
+        # Bajo el lock de consultas: no mezclarse con una consulta completa en curso
+        with self._poll_lock:
+            snap = self._snapshot
+            if snap is None:
+                return 0  # la primera consulta completa trae todo
+            columns = list(snap.frame.columns) if len(snap.frame.columns) else LIVE_COLUMNS
+            rows = {r["device_id"]: r for r in snap.frame.to_dict("records")}
+            changed = 0
+            for dev_id, norm in newest.items():
+                row = rows.get(dev_id)
+                if row is not None and not pd.isna(row.get("timestamp")) and pd.Timestamp(norm["timestamp"]) <= row["timestamp"]:
+                    continue
+                new_row = dict(row) if row is not None else {"device_id": dev_id, "location": norm["location"]}
+                new_row.update(timestamp=norm["timestamp"], sensor_data=norm["sensors"], alerts=norm["alerts"])
+                rows[dev_id] = new_row
+                changed += 1
+            if not changed:
+                return 0
+
+            frame = pd.DataFrame(list(rows.values()), columns=columns)
+            frame["timestamp"] = pd.to_datetime(frame["timestamp"], errors="coerce")
+            self._snapshot = LiveSnapshot(
+                frame=frame,
+                taken_at=time.time(),
+                poll_seconds=snap.poll_seconds,
+                version=snap.version + 1,
+                timings=snap.timings,
+            )
+            self.stats["pushed"] += changed
+            return changed
+
+    def refresh(self, max_age: float = MIN_REFRESH_SECONDS) -> Optional[LiveSnapshot]:
+        """Fuerza una foto nueva, salvo que la actual (o la de quien consultó antes) sea reciente."""
+        with self._poll_lock:
+            snap = self._snapshot
+            if snap is not None and snap.age_seconds < max_age:
+                return snap
+            self.stats["forced"] += 1
+            return self.poll()
+
+    def snapshot(self) -> Optional[LiveSnapshot]:
+        """Foto actual para una sesión. None sólo si nunca se pudo consultar."""
+        was_idle = self._idle()
+        self._last_read = time.time()
+        self.stats["reads"] += 1
+        if was_idle:
+            self._wake.set()
+
+        snap = self._snapshot
+        # Primera lectura, o el hilo estuvo dormido / atascado: renovar antes de responder
+        interval = self.full_interval
+        if snap is None or snap.age_seconds > 2 * interval:
+            snap = self.refresh(max_age=interval)
+        return snap
+
+    def metrics(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            **self.stats,
+            "snapshot_age_s": snap.age_seconds if snap else None,
+            "poll_s": snap.poll_seconds if snap else None,
+            "version": snap.version if snap else 0,
+            "devices": len(snap.frame) if snap is not None and snap.frame is not None else 0,
+            "interval_s": self.full_interval,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "idle": self._idle(),
+            "feeds": [feed.metrics() for feed in self.feeds],
+        }
+
+
+class LiveFeed:
+    """
+    Empuja a la foto del poller las lecturas nuevas de UNA fuente de telemetría.
+    Modo 'change_stream': collection.watch() sobre inserciones, sin consultas periódicas.
+    Modo 'tail': cada tail_seconds, find({_id: {$gt: último}}) ordenado por _id (índice de _id).
+    Si las _id no son ObjectId, el cursor va por timestamp.
+    """
+
+    def __init__(self, poller: LiveStatePoller, source: Dict[str, Any], tail_seconds: float = LIVE_TAIL_SECONDS,
+                 use_change_stream: bool = True):
+        self.poller = poller
+        self.name = source["name"]
+        self.collection = source["client"][source["db"]][source["coll_telemetry"]]
+        self.tail_seconds = tail_seconds
+        self.mode = "change_stream" if use_change_stream else "tail"
+        self._cursor_field: Optional[str] = None
+        self._cursor_value = None
+        self._resume_token = None
+        self._stream_opened = False
+        self._stream_failures = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"docs": 0, "queries": 0, "errors": 0, "last_error": None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"live-feed-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.mode == "change_stream":
+                self._watch()
+            elif self._tail_once() < FEED_BATCH:
+                # Lote completo = hay atraso: seguir sin esperar
+                self._stop.wait(self.tail_seconds)
+
+    def _error(self, e: Exception):
+        self.stats["errors"] += 1
+        self.stats["last_error"] = str(e)[:200]
+
+    def _push(self, docs: List[Dict[str, Any]]):
+        self.stats["docs"] += len(docs)
+        self.poller.apply_documents(docs)
+
+    # --- Change stream ---
+    def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        try:
+            with self.collection.watch(pipeline, resume_after=self._resume_token, max_await_time_ms=1000) as stream:
+                self._stream_opened = True
+                self._stream_failures = 0
+                while not self._stop.is_set() and stream.alive:
+                    pending = []
+                    change = stream.try_next()
+                    while change is not None:
+                        pending.append(change["fullDocument"])
+                        if len(pending) >= FEED_BATCH:
+                            break
+                        change = stream.try_next()
+                    self._resume_token = stream.resume_token
+                    if pending:
+                        self._push(pending)
+        except Exception as e:
+            self._error(e)
+            self._stream_failures += 1
+            if not self._stream_opened or self._stream_failures >= STREAM_MAX_FAILURES:
+                # Sin soporte (standalone, mongomock) o caído de forma persistente
+                print(f"[live_state.py] Change streams no disponibles en {self.name}, consultando por _id: {str(e)[:100]}")
+                self.mode = "tail"
+            else:
+                self._stop.wait(self.tail_seconds)
+
+    # --- Tail por cursor ---
+    def _seed_cursor(self):
+        """Arranca desde el documento más nuevo: lo anterior ya está en la foto."""
+        newest = next(iter(self.collection.find({}, {"_id": 1, "timestamp": 1}).sort("_id", -1).limit(1)), None)
+        self.stats["queries"] += 1
+        if newest is None or isinstance(newest["_id"], ObjectId):
+            self._cursor_field = "_id"
+            self._cursor_value = newest["_id"] if newest else ObjectId.from_datetime(datetime.now(timezone.utc))
+        else:
+            newest = next(iter(self.collection.find({}, {"timestamp": 1}).sort("timestamp", -1).limit(1)), None)
+            self.stats["queries"] += 1
+            self._cursor_field = "timestamp"
+            self._cursor_value = newest.get("timestamp") if newest else datetime.now(timezone.utc)
+
+    def _tail_once(self) -> int:
+        if self.poller._idle():
+            # Nadie mira: no consultar; al volver se parte desde lo más nuevo (la foto se renueva entera)
+            self._cursor_value = None
+            return 0
+        try:
+            if self._cursor_value is None:
+                self._seed_cursor()
+                return 0
+            query = {self._cursor_field: {"$gt": self._cursor_value}}
+            docs = list(self.collection.find(query).sort(self._cursor_field, 1).limit(FEED_BATCH))
+            self.stats["queries"] += 1
+        except Exception as e:
+            self._error(e)
+            return 0
+        if docs:
+            self._cursor_value = docs[-1][self._cursor_field]
+            self._push(docs)
+        return len(docs)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"source": self.name, "mode": self.mode, "running": self.running, **self.stats}
+
+
+@st.cache_resource(show_spinner=False)
+def get_live_poller() -> LiveStatePoller:
+    """Poller único del proceso (st.cache_resource: compartido por todas las sesiones)."""
+    poller = LiveStatePoller(DatabaseConnection())
+    if LIVE_FEED != "off":
+        poller.start_feeds(use_change_stream=LIVE_FEED != "tail")
+    return poller.start()
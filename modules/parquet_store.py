@@ -0,0 +1,186 @@
+"""
+Caché PERSISTENTE en disco de telemetría normalizada (Parquet).
+
+Los días ya cerrados no cambian, así que se guardan una sola vez en archivos Parquet
+particionados por día y dispositivo:
+
+    <TELEMETRY_CACHE_DIR>/<namespace>/date=YYYY-MM-DD/device=<id>.parquet
+
+Los loaders (Gráficas y Datos) leen primero de acá y sólo consultan MongoDB por los días
+que faltan o que siguen abiertos (hoy). Sobrevive a reinicios de Streamlit y a la expiración
+de los cachés en memoria. Las lecturas usan memory-map.
+
+- Hora: local de Chile sin zona (la misma de normalize_documents); un día es [00:00, 24:00).
+- Un día se considera CERRADO cuando terminó hace más de CLOSED_DAY_GRACE (por defecto 48 h):
+  los gateways que suben datos atrasados (cortes de red, reenvíos) alcanzan a llegar antes
+  de que el día se escriba en disco, porque un día cerrado ya no se vuelve a pedir a Mongo.
+- El archivo _COMPLETE marca que el día se escribió entero (días sin datos también cuentan).
+- namespace: hash de las fuentes configuradas, para no mezclar bases/colecciones distintas.
+
+Configuración (.env): TELEMETRY_CACHE_DIR=ruta  (vacío u "off" para desactivar).
+                      TELEMETRY_CLOSED_DAY_GRACE_HOURS=48  (margen para datos atrasados).
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow viene con streamlit
+    pa = pq = None
+
+from modules.telemetry_normalizer import now_chile
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "telemetria"
+CLOSED_DAY_GRACE = timedelta(hours=float(os.getenv("TELEMETRY_CLOSED_DAY_GRACE_HOURS", "48")))
+COMPLETE_MARKER = "_COMPLETE"
+BASE_COLUMNS = ('timestamp', 'device_id', 'location')
+
+
+def day_floor(ts: datetime) -> datetime:
+    """Inicio (00:00) del día local de un timestamp."""
+    return datetime(ts.year, ts.month, ts.day)
+
+
+def contiguous_runs(days: Sequence[datetime]) -> List[Tuple[datetime, datetime]]:
+    """Agrupa días ordenados en tramos consecutivos [(primer_día, último_día), ...]."""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+class ParquetTelemetryStore:
+
+    def __init__(self, root, namespace: str = "default", grace: timedelta = CLOSED_DAY_GRACE):
+        self.root = Path(root) / namespace
+        self.grace = grace
+        self._lock = threading.Lock()
+        self.stats = {"days_read": 0, "days_written": 0, "files_read": 0, "bytes_read": 0, "read_s": 0.0}
+
+    # --- PLANIFICACIÓN ---
+    def closed_until(self) -> datetime:
+        """Todos los días ANTERIORES a esta fecha están cerrados (inmutables)."""
+        return day_floor(now_chile() - self.grace)
+
+    def plan(self, start: datetime, end: datetime) -> Tuple[List[datetime], List[datetime], Optional[datetime]]:
+        """
+        Divide [start, end] en:
+        - días cerrados disponibles en disco,
+        - días cerrados que faltan (hay que traerlos de Mongo y guardarlos),
+        - inicio del tramo abierto (o None si el rango termina antes de hoy).
+        """
+        closed_until = self.closed_until()
+        cached, missing = [], []
+        day = day_floor(start)
+        while day <= end and day < closed_until:
+            (cached if self.has_day(day) else missing).append(day)
+            day += timedelta(days=1)
+        open_from = max(closed_until, start) if end >= closed_until else None
+        return cached, missing, open_from
+
+    # --- LECTURA ---
+    def _day_dir(self, day: datetime) -> Path:
+        return self.root / f"date={day:%Y-%m-%d}"
+
+    def has_day(self, day: datetime) -> bool:
+        return (self._day_dir(day) / COMPLETE_MARKER).exists()
+
+    def read_days(self, days: Sequence[datetime], devices: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Filas de los días pedidos (opcionalmente sólo algunos dispositivos)."""
+        t0 = time.perf_counter()
+        wanted = {quote(str(d), safe="") for d in devices} if devices else None
+        tables = []
+        for day in days:
+            for path in sorted(self._day_dir(day).glob("device=*.parquet")):
+                if wanted is not None and path.stem[len("device="):] not in wanted:
+                    continue
+                tables.append(pq.read_table(path, memory_map=True))
+                self.stats["files_read"] += 1
+                self.stats["bytes_read"] += path.stat().st_size
+        self.stats["days_read"] += len(days)
+        self.stats["read_s"] += time.perf_counter() - t0
+
+        if not tables:
+            return pd.DataFrame()
+        # Cada dispositivo tiene sus propios sensores: se unifican los esquemas (columnas faltantes = NaN)
+        table = pa.concat_tables(tables, promote_options="default")
+        return table.to_pandas()
+
+    # --- ESCRITURA ---
+    def write_days(self, df: pd.DataFrame, days: Sequence[datetime]):
+        """
+        Guarda las filas de cada día CERRADO de `days`. `df` debe traer TODOS los dispositivos
+        de esos días (de todas las fuentes), porque la partición se marca como completa.
+        """
+        closed_until = self.closed_until()
+        for day in days:
+            if day >= closed_until:
+                continue
+            if df.empty:
+                day_df = df
+            else:
+                day_df = df[(df['timestamp'] >= day) & (df['timestamp'] < day + timedelta(days=1))]
+            self._write_day(day, day_df)
+
+    def _write_day(self, day: datetime, day_df: pd.DataFrame):
+        day_dir = self._day_dir(day)
+        with self._lock:
+            day_dir.mkdir(parents=True, exist_ok=True)
+            if not day_df.empty:
+                for device_id, dev_df in day_df.groupby('device_id', sort=False):
+                    # Sólo las columnas de sensores que este dispositivo realmente usa
+                    unused = [c for c in dev_df.columns if c not in BASE_COLUMNS and dev_df[c].isna().all()]
+                    dev_df = dev_df.drop(columns=unused).sort_values('timestamp', kind='mergesort')
+                    path = day_dir / f"device={quote(str(device_id), safe='')}.parquet"
+                    tmp = path.with_suffix(".tmp")
+                    pq.write_table(pa.Table.from_pandas(dev_df, preserve_index=False), tmp)
+                    os.replace(tmp, path)
+            (day_dir / COMPLETE_MARKER).touch()
+            self.stats["days_written"] += 1
+
+    def devices_for_day(self, day: datetime) -> List[str]:
+        return [unquote(p.stem[len("device="):]) for p in self._day_dir(day).glob("device=*.parquet")]
+
+    def disk_usage(self) -> int:
+        """Bytes ocupados por el namespace en disco."""
+        return sum(p.stat().st_size for p in self.root.rglob("*.parquet")) if self.root.exists() else 0
+
+
+# =============================================================================
+# INSTANCIA COMPARTIDA POR PROCESO
+# =============================================================================
+_STORES: Dict[Tuple[str, str], ParquetTelemetryStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def sources_namespace(sources) -> str:
+    """Hash estable de las fuentes de telemetría (nombre, base y colección; sin credenciales)."""
+    key = "|".join(sorted(f"{s['name']}:{s['db']}:{s.get('coll_telemetry')}" for s in sources))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def get_telemetry_store(db) -> Optional[ParquetTelemetryStore]:
+    """Store en disco para las fuentes de `db`, o None si está desactivado o falta pyarrow."""
+    root = os.getenv("TELEMETRY_CACHE_DIR", str(DEFAULT_CACHE_DIR)).strip()
+    if pq is None or not root or root.lower() == "off" or not db.sources:
+        return None
+
+    key = (root, sources_namespace(db.sources))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = ParquetTelemetryStore(root, namespace=key[1])
+            _STORES[key] = store
+        return store
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 from typing import Dict, Set, Any
 from dataclasses import dataclass
 from pathlib import Path
@@ -38,9 +39,41 @@ class SensorMetadata:
         }
 
 
+# Alias de nombres de sensores (esquemas legacy / en español -> nombre estándar).
+# Base fija + campo "aliases" de cada sensor en sensor_defaults.json, compilados al cargar los defaults.
+BUILTIN_SENSOR_ALIASES = {
+    "temp": "temperature",
+    "temperatura": "temperature",
+    "oxigeno": "oxygen",
+    "od": "oxygen",
+    "do": "oxygen",
+    "humedad": "humidity",
+}
+
+# Cache clave cruda -> nombre estándar (internado). Incluye claves desconocidas (resuelven a sí mismas).
+_SENSOR_NAME_CACHE: Dict[str, str] = {}
+_SENSOR_NAME_CACHE_MAX = 10_000
+
+
+def resolve_sensor_name(key: str) -> str:
+    """
+    Nombre estándar de un sensor: lower/strip + alias. Lo usan todos los normalizadores
+    (documentos, DataFrames, columnas del historial y umbrales de dispositivos).
+    Un acierto de caché es un solo dict.get por clave cruda.
+    """
+    name = _SENSOR_NAME_CACHE.get(key)
+    if name is None:
+        clean = key.lower().strip()
+        name = sys.intern(SensorRegistry.get_aliases().get(clean, clean))
+        if len(_SENSOR_NAME_CACHE) < _SENSOR_NAME_CACHE_MAX:
+            _SENSOR_NAME_CACHE[key] = name
+    return name
+
+
 class SensorRegistry:
     
     _defaults: Dict[str, SensorMetadata] = {}
+    _aliases: Dict[str, str] = dict(BUILTIN_SENSOR_ALIASES)
     _loaded: bool = False
     
     @classmethod
@@ -56,8 +89,13 @@ class SensorRegistry:
             if config_path.exists():
                 with open(config_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
+                    aliases = dict(BUILTIN_SENSOR_ALIASES)
                     for name, meta in data.items():
                         cls._defaults[name] = SensorMetadata.from_dict(name, meta)
+                        for alias in meta.get("aliases", []):
+                            aliases[alias.lower().strip()] = name
+                    cls._aliases = aliases
+                    _SENSOR_NAME_CACHE.clear()
             else:
                 # Fallback genérico si falta el archivo (no debería pasar en prod)
                 pass
@@ -73,6 +111,12 @@ class SensorRegistry:
         if not SensorRegistry._loaded:
             SensorRegistry._load_defaults()
     
+    @staticmethod
+    def get_aliases() -> Dict[str, str]:
+        """Alias en minúsculas -> nombre estándar (para expresiones del servidor, ej. $switch)."""
+        SensorRegistry._ensure_loaded()
+        return SensorRegistry._aliases
+
     @staticmethod
     def discover_sensors_from_dataframe(df) -> Set[str]:
         if df.empty:
@@ -0,0 +1,371 @@
+"""
+Exportación en STREAMING de telemetría (CSV / Excel / Parquet / Arrow IPC) con memoria acotada.
+
+Antes el backup completo cargaba toda la historia del proyecto como un DataFrame, lo
+convertía a un único objeto bytes CSV y lo pasaba al botón de descarga: el pico de memoria
+era varias veces el tamaño de los datos. Ahora:
+
+1. Se recorre el cursor de Mongo de cada fuente por lotes (DatabaseConnection.iter_telemetry_docs).
+2. Cada lote se normaliza y filtra (mismos checks que load_range_mongo) y se guarda como
+   una parte Parquet en un directorio temporal. Así se conoce la unión de columnas de sensores
+   de todo el rango sin retener las filas.
+3. Las partes se leen de a una y se escriben al CSV (en disco) con el encabezado completo.
+
+La memoria queda acotada por el tamaño de lote, no por el del rango. Las filas salen en el
+orden de los cursores (por fuente, orden natural de la colección), no ordenadas por fecha.
+
+Excel usa el modo write-only de openpyxl (las filas van a disco, no se guarda un objeto por
+celda) y reparte en varias hojas pasado el límite de filas de Excel.
+Parquet y Arrow IPC (Feather) son para análisis: columnares, comprimidos y con device_id /
+location como diccionario. Formatos disponibles en EXPORT_FORMATS.
+
+El backup completo se entrega en partes (export_backup_parts: un archivo por año, o por mes si
+el año supera BACKUP_PART_MAX_BYTES) porque el botón de descarga de Streamlit lee el archivo
+entero a memoria: el pico de la descarga queda acotado por la parte más grande, no por la historia.
+"""
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow viene con streamlit
+    pa = pq = None
+
+from modules.telemetry_normalizer import normalize_documents, timestamp_range_query
+
+# Documentos por lote del cursor (y filas máximas por parte del spool)
+EXPORT_BATCH_SIZE = 5000
+BASE_COLUMNS = ['timestamp', 'device_id', 'location']
+# Filas por hoja de Excel (incluye el encabezado)
+EXCEL_MAX_ROWS = 1_048_576
+# Filas por row group (Parquet) / record batch (Arrow IPC)
+ROW_GROUP_ROWS = 128 * 1024
+# Columnas de texto con pocos valores distintos: se guardan como diccionario en los formatos columnares
+DICTIONARY_COLUMNS = ('device_id', 'location')
+
+
+def iter_range_batches(db, start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None,
+                       batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Lotes normalizados de [start_date, end_date] (hora local), fuente por fuente.
+    Mismo filtro en el servidor y mismos checks finales que load_range_mongo; a diferencia
+    de éste, un error en una fuente se propaga: un backup incompleto no debe pasar por completo.
+    """
+    query = timestamp_range_query(start_date, end_date)
+    if devices:
+        query = {"$and": [query, db.device_filter(devices)]}
+
+    for source in db.sources:
+        if not source.get("coll_telemetry"):
+            continue
+        for raw_docs in db.iter_telemetry_docs(source, query, batch_size):
+            df = normalize_documents(raw_docs)
+            if df.empty:
+                continue
+            keep = (df['timestamp'].notna() & (df['device_id'] != "unknown")
+                    & df['timestamp'].between(start_date, end_date))
+            if devices:
+                keep &= df['device_id'].isin(devices)
+            df = df[keep]
+            if not df.empty:
+                yield df.reset_index(drop=True)
+
+
+class TelemetrySpool:
+    """
+    Lotes normalizados guardados como partes Parquet temporales.
+    `columns` acumula la unión de columnas (base + sensores en orden de aparición);
+    frames() relee las partes de a una con ese esquema completo. Usar como context manager.
+    """
+
+    def __init__(self, tmp_dir: Optional[str] = None):
+        self._tmp = tempfile.TemporaryDirectory(prefix="biofloc_export_", dir=tmp_dir)
+        self.parts: List[Path] = []
+        self.columns: List[str] = []
+        self.rows = 0
+
+    def add(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns.append(col)
+        path = Path(self._tmp.name) / f"part-{len(self.parts):06d}.parquet"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+        self.parts.append(path)
+        self.rows += len(df)
+
+    def ordered_columns(self) -> List[str]:
+        """Columnas base primero y luego los sensores."""
+        base = [c for c in BASE_COLUMNS if c in self.columns]
+        return base + [c for c in self.columns if c not in BASE_COLUMNS]
+
+    def frames(self) -> Iterator[pd.DataFrame]:
+        columns = self.ordered_columns()
+        for path in self.parts:
+            yield pq.read_table(path).to_pandas().reindex(columns=columns)
+
+    def close(self):
+        self._tmp.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool_range(db, start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None,
+                batch_size: int = EXPORT_BATCH_SIZE, tmp_dir: Optional[str] = None) -> TelemetrySpool:
+    """Recorre el rango completo y retorna el spool con todas las partes escritas."""
+    spool = TelemetrySpool(tmp_dir)
+    try:
+        for df in iter_range_batches(db, start_date, end_date, devices, batch_size):
+            spool.add(df)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+def frame_chunks(df: pd.DataFrame, size: int = EXPORT_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """Un DataFrame ya cargado en trozos de `size` filas (mismo esquema), para los writers por lotes."""
+    for start in range(0, len(df), size):
+        yield df.iloc[start:start + size]
+
+
+def write_csv(frames: Iterator[pd.DataFrame], target: Union[str, os.PathLike, BinaryIO]) -> int:
+    """Escribe los frames (mismo esquema) como un CSV UTF-8 en `target` (ruta o archivo binario). Retorna filas."""
+    handle = open(target, "wb") if isinstance(target, (str, os.PathLike)) else target
+    rows, header = 0, True
+    try:
+        for df in frames:
+            df.to_csv(handle, index=False, header=header, encoding="utf-8")
+            header = False
+            rows += len(df)
+    finally:
+        if handle is not target:
+            handle.close()
+    return rows
+
+
+def _excel_rows(df: pd.DataFrame) -> Iterator[tuple]:
+    """Filas como tuplas de valores Python; NaN/NaT quedan como celdas vacías."""
+    values = df.astype(object).where(df.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def write_excel(frames: Iterable[pd.DataFrame], target: Union[str, os.PathLike, BinaryIO],
+                sheet_name: str = "Datos", max_rows: int = EXCEL_MAX_ROWS) -> int:
+    """
+    Escribe los frames (mismo esquema) en un .xlsx con openpyxl write-only. Cada hoja lleva el
+    encabezado y a lo más `max_rows` filas en total; las siguientes van a 'Datos 2', 'Datos 3'...
+    Retorna las filas de datos escritas.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet, columns, in_sheet, sheets, rows = None, None, 0, 0, 0
+    for df in frames:
+        if columns is None:
+            columns = list(df.columns)
+        for row in _excel_rows(df):
+            if sheet is None or in_sheet >= max_rows - 1:
+                sheets += 1
+                sheet = workbook.create_sheet(sheet_name if sheets == 1 else f"{sheet_name} {sheets}")
+                sheet.append(columns)
+                in_sheet = 0
+            sheet.append(row)
+            in_sheet += 1
+            rows += 1
+
+    if sheet is None:
+        # Sin filas: hoja vacía (con encabezado si se conocen las columnas)
+        sheet = workbook.create_sheet(sheet_name)
+        if columns:
+            sheet.append(columns)
+    workbook.save(target)
+    return rows
+
+
+# --- FORMATOS COLUMNARES (analistas: pandas / polars / DuckDB) ---
+def _rebatch(frames: Iterable[pd.DataFrame], rows: int) -> Iterator[pd.DataFrame]:
+    """Junta lotes chicos hasta ~`rows` filas (row groups / record batches de tamaño útil)."""
+    pending, count = [], 0
+    for df in frames:
+        pending.append(df)
+        count += len(df)
+        if count >= rows:
+            yield pd.concat(pending, ignore_index=True)
+            pending, count = [], 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def _arrow_schema(df: pd.DataFrame) -> "pa.Schema":
+    """Esquema Arrow del primer lote, con device_id / location como diccionario (pocos valores distintos)."""
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for col in DICTIONARY_COLUMNS:
+        if col in df.columns:
+            schema = schema.set(schema.get_field_index(col), pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+    return schema
+
+
+def write_parquet(frames: Iterable[pd.DataFrame], target: Union[str, os.PathLike, BinaryIO]) -> int:
+    """
+    Parquet (zstd) con device_id / location codificados como diccionario; se leen como
+    'category' en pandas. Escribe por row groups: la memoria queda acotada por ROW_GROUP_ROWS.
+    """
+    writer, rows = None, 0
+    try:
+        for df in _rebatch(frames, ROW_GROUP_ROWS):
+            if writer is None:
+                schema = _arrow_schema(df)
+                writer = pq.ParquetWriter(target, schema, compression="zstd")
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_arrow(frames: Iterable[pd.DataFrame], target: Union[str, os.PathLike, BinaryIO]) -> int:
+    """
+    Archivo Arrow IPC (= Feather v2, lz4) con device_id / location como diccionario.
+    El formato de archivo admite un solo diccionario por columna más deltas: las categorías se
+    acumulan entre lotes (las nuevas al final) para que cada lote sólo agregue valores.
+    """
+    writer, rows = None, 0
+    categories: Dict[str, List[str]] = {col: [] for col in DICTIONARY_COLUMNS}
+    options = pa.ipc.IpcWriteOptions(compression="lz4", emit_dictionary_deltas=True)
+    try:
+        for df in _rebatch(frames, ROW_GROUP_ROWS):
+            if writer is None:
+                schema = _arrow_schema(df)
+                writer = pa.ipc.new_file(target, schema, options=options)
+            for col, known in categories.items():
+                if col in df.columns:
+                    seen = set(known)
+                    known.extend(v for v in pd.unique(df[col].dropna()) if v not in seen)
+                    df[col] = pd.Categorical(df[col], categories=known)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+@dataclass
+class ExportFormat:
+    label: str
+    extension: str
+    mime: str
+    writer: Callable[[Iterable[pd.DataFrame], Union[str, os.PathLike, BinaryIO]], int]
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    "csv": ExportFormat("CSV", "csv", "text/csv", write_csv),
+    "xlsx": ExportFormat("Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_excel),
+    "parquet": ExportFormat("Parquet", "parquet", "application/vnd.apache.parquet", write_parquet),
+    "arrow": ExportFormat("Arrow IPC (Feather)", "arrow", "application/vnd.apache.arrow.file", write_arrow),
+}
+
+
+def export_range(db, start_date: datetime, end_date: datetime, target: Union[str, os.PathLike, BinaryIO],
+                 fmt: str = "csv", devices: Optional[List[str]] = None, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """
+    Exporta [start_date, end_date] a `target` en el formato `fmt` (ver EXPORT_FORMATS) con memoria
+    acotada. Retorna las filas escritas (0 si no hay datos: en ese caso no se escribe nada).
+    """
+    export_format = EXPORT_FORMATS[fmt]
+    with spool_range(db, start_date, end_date, devices, batch_size) as spool:
+        if not spool.rows:
+            return 0
+        rows = export_format.writer(spool.frames(), target)
+    print(f"[telemetry_export] {export_format.label}: {rows} filas, {len(spool.ordered_columns())} columnas, "
+          f"{len(spool.parts)} partes")
+    return rows
+
+
+def export_csv(db, start_date: datetime, end_date: datetime, target: Union[str, os.PathLike, BinaryIO],
+               devices: Optional[List[str]] = None, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    return export_range(db, start_date, end_date, target, "csv", devices, batch_size)
+
+
+def export_excel(db, start_date: datetime, end_date: datetime, target: Union[str, os.PathLike, BinaryIO],
+                 devices: Optional[List[str]] = None, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Como export_csv, pero a .xlsx (varias hojas pasado el límite de filas)."""
+    return export_range(db, start_date, end_date, target, "xlsx", devices, batch_size)
+
+
+# Tope por archivo del backup: st.download_button carga el archivo completo en memoria para
+# servirlo, así que el backup se entrega en partes y ésta es la memoria máxima de la descarga.
+BACKUP_PART_MAX_BYTES = int(float(os.getenv("TELEMETRY_BACKUP_PART_MAX_MB", "200")) * 1024 * 1024)
+
+
+@dataclass
+class BackupPart:
+    label: str
+    path: Path
+    rows: int
+
+    @property
+    def size(self) -> int:
+        return self.path.stat().st_size
+
+
+def _month_starts(start: datetime, end: datetime, months: int) -> Iterator[datetime]:
+    current = datetime(start.year, start.month, 1)
+    while current <= end:
+        yield current
+        index = current.month - 1 + months
+        current = datetime(current.year + index // 12, index % 12 + 1, 1)
+
+
+def _periods(start: datetime, end: datetime, months: int) -> Iterator[tuple]:
+    """Tramos [inicio, fin] de `months` meses calendario (12 = por año) recortados a [start, end]."""
+    for period_start in _month_starts(start, end, months):
+        index = period_start.month - 1 + months
+        next_start = datetime(period_start.year + index // 12, index % 12 + 1, 1)
+        fmt = "%Y" if months == 12 else "%Y-%m"
+        yield (period_start.strftime(fmt), max(start, period_start),
+               min(end, next_start - timedelta(microseconds=1)))
+
+
+def export_backup_parts(db, start_date: datetime, end_date: datetime, directory: Union[str, os.PathLike],
+                        fmt: str = "csv", max_bytes: int = BACKUP_PART_MAX_BYTES,
+                        batch_size: int = EXPORT_BATCH_SIZE) -> List[BackupPart]:
+    """
+    Backup de [start_date, end_date] en `directory`, un archivo por año. Un año que supera
+    `max_bytes` se rehace por mes; un mes solo no se divide más (puede quedar sobre el tope).
+    Los períodos sin datos no generan archivo.
+    """
+    export_format = EXPORT_FORMATS[fmt]
+    directory = Path(directory)
+    parts: List[BackupPart] = []
+    for year, year_start, year_end in _periods(start_date, end_date, 12):
+        path = directory / f"backup_{year}.{export_format.extension}"
+        rows = export_range(db, year_start, year_end, path, fmt, batch_size=batch_size)
+        if not rows:
+            continue
+        part = BackupPart(year, path, rows)
+        if part.size <= max_bytes:
+            parts.append(part)
+            continue
+        path.unlink()
+        for month, month_start, month_end in _periods(year_start, year_end, 1):
+            path = directory / f"backup_{month}.{export_format.extension}"
+            rows = export_range(db, month_start, month_end, path, fmt, batch_size=batch_size)
+            if rows:
+                parts.append(BackupPart(month, path, rows))
+    return parts
@@ -0,0 +1,305 @@
+"""
+Normalizador COLUMNAR de telemetría para cargas masivas.
+
+Produce el mismo DataFrame plano que
+    db._parse_historical_flat([db._normalize_document(d) for d in raw_docs])
+pero sin pasar documento por documento por pandas:
+- Los timestamps se agrupan por formato (Date, epoch, ISO) y se parsean en UNA pasada vectorizada por grupo.
+- Los nombres de sensores se resuelven con el registro de alias compartido (resolve_sensor_name).
+- Los valores se escriben directo en arreglos NumPy por columna.
+
+Los casos raros que no calzan con el camino rápido (strings no ISO, tipos inesperados)
+se delegan a la lógica escalar original para mantener resultados idénticos.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from modules.sensor_registry import resolve_sensor_name
+
+# Zona horaria fija de Chile usada por _normalize_document (UTC-3)
+CHILE_TZ = timezone(timedelta(hours=-3))
+
+# ISO que datetime.fromisoformat y pandas interpretan igual (3.10+):
+# fecha + hora, fracción de 3 o 6 dígitos, offset opcional ±HH:MM o Z.
+_ISO_FAST = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{3}|\.\d{6})?)?(?:Z|[+-]\d{2}:\d{2})?$")
+_ISO_HAS_OFFSET = re.compile(r"(?:Z|[+-]\d{2}:\d{2})$")
+
+# Offsets ISO con cota EXACTA propia en las consultas por rango (UTC y Chile verano/invierno).
+# Cualquier otro offset usa el rango posible completo (-12h a +14h) y se filtra exacto en Python.
+KNOWN_ISO_OFFSETS = {"Z": timedelta(0), "+00:00": timedelta(0), "-03:00": timedelta(hours=-3), "-04:00": timedelta(hours=-4)}
+_ISO_OFFSET_SPAN = (timedelta(hours=-12), timedelta(hours=14))
+# Fecha y hora de un string ISO (el separador se fija por cláusula: ' ' < 'T' al comparar strings)
+_ISO_WALL_PATTERN = r"^\d{{4}}-\d{{2}}-\d{{2}}{sep}[\d:.]+"
+# Strings que NO cubren las cotas exactas (offset sin ':' como -0300, sólo fecha, etc.):
+# van en una banda amplia de +/- FALLBACK_STRING_MARGIN como antes y se filtran en Python.
+_ISO_EXACT_SHAPES = r"^(?!\d{4}-\d{2}-\d{2}[T ][\d:.]+(?:Z|[+-]\d{2}:\d{2})?$)"
+FALLBACK_STRING_MARGIN = timedelta(days=2)
+
+
+def now_chile() -> datetime:
+    """Hora actual de Chile (UTC-3) sin zona, mismo criterio que los timestamps normalizados."""
+    return datetime.now(timezone.utc).astimezone(CHILE_TZ).replace(tzinfo=None)
+
+
+def _scalar_timestamp(raw_ts: Any) -> Optional[datetime]:
+    """Camino lento: réplica exacta del parseo de _normalize_document para un valor."""
+    final_ts = None
+    try:
+        if isinstance(raw_ts, (int, float)):
+            if raw_ts > 1e11:
+                final_ts = pd.to_datetime(raw_ts, unit='ms', utc=True).to_pydatetime()
+            else:
+                final_ts = pd.to_datetime(raw_ts, unit='s', utc=True).to_pydatetime()
+        elif isinstance(raw_ts, str):
+            try:
+                final_ts = datetime.fromisoformat(raw_ts)
+            except ValueError:
+                final_ts = pd.to_datetime(raw_ts, errors='coerce', utc=True)
+                if pd.isna(final_ts): final_ts = None
+                else: final_ts = final_ts.to_pydatetime()
+        elif isinstance(raw_ts, datetime):
+            final_ts = raw_ts
+            if final_ts.tzinfo is None:
+                final_ts = final_ts.replace(tzinfo=timezone.utc)
+    except Exception:
+        final_ts = None
+
+    if final_ts is not None and final_ts.tzinfo is not None:
+        final_ts = final_ts.astimezone(CHILE_TZ).replace(tzinfo=None)
+    return final_ts
+
+
+def _to_us(values: pd.DatetimeIndex) -> np.ndarray:
+    """datetime64[us] truncando nanosegundos, igual que el paso por datetime de Python."""
+    return values.floor("us").as_unit("us").values
+
+
+def _to_local_naive(values: pd.DatetimeIndex) -> np.ndarray:
+    """UTC aware -> hora de Chile sin zona (datetime64[us])."""
+    return _to_us(values.tz_convert(CHILE_TZ).tz_localize(None))
+
+
+def parse_timestamps(raw_values: List[Any]) -> np.ndarray:
+    """
+    Parsea una lista de timestamps crudos (Date, epoch s/ms, ISO con o sin offset, {'$date': ...})
+    a datetime64[us] en hora local de Chile sin zona. Inválidos -> NaT.
+    """
+    n = len(raw_values)
+    out = np.full(n, np.datetime64("NaT"), dtype="datetime64[us]")
+
+    dt_idx, dt_vals = [], []
+    num_idx, num_vals = [], []
+    iso_idx, iso_vals = [], []
+    slow_idx = []
+
+    for i, raw in enumerate(raw_values):
+        if isinstance(raw, dict) and "$date" in raw:
+            raw = raw["$date"]
+            raw_values[i] = raw
+        if isinstance(raw, datetime):
+            dt_idx.append(i); dt_vals.append(raw)
+        elif isinstance(raw, (int, float)):
+            num_idx.append(i); num_vals.append(raw)
+        elif isinstance(raw, str):
+            if _ISO_FAST.match(raw):
+                iso_idx.append(i); iso_vals.append(raw)
+            else:
+                slow_idx.append(i)
+        # Otros tipos (None, listas...) quedan en NaT
+
+    # 1. Objetos Date: naive se asume UTC (igual que el adapter escalar)
+    if dt_idx:
+        parsed = pd.to_datetime(dt_vals, utc=True, errors='coerce')
+        out[dt_idx] = _to_local_naive(pd.DatetimeIndex(parsed))
+
+    # 2. Epoch: > 1e11 se interpreta en milisegundos, si no en segundos
+    if num_idx:
+        arr = np.asarray(num_vals, dtype="float64")
+        idx = np.asarray(num_idx)
+        is_ms = arr > 1e11
+        for mask, unit in ((is_ms, "ms"), (~is_ms, "s")):
+            if mask.any():
+                parsed = pd.to_datetime(arr[mask], unit=unit, utc=True, errors='coerce')
+                out[idx[mask]] = _to_local_naive(pd.DatetimeIndex(parsed))
+
+    # 3. ISO: con offset -> se convierte a Chile; sin offset -> se respeta como hora local
+    if iso_idx:
+        s = pd.Series(iso_vals, index=iso_idx, dtype="object")
+        has_offset = s.str.contains(_ISO_HAS_OFFSET)
+        aware, naive = s[has_offset], s[~has_offset]
+        if not aware.empty:
+            parsed = pd.to_datetime(aware, format="ISO8601", utc=True, errors='coerce')
+            out[aware.index.to_numpy()] = _to_local_naive(pd.DatetimeIndex(parsed))
+        if not naive.empty:
+            parsed = pd.to_datetime(naive, format="ISO8601", errors='coerce')
+            out[naive.index.to_numpy()] = _to_us(pd.DatetimeIndex(parsed))
+
+    # 4. Strings no estándar: lógica escalar original
+    for i in slow_idx:
+        ts = _scalar_timestamp(raw_values[i])
+        if ts is not None:
+            out[i] = np.datetime64(ts, "us")
+
+    return out
+
+
+def _other_offsets_pattern() -> str:
+    """Regex del sufijo de strings con un offset que NO está en KNOWN_ISO_OFFSETS."""
+    alternatives = []
+    for sign in "+-":
+        known = [o[1:] for o in KNOWN_ISO_OFFSETS if o.startswith(sign)]
+        lookahead = f"(?!{'|'.join(known)})" if known else ""
+        alternatives.append(f"\\{sign}{lookahead}\\d{{2}}:\\d{{2}}")
+    return f"(?:{'|'.join(alternatives)})"
+
+
+def timestamp_range_query(start: datetime, end: datetime) -> Dict[str, Any]:
+    """
+    Filtro Mongo para timestamps en [start, end] (hora de Chile sin zona, como los entrega
+    parse_timestamps) con cotas calculadas por variante de esquema, sin ensanchar el rango:
+    - Date (aware o naive al escribirse; BSON siempre guarda UTC): [start, end] llevado a UTC.
+    - ISO sin offset (ya es hora local): el mismo rango como string.
+    - ISO con offset conocido: rango de la hora de pared correspondiente a ese offset.
+    - ISO con otro offset: rango ampliado al peor caso de offset (superconjunto acotado).
+    - Otros strings (offset sin ':' como -0300, sólo fecha): banda lexicográfica ampliada en
+      FALLBACK_STRING_MARGIN por lado, como la consulta original.
+    Los strings se comparan al minuto (ISO puede omitir los segundos), así que el resultado
+    es un superconjunto de a lo más un minuto por borde: el filtro exacto final sigue en Python.
+    """
+    utc_start = start.replace(tzinfo=CHILE_TZ).astimezone(timezone.utc)
+    utc_end = end.replace(tzinfo=CHILE_TZ).astimezone(timezone.utc)
+    clauses = [{"timestamp": {"$gte": utc_start, "$lte": utc_end}}]
+
+    def string_range(wall_start: datetime, wall_end: datetime, suffix: str):
+        wall_start, wall_end = wall_start.replace(tzinfo=None), wall_end.replace(tzinfo=None)
+        for sep in ("T", " "):
+            clauses.append({"timestamp": {
+                "$gte": wall_start.isoformat(sep, timespec="minutes"),
+                "$lte": wall_end.isoformat(sep, timespec="minutes") + "~",
+                "$regex": _ISO_WALL_PATTERN.format(sep=sep) + suffix + "$",
+            }})
+
+    string_range(start, end, "")
+    by_offset: Dict[timedelta, List[str]] = {}
+    for suffix, offset in KNOWN_ISO_OFFSETS.items():
+        by_offset.setdefault(offset, []).append(re.escape(suffix))
+    for offset, suffixes in by_offset.items():
+        string_range(utc_start + offset, utc_end + offset, f"(?:{'|'.join(suffixes)})")
+    string_range(utc_start + _ISO_OFFSET_SPAN[0], utc_end + _ISO_OFFSET_SPAN[1], _other_offsets_pattern())
+    clauses.append({"timestamp": {
+        "$gte": (start - FALLBACK_STRING_MARGIN).isoformat(),
+        "$lte": (end + FALLBACK_STRING_MARGIN).isoformat(),
+        "$regex": _ISO_EXACT_SHAPES,
+    }})
+
+    return {"$or": clauses}
+
+
+def flatten_sensor_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Réplica en Python de la proyección plana del servidor (DatabaseConnection.FLAT_SENSORS_EXPR):
+    mismos campos y sensores como escalares. Se usa en tests y benchmarks sin mongod.
+    """
+    flat = {}
+    for key, value in (doc.get("sensors") or doc.get("datos") or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[key] = value
+        elif isinstance(value, dict) and value.get("value") is not None:
+            try:
+                flat[key] = float(value["value"])
+            except (ValueError, TypeError):
+                continue
+
+    out = {f: doc[f] for f in ("_id", "timestamp", "device_id", "dispositivo_id", "location") if f in doc}
+    metadata = doc.get("metadata")
+    if isinstance(metadata, dict) and "device_id" in metadata:
+        out["metadata"] = {"device_id": metadata["device_id"]}
+    out["sensors"] = flat
+    return out
+
+
+def normalize_documents(raw_docs: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Convierte un lote de documentos CRUDOS de telemetría en el DataFrame plano
+    (timestamp, device_id, location, <sensores>...) que produce _parse_historical_flat.
+    """
+    docs = raw_docs if isinstance(raw_docs, list) else list(raw_docs)
+    n = len(docs)
+    if n == 0:
+        return pd.DataFrame()
+
+    device_ids = [None] * n
+    locations = [None] * n
+    raw_ts = [None] * n
+    sensor_cols: Dict[str, np.ndarray] = {}
+
+    for i, doc in enumerate(docs):
+        dev_id = doc.get("device_id") or doc.get("dispositivo_id")
+        if not dev_id:
+            dev_id = doc.get("metadata", {}).get("device_id", "unknown")
+        device_ids[i] = dev_id
+
+        loc = doc.get("location")
+        locations[i] = loc if loc else doc.get("ubicacion", "Sin Asignar")
+
+        raw_ts[i] = doc.get("timestamp")
+
+        sensors = doc.get("sensors") or doc.get("datos") or {}
+        for key, value in sensors.items():
+            if isinstance(value, dict):
+                value = value.get("value")
+            elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                continue
+
+            col = resolve_sensor_name(key)
+            arr = sensor_cols.get(col)
+            if arr is None:
+                arr = np.full(n, np.nan)
+                sensor_cols[col] = arr
+            arr[i] = value
+
+    data = {
+        "timestamp": parse_timestamps(raw_ts),
+        "device_id": device_ids,
+        "location": locations,
+    }
+    for col, arr in sensor_cols.items():
+        if col not in data:
+            data[col] = arr
+    return pd.DataFrame(data)
+
+
+def normalize_sensor_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Nombres de columnas de sensores al nombre estándar (resolve_sensor_name) en un DataFrame plano.
+    Si dos columnas resuelven al mismo sensor se combinan (gana el valor de la primera no nula).
+    """
+    if df.empty:
+        return df
+
+    targets: Dict[str, List[str]] = {}
+    for col in df.columns:
+        name = resolve_sensor_name(col) if isinstance(col, str) else col
+        targets.setdefault(name, []).append(col)
+    if all(cols == [name] for name, cols in targets.items()):
+        return df
+
+    data = {}
+    for name, cols in targets.items():
+        # La columna ya estándar manda; las variantes sólo rellenan sus huecos
+        cols = sorted(cols, key=lambda c: c != name)
+        series = df[cols[0]]
+        for col in cols[1:]:
+            series = series.combine_first(df[col])
+        data[name] = series
+    return pd.DataFrame(data, index=df.index)
@@ -0,0 +1,340 @@
+"""
+Repositorio ÚNICO de telemetría normalizada por proceso (Gráficas + Datos).
+
+Antes cada vista consultaba Mongo por su cuenta y guardaba su propia copia de los mismos datos:
+Gráficas la última semana (caché incremental) y Datos cada rango pedido (st.cache_data, una
+copia serializada por consulta). Ahora ambas vistas leen de acá:
+
+- Tramo reciente: la caché incremental (modules/history_cache.py) de la última semana.
+  Cualquier rango que caiga dentro se sirve recortando ese DataFrame, sin ir a Mongo.
+- Tramo antiguo: lo anterior a la ventana se carga por días completos (Parquet en disco +
+  Mongo para los días que faltan) y queda en un LRU de rangos con TTL y tope de memoria.
+  Un rango más chico dentro de uno ya cargado se sirve desde memoria.
+- Una sola copia del tramo reciente: cada lote se prepara al llegar (alias de sensores +
+  disposición compacta de modules/history_layout.py) y se anexa al frame compacto. Las vistas
+  aplican sus filtros propios (ej. outliers en Gráficas) sobre la ventana que muestran.
+
+memory_report() y stats exponen la memoria ocupada y cuánto se reutilizó.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from modules.history_cache import IncrementalHistoryCache
+from modules.history_layout import expand_history, prepare_history
+from modules.parquet_store import contiguous_runs, day_floor, get_telemetry_store
+from modules.telemetry_normalizer import normalize_documents, timestamp_range_query
+
+# Ventana del tramo reciente (la semana de Gráficas + margen)
+RECENT_WINDOW = timedelta(weeks=1, hours=1)
+# Rangos antiguos: vigencia y memoria máxima retenida (los más viejos en uso salen primero)
+RANGE_TTL_SECONDS = 3600.0
+MAX_RANGE_BYTES = 512 * 1024 * 1024
+
+# Registro de métricas por fuente de cada consulta a Mongo (load_range_mongo):
+# docs transferidos, rechazados por etapa, filas que quedan y tiempo de cada etapa.
+LOAD_METRIC_FIELDS = ("fetched", "timestamp_invalid", "device_filter", "out_of_range", "kept",
+                      "query_s", "normalize_s", "filter_s")
+
+
+# =============================================================================
+# CARGA DESDE MONGO / DISCO
+# =============================================================================
+def load_range_mongo(db, start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None,
+                     metrics: Optional[List[Dict[str, Any]]] = None):
+    """
+    Consulta MongoDB (todas las fuentes en paralelo) para [start_date, end_date] en hora local.
+    Estrategia: cotas exactas en UTC por variante de timestamp (Date, ISO con/sin offset),
+    ver timestamp_range_query, y el filtro de dispositivos (los 3 esquemas de ID) en el servidor.
+    El filtro exacto final en hora local se mantiene.
+    Retorna (DataFrame normalizado y filtrado, completo) donde completo=False si alguna fuente falló.
+    Si se pasa `metrics`, agrega un registro por fuente (ver LOAD_METRIC_FIELDS).
+    """
+    # Mismo filtro para todas las fuentes: tiempo y, si hay selección, dispositivos
+    query = timestamp_range_query(start_date, end_date)
+    if devices:
+        query = {"$and": [query, db.device_filter(devices)]}
+    
+    source_frames = []
+    complete = True
+
+    def load_source(source):
+        source_name = source.get('name', 'Unknown')
+        record = dict.fromkeys(LOAD_METRIC_FIELDS, 0)
+        record.update(source=source_name, ok=False, start=start_date, end=end_date, devices=len(devices or ()))
+        try:
+            # Sensores aplanados en el servidor (fallback a find() con subdocumentos completos)
+            t0 = time.perf_counter()
+            raw_docs = db.fetch_telemetry_docs(source, query)
+            t1 = time.perf_counter()
+
+            # Normalización en bloque (columnar): timestamps ya quedan en hora local de Chile sin zona
+            source_df = normalize_documents(raw_docs)
+            t2 = time.perf_counter()
+            record.update(fetched=len(raw_docs), query_s=t1 - t0, normalize_s=t2 - t1)
+
+            if not source_df.empty:
+                # Check 1: Timestamp y device_id válidos
+                valid_ts = source_df['timestamp'].notna() & (source_df['device_id'] != "unknown")
+
+                # Check 2: Dispositivos (el servidor ya filtró; quedan sólo docs con IDs ambiguos entre esquemas)
+                in_devices = source_df['device_id'].isin(devices) if devices else pd.Series(True, index=source_df.index)
+
+                # Check 3: Filtro FINAL EXACTO
+                in_range = source_df['timestamp'].between(start_date, end_date)
+                keep = valid_ts & in_devices & in_range
+                record.update(
+                    timestamp_invalid=int((~valid_ts).sum()),
+                    device_filter=int((valid_ts & ~in_devices).sum()),
+                    out_of_range=int((valid_ts & in_devices & ~in_range).sum()),
+                )
+                source_df = source_df[keep]
+
+            record.update(kept=len(source_df), filter_s=time.perf_counter() - t2, ok=True)
+            return source_df
+        except Exception as e:
+            print(f"[telemetry_repository] ERROR en {source_name}: {e}")
+            return None
+        finally:
+            if metrics is not None:
+                metrics.append(record)
+            print(f"[telemetry_repository] Fuente '{source_name}': {format_load_metrics(record)}")
+
+    # Ejecución Paralela
+    with ThreadPoolExecutor(max_workers=len(db.sources)) as executor:
+        futures = [executor.submit(load_source, s) for s in db.sources]
+        for f in as_completed(futures):
+            source_df = f.result()
+            if source_df is None:
+                complete = False
+            elif not source_df.empty:
+                source_frames.append(source_df)
+
+    df = pd.concat(source_frames, ignore_index=True) if source_frames else pd.DataFrame()
+    return df, complete
+
+
+def format_load_metrics(record: Dict[str, Any]) -> str:
+    """Resumen de una línea de un registro de métricas de carga."""
+    return (f"{record['fetched']} docs de Mongo ({record['query_s']:.2f}s) -> normalizados ({record['normalize_s']:.2f}s) -> "
+            f"{record['kept']} válidos | rechazados: device_filter={record['device_filter']}, "
+            f"timestamp_invalid={record['timestamp_invalid']}, out_of_range={record['out_of_range']}"
+            f"{'' if record['ok'] else ' | ERROR'}")
+
+
+def load_range(db, start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None,
+               metrics: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Filas normalizadas de [start_date, end_date] (hora local).
+    Los días cerrados salen de la caché Parquet en disco; Mongo sólo se consulta por los
+    días que faltan (que se guardan para la próxima vez) y por el tramo abierto (hoy).
+    `metrics` recibe los registros por fuente de cada consulta a Mongo.
+    """
+    store = get_telemetry_store(db)
+    if store is None:
+        df, _ = load_range_mongo(db, start_date, end_date, devices, metrics)
+        return df
+
+    frames = []
+    cached_days, missing_days, open_from = store.plan(start_date, end_date)
+    
+    # 1. Días cerrados en disco
+    if cached_days:
+        frames.append(store.read_days(cached_days, devices))
+    
+    # 2. Días cerrados faltantes: se traen COMPLETOS (todos los dispositivos) y se guardan
+    for first_day, last_day in contiguous_runs(missing_days):
+        day_end = last_day + timedelta(days=1) - timedelta(microseconds=1)
+        days_df, complete = load_range_mongo(db, first_day, day_end, metrics=metrics)
+        if complete:
+            store.write_days(days_df, [d for d in missing_days if first_day <= d <= last_day])
+        if devices and not days_df.empty:
+            days_df = days_df[days_df['device_id'].isin(devices)]
+        frames.append(days_df)
+    
+    # 3. Tramo abierto: siempre desde Mongo
+    if open_from is not None:
+        open_df, _ = load_range_mongo(db, open_from, end_date, devices, metrics)
+        frames.append(open_df)
+    
+    frames = [f for f in frames if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not df.empty:
+        df = df[df['timestamp'].between(start_date, end_date)]
+    print(f"[telemetry_repository] Caché en disco: {len(cached_days)} días leídos, {len(missing_days)} días descargados, "
+          f"tramo abierto desde {open_from}")
+    return df
+
+
+# =============================================================================
+# REPOSITORIO
+# =============================================================================
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Memoria real de un DataFrame (incluye los strings de columnas object)."""
+    return int(df.memory_usage(index=True, deep=True).sum()) if not df.empty else 0
+
+
+def slice_frame(df: pd.DataFrame, start: datetime, end: datetime, devices: Optional[List[str]] = None,
+                end_inclusive: bool = True) -> pd.DataFrame:
+    """Filas de df con timestamp en [start, end] (o [start, end) si end_inclusive=False) y de los dispositivos pedidos."""
+    if df.empty:
+        return df
+    ts = df['timestamp']
+    mask = (ts >= start) & ((ts <= end) if end_inclusive else (ts < end))
+    if devices:
+        mask &= df['device_id'].isin(devices)
+    return df[mask]
+
+
+class TelemetryRepository:
+
+    def __init__(
+        self,
+        window: timedelta = RECENT_WINDOW,
+        min_refresh_seconds: float = 60.0,
+        range_ttl_seconds: float = RANGE_TTL_SECONDS,
+        max_range_bytes: int = MAX_RANGE_BYTES,
+        persist: bool = True,
+    ):
+        """
+        window: antigüedad del tramo reciente mantenido al día con deltas.
+        range_ttl_seconds / max_range_bytes: vigencia y tope de memoria de los rangos antiguos.
+        persist: usar la caché Parquet en disco.
+        """
+        self.recent_cache = IncrementalHistoryCache(window=window, prepare=prepare_history,
+                                                    min_refresh_seconds=min_refresh_seconds, persist=persist)
+        self.range_ttl_seconds = range_ttl_seconds
+        self.max_range_bytes = max_range_bytes
+        self.persist = persist
+
+        self._lock = threading.Lock()
+        # (día_inicio, día_fin_exclusivo, dispositivos|None) -> {"df", "bytes", "loaded_at"}
+        self._ranges: "OrderedDict[Tuple[datetime, datetime, Optional[frozenset]], Dict[str, Any]]" = OrderedDict()
+        self.stats = {
+            "recent_reads": 0, "range_hits": 0, "range_loads": 0,
+            "rows_from_memory": 0, "rows_loaded": 0, "docs_fetched": 0,
+        }
+        # Registros por fuente (LOAD_METRIC_FIELDS) de la última carga que fue a Mongo
+        self.last_load_metrics: List[Dict[str, Any]] = []
+
+    # --- TRAMO RECIENTE ---
+    def recent(self, db, force: bool = False) -> pd.DataFrame:
+        """Última semana (refrescada con deltas) en la disposición compacta, la única copia en memoria."""
+        df = self.recent_cache.get(db, force=force)
+        self.stats["recent_reads"] += 1
+        self.stats["rows_from_memory"] += len(df)
+        return df
+
+    # --- RANGOS ARBITRARIOS ---
+    def get_range(self, db, start: datetime, end: datetime, devices: Optional[List[str]] = None,
+                  force: bool = False) -> pd.DataFrame:
+        """Filas de [start, end] (hora local sin zona) de los dispositivos pedidos (None = todos)."""
+        if start.tzinfo: start = start.replace(tzinfo=None)
+        if end.tzinfo: end = end.replace(tzinfo=None)
+
+        recent = self.recent_cache.get(db, force=force)
+        recent_from = self.recent_cache.covered_from
+        # Lo antiguo se carga por días completos hasta el día en que empieza el tramo reciente
+        # (se traslapa con él); desde ahí en adelante sirve el tramo reciente en memoria.
+        split = end if recent_from is None else min(end, recent_from)
+        older_end = day_floor(split) + timedelta(days=1)
+
+        parts = []
+        if start < older_end and (recent_from is None or start < recent_from):
+            older = self._older_range(db, day_floor(start), older_end, devices)
+            parts.append(slice_frame(older, start, min(end, older_end), devices, end_inclusive=end < older_end))
+        else:
+            older_end = start
+        if recent_from is not None and end >= older_end:
+            # Mismos tipos que el tramo antiguo (float64 con la lectura original, no el float32 de Gráficas)
+            part = expand_history(slice_frame(recent, older_end, end, devices))
+            self.stats["rows_from_memory"] += len(part)
+            parts.append(part)
+
+        parts = [p for p in parts if not p.empty]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    def _older_range(self, db, day_start: datetime, day_end: datetime, devices: Optional[List[str]]) -> pd.DataFrame:
+        """Días completos [day_start, day_end) desde el LRU, o cargados de disco/Mongo."""
+        wanted = frozenset(devices) if devices else None
+        now = time.time()
+        with self._lock:
+            for key in list(self._ranges):
+                entry = self._ranges[key]
+                if now - entry["loaded_at"] > self.range_ttl_seconds:
+                    del self._ranges[key]
+                    continue
+                lo, hi, devs = key
+                if lo <= day_start and day_end <= hi and (devs is None or (wanted is not None and wanted <= devs)):
+                    self._ranges.move_to_end(key)
+                    self.stats["range_hits"] += 1
+                    self.stats["rows_from_memory"] += len(entry["df"])
+                    return entry["df"]
+
+        metrics: List[Dict[str, Any]] = []
+        df = load_range(db, day_start, day_end - timedelta(microseconds=1), devices, metrics)
+        size = frame_bytes(df)
+        with self._lock:
+            self.stats["range_loads"] += 1
+            self.stats["rows_loaded"] += len(df)
+            self.stats["docs_fetched"] += sum(m["fetched"] for m in metrics)
+            if metrics:
+                self.last_load_metrics = metrics
+            # Un rango más grande que el tope (ej. backup completo) se entrega pero no se retiene
+            if size <= self.max_range_bytes:
+                self._ranges[(day_start, day_end, wanted)] = {"df": df, "bytes": size, "loaded_at": now}
+                total = sum(e["bytes"] for e in self._ranges.values())
+                while total > self.max_range_bytes:
+                    _, evicted = self._ranges.popitem(last=False)
+                    total -= evicted["bytes"]
+        return df
+
+    # --- MANTENCIÓN ---
+    def invalidate(self):
+        """Botón "Actualizar": olvida los rangos antiguos y el tramo reciente se refresca en la próxima lectura."""
+        self.recent_cache.expire()
+        with self._lock:
+            self._ranges.clear()
+
+    def reset(self):
+        """Olvida todo lo que está en memoria (la caché en disco se mantiene)."""
+        self.recent_cache.reset()
+        with self._lock:
+            self._ranges.clear()
+
+    def memory_report(self) -> Dict[str, int]:
+        """Bytes y filas en memoria por componente (el tramo reciente es el frame compacto guardado)."""
+        recent = self.recent_cache.snapshot()
+        with self._lock:
+            ranges = list(self._ranges.values())
+        report = {
+            "recent_rows": len(recent),
+            "recent_bytes": frame_bytes(recent),
+            "range_entries": len(ranges),
+            "range_rows": sum(len(e["df"]) for e in ranges),
+            "range_bytes": sum(e["bytes"] for e in ranges),
+        }
+        report["total_bytes"] = report["recent_bytes"] + report["range_bytes"]
+        return report
+
+
+# =============================================================================
+# INSTANCIA COMPARTIDA POR PROCESO
+# =============================================================================
+_REPOSITORY: Optional[TelemetryRepository] = None
+_REPOSITORY_LOCK = threading.Lock()
+
+
+def get_telemetry_repository() -> TelemetryRepository:
+    """Repositorio compartido por todas las sesiones y vistas del proceso."""
+    global _REPOSITORY
+    with _REPOSITORY_LOCK:
+        if _REPOSITORY is None:
+            _REPOSITORY = TelemetryRepository()
+        return _REPOSITORY
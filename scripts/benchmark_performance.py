@@ -0,0 +1,667 @@
+"""
+Benchmarks de rendimiento para Biofloc Monitor.
+Compara los caminos de consulta actuales contra los anteriores sobre un fixture sintético.
+
+Uso:
+    python -m scripts.benchmark_performance latest [--devices 60] [--uri mongodb://localhost:27017]
+    python -m scripts.benchmark_performance fallback [--devices 60]
+    python -m scripts.benchmark_performance normalize [--docs 100000]
+    python -m scripts.benchmark_performance incremental [--devices 60]
+    python -m scripts.benchmark_performance projection [--uri mongodb://localhost:27017]
+    python -m scripts.benchmark_performance decimation [--devices 4]
+    python -m scripts.benchmark_performance parquet [--uri mongodb://localhost:27017]
+    python -m scripts.benchmark_performance excel [--docs 100000]
+    python -m scripts.benchmark_performance formats [--docs 100000]
+    python -m scripts.benchmark_performance sessions [--devices 60] [--seconds 5]
+    python -m scripts.benchmark_performance health [--devices 500]
+    python -m scripts.benchmark_performance layout [--docs 1000000] [--devices 60]
+
+Sin --uri se usa mongomock (pip install mongomock) como fixture en memoria.
+Con --uri se usa un mongod local; el fixture se crea en la base 'biofloc_benchmark' y se borra al final.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pandas as pd
+
+# Add root to pythonpath
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.database import DatabaseConnection
+
+FIXTURE_DB = "biofloc_benchmark"
+FIXTURE_TELEMETRY = "telemetria"
+FIXTURE_DEVICES = "devices"
+
+
+# =============================================================================
+# FIXTURE
+# =============================================================================
+
+def get_fixture_client(uri=None):
+    """Cliente para el fixture: mongod local si hay URI, si no mongomock."""
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri, tz_aware=True)
+    try:
+        import mongomock
+    except ImportError:
+        print("[ERROR] Sin --uri se requiere mongomock (pip install mongomock)")
+        sys.exit(1)
+    return mongomock.MongoClient(tz_aware=True)
+
+
+def seed_telemetry(client, n_devices=60, chatty=3, chatty_docs=1500, quiet_docs=20, seed=42):
+    """
+    Genera telemetría mixta (esquema propio + partner) para n_devices dispositivos.
+    Los primeros `chatty` dispositivos reportan cada segundo y copan la ventana reciente;
+    el resto reporta cada 10 minutos. Todos quedan registrados en la colección de dispositivos.
+    """
+    rnd = random.Random(seed)
+    database = client[FIXTURE_DB]
+    database[FIXTURE_TELEMETRY].delete_many({})
+    database[FIXTURE_DEVICES].delete_many({})
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(n_devices):
+        dev_id = f"BENCH-{i:03d}"
+        is_chatty = i < chatty
+        n_docs = chatty_docs if is_chatty else quiet_docs
+        step = timedelta(seconds=1) if is_chatty else timedelta(minutes=10)
+        # Los dispositivos silenciosos terminan antes que la ráfaga de los 'chatty'
+        end = now if is_chatty else now - timedelta(hours=1, minutes=i)
+
+        for k in range(n_docs):
+            ts = end - step * k
+            temp = round(28 + rnd.uniform(-2, 2), 2)
+            ph = round(7.5 + rnd.uniform(-0.3, 0.3), 2)
+            if i % 2 == 0:
+                docs.append({
+                    "device_id": dev_id, "timestamp": ts, "location": f"Tanque {i}",
+                    "sensors": {"temperature": {"value": temp, "unit": "C"}, "ph": {"value": ph, "unit": "pH"}}
+                })
+            else:
+                docs.append({
+                    "dispositivo_id": dev_id, "timestamp": ts,
+                    "datos": {"temperatura": temp, "ph": ph}
+                })
+    database[FIXTURE_TELEMETRY].insert_many(docs)
+    database[FIXTURE_DEVICES].insert_many([{"_id": f"BENCH-{i:03d}", "alias": f"Tanque {i}"} for i in range(n_devices)])
+    return len(docs)
+
+
+def client_db(client, db_name: str, telemetry: str, devices: Optional[str], name: str) -> DatabaseConnection:
+    """
+    DatabaseConnection con una sola fuente: la base `db_name` del cliente dado.
+    Se arma sin __init__ para no conectarse a las fuentes del .env.
+    """
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.last_timings = {}
+    db.sources = [{
+        "name": name,
+        "client": client,
+        "db": db_name,
+        "coll_telemetry": telemetry,
+        "coll_devices": devices,
+        "writable": True
+    }]
+    return db
+
+
+def get_fixture_db(client) -> DatabaseConnection:
+    """DatabaseConnection apuntando SOLO al fixture (ignora las fuentes del .env)."""
+    return client_db(client, FIXTURE_DB, FIXTURE_TELEMETRY, FIXTURE_DEVICES, "Benchmark")
+
+
+def timed(fn, repeat=3):
+    """Ejecuta fn `repeat` veces y retorna (mejor tiempo en segundos, último resultado)."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+# =============================================================================
+# ESCENARIOS
+# =============================================================================
+
+def bench_latest(client, args):
+    """get_latest_by_device: escaneo de 2000 docs + fallback N+1 vs agregación $group."""
+    total = seed_telemetry(client, n_devices=args.devices)
+    print(f"[INFO] Fixture: {total} documentos, {args.devices} dispositivos")
+
+    db = get_fixture_db(client)
+    source = db.sources[0]
+
+    # Camino anterior: escaneo acotado (los silenciosos caen al fallback histórico)
+    source["latest_strategy"] = "scan"
+    live_scan = {d.get("device_id") or d.get("dispositivo_id") for d in db._fetch_latest_docs(source)}
+    t_scan, df_scan = timed(db.get_latest_by_device, args.repeat)
+
+    # Camino nuevo: agregación en el servidor
+    source["latest_strategy"] = "aggregate"
+    live_agg = {d.get("device_id") or d.get("dispositivo_id") for d in db._fetch_latest_docs(source)}
+    t_agg, df_agg = timed(db.get_latest_by_device, args.repeat)
+
+    print(f"\n{'Estrategia':<12}{'Tiempo (s)':>12}{'Disp. en vivo':>16}{'Filas DF':>10}")
+    print(f"{'scan':<12}{t_scan:>12.3f}{len(live_scan):>16}{len(df_scan):>10}")
+    print(f"{'aggregate':<12}{t_agg:>12.3f}{len(live_agg):>16}{len(df_agg):>10}")
+
+    # Ambos caminos deben entregar el mismo último dato por dispositivo
+    a = df_scan.set_index("device_id")["timestamp"].sort_index()
+    b = df_agg.set_index("device_id")["timestamp"].sort_index()
+    print(f"\nMismo timestamp por dispositivo: {'OK' if a.equals(b) else 'DIFERENCIAS'}")
+
+
+def bench_fallback(client, args):
+    """Fallback histórico de get_latest_by_device: N+1 find_one vs una consulta $in por fuente."""
+    total = seed_telemetry(client, n_devices=args.devices)
+    print(f"[INFO] Fixture: {total} documentos, {args.devices} dispositivos")
+
+    db = get_fixture_db(client)
+    source = db.sources[0]
+    # Con escaneo acotado los dispositivos silenciosos quedan fuera de la ventana en vivo
+    source["latest_strategy"] = "scan"
+    live = {d.get("device_id") or d.get("dispositivo_id") for d in db._fetch_latest_docs(source)}
+    missing = [d["_id"] for d in db.get_all_registered_devices() if d["_id"] not in live]
+
+    def n_plus_one():
+        return {dev_id: db.get_latest_for_single_device(dev_id) for dev_id in missing}
+
+    t_old, old = timed(n_plus_one, args.repeat)
+    source["latest_strategy"] = "aggregate"
+    t_new, new = timed(lambda: db.get_latest_for_devices(missing), args.repeat)
+
+    n_sources = len(db.sources)
+    print(f"\n{'Camino':<14}{'Tiempo (s)':>12}{'Consultas':>12}{'Encontrados':>13}")
+    print(f"{'N+1 find_one':<14}{t_old:>12.3f}{len(missing) * n_sources:>12}{sum(not df.empty for df in old.values()):>13}")
+    print(f"{'batch $in':<14}{t_new:>12.3f}{n_sources:>12}{len(new):>13}")
+
+    same = all(
+        old[dev_id].iloc[0]["timestamp"] == pd.Timestamp(new[dev_id]["timestamp"])
+        for dev_id in missing if dev_id in new
+    )
+    print(f"\nMismo último dato por dispositivo: {'OK' if same else 'DIFERENCIAS'}")
+
+    # Desglose de tiempos de la llamada completa (estrategia por defecto)
+    db.get_latest_by_device()
+    print("Desglose get_latest_by_device:", {k: round(v, 3) for k, v in db.last_timings.items()})
+
+
+def build_mixed_docs(n_docs, n_devices=20, seed=7):
+    """Documentos crudos en memoria con los 4 formatos de timestamp que conviven en producción."""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(n_docs):
+        ts = now - timedelta(seconds=6 * i)
+        dev = i % n_devices
+        kind = i % 4
+        if kind == 0:
+            docs.append({"device_id": f"BENCH-{dev:03d}", "timestamp": ts, "location": "Lab",
+                         "sensors": {"temperature": {"value": rnd.uniform(20, 30)}, "ph": {"value": rnd.uniform(6, 8)}}})
+        elif kind == 1:
+            docs.append({"dispositivo_id": f"BENCH-{dev:03d}", "timestamp": ts.isoformat(),
+                         "datos": {"temperatura": rnd.uniform(20, 30), "od": rnd.uniform(3, 9)}})
+        elif kind == 2:
+            docs.append({"device_id": f"BENCH-{dev:03d}", "timestamp": int(ts.timestamp() * 1000),
+                         "sensors": {"ammonia": rnd.uniform(0, 1), "ph": rnd.uniform(6, 8)}})
+        else:
+            docs.append({"dispositivo_id": f"BENCH-{dev:03d}", "timestamp": ts.replace(tzinfo=None).isoformat(),
+                         "datos": {"ph": rnd.uniform(6, 8), "Temp": rnd.uniform(20, 30)}})
+    return docs
+
+
+def bench_normalize(client, args):
+    """Normalización masiva: _normalize_document + _parse_historical_flat vs normalize_documents."""
+    from modules.telemetry_normalizer import normalize_documents
+
+    docs = build_mixed_docs(args.docs)
+    db = get_fixture_db(client)
+    print(f"[INFO] {len(docs)} documentos en memoria (Date, ISO con/sin offset, epoch ms)")
+
+    t_old, df_old = timed(lambda: db._parse_historical_flat([db._normalize_document(d) for d in docs]), args.repeat)
+    t_new, df_new = timed(lambda: normalize_documents(docs), args.repeat)
+
+    print(f"\n{'Camino':<16}{'Tiempo (s)':>12}{'Docs/s':>14}")
+    print(f"{'por documento':<16}{t_old:>12.3f}{len(docs) / t_old:>14,.0f}")
+    print(f"{'columnar':<16}{t_new:>12.3f}{len(docs) / t_new:>14,.0f}")
+    print(f"\nSpeedup: {t_old / t_new:.1f}x | Mismas filas: {len(df_old) == len(df_new)} | Mismas columnas: {list(df_old.columns) == list(df_new.columns)}")
+
+
+def bench_incremental(client, args):
+    """Historial de Gráficas: recarga completa de la semana vs delta de la caché incremental."""
+    from modules.history_cache import IncrementalHistoryCache
+
+    total = seed_telemetry(client, n_devices=args.devices)
+    print(f"[INFO] Fixture: {total} documentos, {args.devices} dispositivos")
+    db = get_fixture_db(client)
+
+    # Sin la caché en disco: se compara Mongo contra Mongo
+    t_full, df_full = timed(lambda: IncrementalHistoryCache(persist=False).refresh(db), args.repeat)
+
+    cache = IncrementalHistoryCache(persist=False)
+    cache.refresh(db)
+    # Un minuto de datos nuevos: un documento por segundo por cada dispositivo 'chatty'
+    now = datetime.now(timezone.utc)
+    new_docs = [{"device_id": f"BENCH-{i:03d}", "timestamp": now - timedelta(seconds=s),
+                 "sensors": {"temperature": {"value": 28.0}, "ph": {"value": 7.5}}}
+                for i in range(3) for s in range(60)]
+    client[FIXTURE_DB][FIXTURE_TELEMETRY].insert_many(new_docs)
+
+    t0 = time.perf_counter()
+    df_delta = cache.refresh(db)
+    t_delta = time.perf_counter() - t0
+
+    print(f"\n{'Camino':<18}{'Tiempo (s)':>12}{'Docs leídos':>14}{'Filas':>10}")
+    print(f"{'recarga completa':<18}{t_full:>12.3f}{len(df_full):>14}{len(df_full):>10}")
+    print(f"{'delta incremental':<18}{t_delta:>12.3f}{cache.stats['last_delta_docs']:>14}{len(df_delta):>10}")
+    print(f"\nFilas tras el delta = completa + nuevas: {'OK' if len(df_delta) == len(df_full) + len(new_docs) else 'DIFERENCIAS'}")
+
+
+def bench_projection(client, args):
+    """Bytes transferidos y tiempo de decodificación BSON: subdocumentos completos vs proyección plana."""
+    import bson
+    from modules.telemetry_normalizer import flatten_sensor_fields, normalize_documents
+    from scripts.mock_data_generator import build_mock_records
+
+    # Una semana cada 5 minutos, sensores anidados {value, unit, status}
+    records = build_mock_records(nested=True, hours=24 * 7, step_minutes=5)
+    db = get_fixture_db(client)
+    source = db.sources[0]
+    query = {}
+
+    if args.uri:
+        # mongod real: se mide lo que realmente devuelve cada camino
+        coll = client[FIXTURE_DB][FIXTURE_TELEMETRY]
+        coll.delete_many({})
+        coll.insert_many(records)
+        full_docs = list(coll.find(query, db.TELEMETRY_PROJECTION))
+        flat_docs = db.fetch_telemetry_docs(source, query)
+        origin = "mongod"
+    else:
+        # Sin servidor: se emula la proyección plana en Python (mongomock no implementa $convert)
+        full_docs = [{k: d[k] for k in db.TELEMETRY_PROJECTION if k in d} for d in records]
+        flat_docs = [flatten_sensor_fields(d) for d in records]
+        origin = "emulado"
+    print(f"[INFO] {len(records)} documentos de mock_data_generator (proyección plana: {origin})")
+
+    rows = []
+    for name, docs in (("completa", full_docs), ("plana", flat_docs)):
+        payload = b"".join(bson.encode(d) for d in docs)
+        t_decode, _ = timed(lambda: bson.decode_all(payload), args.repeat)
+        t_norm, _ = timed(lambda: normalize_documents(docs), args.repeat)
+        rows.append((name, len(payload), t_decode, t_norm))
+
+    print(f"\n{'Proyección':<12}{'Bytes':>14}{'Decode (s)':>12}{'Normalizar (s)':>16}")
+    for name, size, t_decode, t_norm in rows:
+        print(f"{name:<12}{size:>14,}{t_decode:>12.3f}{t_norm:>16.3f}")
+    (_, b_full, d_full, _), (_, b_flat, d_flat, _) = rows
+    same = normalize_documents(full_docs).equals(normalize_documents(flat_docs))
+    print(f"\nBytes: -{1 - b_flat / b_full:.0%} | Decode: {d_full / d_flat:.1f}x | Mismo DataFrame: {'OK' if same else 'DIFERENCIAS'}")
+
+
+def bench_decimation(client, args):
+    """Payload de Plotly (1 semana, varios dispositivos): trazos crudos + SMA vs decimados (min-max / LTTB)."""
+    import numpy as np
+    import plotly.graph_objects as go
+    from modules.decimation import DEFAULT_POINT_BUDGET, decimate
+
+    n_devices = min(args.devices, 8)
+    # 1 semana cada 5 segundos por dispositivo, con spikes de amoníaco aislados
+    rnd = np.random.default_rng(11)
+    x = pd.date_range(end=datetime.now(), periods=7 * 24 * 720, freq="5s").to_numpy()
+    series = []
+    for _ in range(n_devices):
+        y = 0.1 + 0.02 * rnd.standard_normal(len(x))
+        y[rnd.integers(0, len(x), 5)] += 2.0
+        series.append(y)
+    print(f"[INFO] {n_devices} dispositivos x {len(x):,} puntos (1 semana cada 5 s)")
+
+    def build_figure(budget):
+        fig = go.Figure()
+        for i, y in enumerate(series):
+            sma = pd.Series(y).rolling(50, min_periods=1).mean().to_numpy()
+            xr, yr = decimate(x, y, budget, "minmax") if budget else (x, y)
+            xs, ys = decimate(x, sma, budget, "lttb") if budget else (x, sma)
+            fig.add_trace(go.Scatter(x=xr, y=yr, mode="lines", name=f"D{i}"))
+            fig.add_trace(go.Scatter(x=xs, y=ys, mode="lines", name=f"D{i} (Tendencia)"))
+        return fig.to_json()
+
+    print(f"\n{'Trazos':<16}{'Tiempo (s)':>12}{'Payload (MB)':>14}{'Picos visibles':>16}")
+    for name, budget in (("crudos", None), (f"decimados {DEFAULT_POINT_BUDGET}", DEFAULT_POINT_BUDGET)):
+        t, payload = timed(lambda: build_figure(budget), args.repeat)
+        peaks = sum(
+            (decimate(x, y, budget, "minmax")[1] if budget else y).max() == y.max() for y in series
+        )
+        print(f"{name:<16}{t:>12.3f}{len(payload) / 1e6:>14.1f}{peaks:>13}/{n_devices}")
+
+
+def bench_parquet(client, args):
+    """Datos de 30 días: carga completa desde Mongo vs días cerrados leídos de la caché Parquet."""
+    import tempfile
+    from modules.parquet_store import ParquetTelemetryStore
+    from modules.telemetry_normalizer import normalize_documents, now_chile
+    from scripts.mock_data_generator import build_mock_records
+
+    coll = client[FIXTURE_DB][FIXTURE_TELEMETRY]
+    coll.delete_many({})
+    coll.insert_many(build_mock_records(nested=True, hours=24 * 30, step_minutes=5))
+    db = get_fixture_db(client)
+    source = db.sources[0]
+    end = now_chile()
+    start = end - timedelta(days=30)
+    print(f"[INFO] {coll.count_documents({})} documentos, 30 días")
+
+    def from_mongo(range_start, range_end):
+        df = normalize_documents(db.fetch_telemetry_docs(source, {"timestamp": {"$gte": range_start - timedelta(days=1)}}))
+        return df[df["timestamp"].between(range_start, range_end)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ParquetTelemetryStore(tmp)
+        t_mongo, df_mongo = timed(lambda: from_mongo(start, end), args.repeat)
+
+        _, missing, open_from = store.plan(start, end)
+        t0 = time.perf_counter()
+        store.write_days(from_mongo(missing[0], open_from), missing)
+        t_write = time.perf_counter() - t0
+
+        def warm():
+            cached, _, open_from = store.plan(start, end)
+            df = pd.concat([store.read_days(cached), from_mongo(open_from, end)], ignore_index=True)
+            return df[df["timestamp"].between(start, end)]
+
+        t_warm, df_warm = timed(warm, args.repeat)
+        size = store.disk_usage()
+
+    print(f"\n{'Camino':<22}{'Tiempo (s)':>12}{'Filas':>10}")
+    print(f"{'Mongo (30 días)':<22}{t_mongo:>12.3f}{len(df_mongo):>10}")
+    print(f"{'primera escritura':<22}{t_write:>12.3f}{'':>10}")
+    print(f"{'Parquet + día abierto':<22}{t_warm:>12.3f}{len(df_warm):>10}")
+    print(f"\nSpeedup: {t_mongo / t_warm:.1f}x | En disco: {size / 1e6:.1f} MB | Mismas filas: {'OK' if len(df_mongo) == len(df_warm) else 'DIFERENCIAS'}")
+
+
+def bench_excel(client, args):
+    """Exportación Excel de una selección: pd.ExcelWriter (openpyxl normal) vs write-only por trozos."""
+    import io
+    import tracemalloc
+    from modules.telemetry_export import frame_chunks, write_excel
+    from modules.telemetry_normalizer import normalize_documents
+
+    df = normalize_documents(build_mixed_docs(args.docs))
+    print(f"[INFO] {len(df):,} filas x {len(df.columns)} columnas")
+
+    def excel_writer():
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False, sheet_name="Datos")
+        return output.getvalue()
+
+    def write_only():
+        output = io.BytesIO()
+        write_excel(frame_chunks(df), output)
+        return output.getvalue()
+
+    def peak_mb(fn):
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 1e6
+
+    print(f"\n{'Camino':<22}{'Tiempo (s)':>12}{'Filas/s':>14}{'Pico (MB)':>12}{'Archivo (MB)':>14}")
+    results = {}
+    for name, fn in (("ExcelWriter", excel_writer), ("write-only por trozos", write_only)):
+        t, data = timed(fn, args.repeat)
+        results[name] = t
+        print(f"{name:<22}{t:>12.3f}{len(df) / t:>14,.0f}{peak_mb(fn):>12.0f}{len(data) / 1e6:>14.1f}")
+    print(f"\nSpeedup: {results['ExcelWriter'] / results['write-only por trozos']:.1f}x")
+
+
+def bench_formats(client, args):
+    """Formatos de exportación: tamaño, escritura y lectura en pandas (CSV / Excel / Parquet / Arrow IPC)."""
+    import tempfile
+    from modules.telemetry_export import EXPORT_FORMATS, frame_chunks
+    from modules.telemetry_normalizer import normalize_documents
+
+    df = normalize_documents(build_mixed_docs(args.docs))
+    print(f"[INFO] {len(df):,} filas x {len(df.columns)} columnas")
+    readers = {"csv": pd.read_csv, "xlsx": pd.read_excel, "parquet": pd.read_parquet, "arrow": pd.read_feather}
+
+    print(f"\n{'Formato':<22}{'Archivo (MB)':>14}{'vs CSV':>8}{'Escritura (s)':>15}{'Filas/s':>12}{'Lectura (s)':>13}")
+    csv_size = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, export_format in EXPORT_FORMATS.items():
+            path = os.path.join(tmp, f"out.{export_format.extension}")
+            t_write, _ = timed(lambda: export_format.writer(frame_chunks(df), path), args.repeat)
+            t_read, read_back = timed(lambda: readers[fmt](path), args.repeat)
+            size = os.path.getsize(path)
+            csv_size = csv_size or size
+            ok = "" if len(read_back) == len(df) else "  (FILAS DISTINTAS)"
+            print(f"{export_format.label:<22}{size / 1e6:>14.2f}{size / csv_size:>7.0%}{t_write:>15.3f}"
+                  f"{len(df) / t_write:>12,.0f}{t_read:>13.3f}{ok}")
+
+
+def bench_sessions(client, args):
+    """Estado en vivo: consultas a Mongo por cantidad de sesiones (cada sesión vs poller compartido)."""
+    from modules.live_state import LiveStatePoller
+
+    total = seed_telemetry(client, n_devices=args.devices)
+    print(f"[INFO] Fixture: {total} documentos, {args.devices} dispositivos; {args.seconds:.0f}s por medición")
+
+    db = get_fixture_db(client)
+    latest = db.get_latest_by_device
+    counter = {"queries": 0}
+    lock = threading.Lock()
+
+    def counted_latest():
+        with lock:
+            counter["queries"] += 1
+        return latest()
+
+    db.get_latest_by_device = counted_latest
+    interval = 1.0  # tiempo comprimido: el dashboard refresca cada 30-120 s
+
+    def simulate(n_sessions, read):
+        """n sesiones que leen el estado en vivo una vez por intervalo; retorna (consultas, lectura media)."""
+        counter["queries"] = 0
+        stop = time.time() + args.seconds
+        reads = []
+
+        def session():
+            while time.time() < stop:
+                t0 = time.perf_counter()
+                read()
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    reads.append(elapsed)
+                time.sleep(max(0.0, interval - elapsed))
+
+        threads = [threading.Thread(target=session) for _ in range(n_sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return counter["queries"], sum(reads) / max(1, len(reads))
+
+    print(f"\n{'Sesiones':>8}{'Consultas (c/sesión)':>22}{'Consultas (poller)':>20}"
+          f"{'Lectura c/sesión (ms)':>23}{'Lectura poller (ms)':>21}")
+    for n_sessions in (1, 5, 20, 50):
+        q_old, t_old = simulate(n_sessions, db.get_latest_by_device)
+        poller = LiveStatePoller(db, interval_seconds=interval).start()
+        q_new, t_new = simulate(n_sessions, poller.snapshot)
+        poller.stop()
+        print(f"{n_sessions:>8}{q_old:>22}{q_new:>20}{t_old * 1000:>23.1f}{t_new * 1000:>21.2f}")
+
+    metrics = poller.metrics()
+    print(f"\nPoller: {metrics['polls']} fotos, {metrics['reads']} lecturas, "
+          f"última consulta {metrics['poll_s']:.3f}s, foto de hace {metrics['snapshot_age_s']:.1f}s")
+
+
+def legacy_health(global_thresholds, device_thresholds, device_id, sensors, alerts):
+    """Evaluación de salud anterior: por dispositivo y sensor, reinterpretando los umbrales cada vez."""
+    from modules.device_manager import HealthStatus
+
+    if alerts:
+        return HealthStatus.CRITICAL
+    new_health = HealthStatus.OK
+    dev_thresholds = {k.lower(): v for k, v in device_thresholds.get(device_id, {}).items()}
+    global_lower = {k.lower(): v for k, v in global_thresholds.items()}
+    for sensor, value in sensors.items():
+        config = dev_thresholds.get(sensor.lower(), global_lower.get(sensor.lower()))
+        if not config:
+            continue
+        c_min = float(config.get("critical_min", config.get("min", -9999)))
+        c_max = float(config.get("critical_max", config.get("max", 9999)))
+        o_min = float(config.get("min_value", config.get("optimal_min", -9999)))
+        o_max = float(config.get("max_value", config.get("optimal_max", 9999)))
+        if value < c_min or value > c_max:
+            return HealthStatus.CRITICAL
+        elif value < o_min or value > o_max:
+            new_health = HealthStatus.WARNING
+    return new_health
+
+
+def bench_health(client, args):
+    """Salud de N dispositivos x 10 sensores: evaluación por sensor vs matriz de umbrales + NumPy."""
+    from modules.device_manager import ConnectionStatus, DeviceManager, ThresholdMatrix, get_threshold_matrix
+
+    rng = random.Random(5)
+    sensors = ["temperature", "ph", "oxygen", "conductivity", "turbidity", "tds", "orp", "salinity", "ammonia", "nitrite"]
+    global_thresholds = {s: {"min": 0, "max": 30, "optimal_min": 5, "optimal_max": 25} for s in sensors}
+    # Un tercio de los dispositivos con umbrales propios para 2 sensores (formato de la UI)
+    device_thresholds = {
+        f"BIOFLOC-{i:03d}": {s: {"critical_min": 2, "critical_max": 28, "min_value": 8, "max_value": 22}
+                             for s in rng.sample(sensors, 2)}
+        for i in range(0, args.devices, 3)
+    }
+    now = datetime.now(timezone(timedelta(hours=-3))).replace(tzinfo=None)
+    df = pd.DataFrame([{
+        "device_id": f"BIOFLOC-{i:03d}", "timestamp": now, "location": "Tanque",
+        "sensor_data": {s: {"value": rng.uniform(-1, 31)} for s in sensors}, "alerts": [],
+    } for i in range(args.devices)])
+    print(f"[INFO] {args.devices} dispositivos x {len(sensors)} sensores, "
+          f"{len(device_thresholds)} con umbrales propios")
+
+    def old_path():
+        mgr = DeviceManager(global_thresholds, {}, device_thresholds)
+        devices = [mgr._process_single_record(row) for row in df.to_dict('records')]
+        for d in devices:
+            if d.connection == ConnectionStatus.ONLINE:
+                d.health = legacy_health(global_thresholds, device_thresholds, d.device_id, d.sensor_data, d.alerts)
+        return devices
+
+    def new_path():
+        return DeviceManager(global_thresholds, {}, device_thresholds).get_all_devices_info(df)
+
+    # Sólo la evaluación de salud (dispositivos ya parseados)
+    parsed = new_path()
+    mgr = DeviceManager(global_thresholds, {}, device_thresholds)
+    t_old_health, old_states = timed(lambda: [legacy_health(global_thresholds, device_thresholds, d.device_id,
+                                                            d.sensor_data, d.alerts) for d in parsed], args.repeat)
+    t_new_health, new_states = timed(lambda: mgr._evaluate_health_batch(parsed), args.repeat)
+
+    t_old, old = timed(old_path, args.repeat)
+    t_new, new = timed(new_path, args.repeat)
+    # Compilación de la matriz (una vez por versión de configuración) y verificación de versión cacheada
+    t_compile, _ = timed(lambda: ThresholdMatrix(global_thresholds, device_thresholds), args.repeat)
+    t_lookup, _ = timed(lambda: get_threshold_matrix(global_thresholds, device_thresholds), args.repeat)
+
+    print(f"\n{'Camino':<32}{'Sólo salud (ms)':>16}{'get_all_devices_info (ms)':>28}")
+    print(f"{'Por sensor (anterior)':<32}{t_old_health * 1000:>16.2f}{t_old * 1000:>28.2f}")
+    print(f"{'Matriz + NumPy':<32}{t_new_health * 1000:>16.2f}{t_new * 1000:>28.2f}")
+    print(f"\nSpeedup salud: {t_old_health / t_new_health:.1f}x | extremo a extremo: {t_old / t_new:.1f}x")
+    print(f"Compilar la matriz: {t_compile * 1000:.2f} ms (una vez por versión) | "
+          f"versión ya compilada: {t_lookup * 1000:.2f} ms")
+    same = old_states == new_states and [d.health for d in old] == [d.health for d in new]
+    print(f"Mismos estados: {'OK' if same else 'DIFERENCIAS'}")
+
+
+def build_history_frame(n_rows, n_devices, seed=11):
+    """Historial plano de Gráficas (como lo deja normalize_documents) para escenarios en memoria."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"BIOFLOC-{i:03d}" for i in range(n_devices)], dtype=object)
+    dev = rng.integers(0, n_devices, n_rows)
+    start = datetime.now() - timedelta(weeks=1)
+    return pd.DataFrame({
+        "timestamp": pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, 7 * 86400, n_rows)), unit="s"),
+        "device_id": ids[dev],
+        "location": np.char.add("Tanque ", (dev % 12).astype(str)).astype(object),
+        "temperature": np.round(rng.uniform(18, 34, n_rows), 2),
+        "ph": np.round(rng.uniform(5, 10, n_rows), 2),
+        "oxygen": np.round(rng.uniform(2, 9, n_rows), 2),
+        "conductivity": np.round(rng.uniform(900, 1500, n_rows), 1),
+    })
+
+
+def bench_layout(client, args):
+    """Historial de Gráficas: memoria por millón de filas y filtrado, frame plano vs disposición compacta."""
+    from modules.history_layout import compact_history, memory_per_million_rows
+    from views.graphs import filtrar_dataframe
+
+    plain = build_history_frame(args.docs, args.devices)
+    t_compact, compact = timed(lambda: compact_history(plain), args.repeat)
+    devices = sorted(plain["device_id"].unique())[:4]
+    print(f"[INFO] {len(plain):,} filas, {args.devices} dispositivos, filtro de {len(devices)} dispositivos")
+
+    print(f"\n{'Frame':<28}{'MB / millón de filas':>22}")
+    for label, df in [("Plano (str / float64)", plain),
+                      ("Plano (object / float64)", plain.astype({"device_id": object, "location": object})),
+                      ("Compacto", compact)]:
+        print(f"{label:<28}{memory_per_million_rows(df) / 1e6:>22.1f}")
+    print(f"Compactar: {t_compact * 1000:.0f} ms (una vez por refresco del historial)")
+
+    print(f"\n{'Rango':<14}{'Plano (ms)':>14}{'Compacto (ms)':>16}")
+    for delta in (timedelta(minutes=5), timedelta(hours=24), timedelta(weeks=1)):
+        t_plain, _ = timed(lambda: filtrar_dataframe(plain, devices, delta), args.repeat)
+        t_new, _ = timed(lambda: filtrar_dataframe(compact, devices, delta), args.repeat)
+        print(f"{str(delta):<14}{t_plain * 1000:>14.2f}{t_new * 1000:>16.2f}")
+
+
+SCENARIOS = {
+    "latest": bench_latest,
+    "fallback": bench_fallback,
+    "normalize": bench_normalize,
+    "incremental": bench_incremental,
+    "projection": bench_projection,
+    "decimation": bench_decimation,
+    "parquet": bench_parquet,
+    "excel": bench_excel,
+    "formats": bench_formats,
+    "sessions": bench_sessions,
+    "health": bench_health,
+    "layout": bench_layout,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de rendimiento de Biofloc Monitor")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS.keys()))
+    parser.add_argument("--uri", default=None, help="URI de un mongod local (default: mongomock)")
+    parser.add_argument("--devices", type=int, default=60, help="Cantidad de dispositivos del fixture")
+    parser.add_argument("--docs", type=int, default=100_000, help="Cantidad de documentos (escenarios en memoria)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por medición (se reporta la mejor)")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duración de cada medición (escenario sessions)")
+    args = parser.parse_args()
+
+    client = get_fixture_client(args.uri)
+    try:
+        SCENARIOS[args.scenario](client, args)
+    finally:
+        if args.uri:
+            client.drop_database(FIXTURE_DB)
+
+
+if __name__ == "__main__":
+    main()
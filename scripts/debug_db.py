@@ -79,7 +79,7 @@ def debug_database():
                 print(f"  -> Error consultando fuente: {e}")
 
         print("\n--- TEST FINAL: get_latest_by_device (Lo que ve el Dashboard) ---")
-        df = db.get_latest_by_device()
+        df = db.get_latest_by_device(debug=True)
         print(df)
 
     except Exception as e:
@@ -0,0 +1,69 @@
+"""
+Exportación de telemetría desde la línea de comandos (sin la UI).
+Mismo exportador en streaming que la vista Datos (modules/telemetry_export.py): lee las
+fuentes del .env por lotes, con memoria acotada, y escribe CSV, Excel, Parquet o Arrow IPC.
+
+Uso:
+    python -m scripts.export_telemetry --start 2026-01-01 --end 2026-01-31 --format parquet
+    python -m scripts.export_telemetry --start 2026-01-01 --devices BIOFLOC-01 BIOFLOC-02 --format arrow
+    python -m scripts.export_telemetry --start 2026-01-01 --end 2026-01-07 --format csv --output semana.csv
+
+Fechas en hora local de Chile (días completos: --end incluye todo ese día). Sin --end, hasta hoy.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, time as dt_time
+
+# Add root to pythonpath
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.database import DatabaseConnection
+from modules.telemetry_export import EXPORT_FORMATS, export_range
+
+
+def parse_date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida '{value}' (formato YYYY-MM-DD)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportación de telemetría de Biofloc Monitor")
+    parser.add_argument("--start", type=parse_date, required=True, help="Fecha inicial (YYYY-MM-DD)")
+    parser.add_argument("--end", type=parse_date, default=None, help="Fecha final inclusive (YYYY-MM-DD, default: hoy)")
+    parser.add_argument("--devices", nargs="+", default=None, help="IDs de dispositivos (default: todos)")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="parquet", help="Formato de salida")
+    parser.add_argument("--output", default=None, help="Archivo de salida (default: biofloc_data_<inicio>_<fin>.<ext>)")
+    args = parser.parse_args()
+
+    start = datetime.combine(args.start.date(), dt_time.min)
+    end = datetime.combine((args.end or datetime.now()).date(), dt_time.max)
+    if end < start:
+        parser.error("--end es anterior a --start")
+
+    export_format = EXPORT_FORMATS[args.format]
+    output = args.output or f"biofloc_data_{start:%Y%m%d}_{end:%Y%m%d}.{export_format.extension}"
+
+    db = DatabaseConnection()
+    if not db.sources:
+        print("[ERROR] No hay fuentes configuradas (revisa MONGO_URI / MONGO_DB en el .env)")
+        sys.exit(1)
+
+    print(f"[INFO] {export_format.label}: {start:%Y-%m-%d} a {end:%Y-%m-%d}, "
+          f"{'dispositivos ' + ', '.join(args.devices) if args.devices else 'todos los dispositivos'}")
+    t0 = time.perf_counter()
+    rows = export_range(db, start, end, output, args.format, args.devices)
+    elapsed = time.perf_counter() - t0
+
+    if not rows:
+        print("[WARN] No se encontraron registros en el rango")
+        sys.exit(1)
+    size = os.path.getsize(output)
+    print(f"Archivo generado: {output} ({rows:,} filas, {size / 1e6:.1f} MB, {elapsed:.1f}s, {rows / elapsed:,.0f} filas/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Asesor de índices para las colecciones de telemetría y dispositivos.
+
+Corre explain() (executionStats) de las formas de consulta REALES de la app en cada fuente
+configurada, armadas con los mismos helpers de modules/database.py y modules/telemetry_normalizer.py.
+Reporta qué índices recomendados faltan. Con --create los crea y repite el explain (antes/después).
+
+Uso:
+    python -m scripts.index_advisor                                         # fuentes del .env (sólo reporte)
+    python -m scripts.index_advisor --uri mongodb://localhost:27017 --db BioflocDB
+    python -m scripts.index_advisor --uri mongodb://localhost:27017 --fixture --create
+
+--fixture siembra la base 'biofloc_benchmark' (el fixture de benchmark_performance) y la borra al final.
+Requiere un mongod real: mongomock no implementa explain.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Add root to pythonpath
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.database import DatabaseConnection
+from modules.telemetry_normalizer import now_chile, timestamp_range_query
+from scripts.benchmark_performance import FIXTURE_DB, client_db, get_fixture_client, get_fixture_db, seed_telemetry
+
+IndexKey = List[Tuple[str, int]]
+
+# Índices recomendados para la colección de telemetría. Todas las consultas calientes ordenan
+# por timestamp y filtran por alguno de los 3 campos de ID (a veces con $or entre ellos).
+# (La colección de dispositivos sólo se consulta completa o por _id: basta el índice por defecto.)
+RECOMMENDED_TELEMETRY_INDEXES: List[IndexKey] = [
+    [("timestamp", -1)],
+    [("device_id", 1), ("timestamp", -1)],
+    [("dispositivo_id", 1), ("timestamp", -1)],
+    [("metadata.device_id", 1), ("timestamp", -1)],
+]
+
+
+# =============================================================================
+# ANÁLISIS DE PLANES E ÍNDICES
+# =============================================================================
+
+def index_covers(existing: IndexKey, wanted: IndexKey) -> bool:
+    """True si `existing` sirve como `wanted`: lo tiene como prefijo, en el mismo sentido o todo invertido."""
+    if len(existing) < len(wanted):
+        return False
+    prefix = existing[:len(wanted)]
+    same = all(f1 == f2 and d1 == d2 for (f1, d1), (f2, d2) in zip(prefix, wanted))
+    reversed_ = all(f1 == f2 and d1 == -d2 for (f1, d1), (f2, d2) in zip(prefix, wanted))
+    return same or reversed_
+
+
+def missing_indexes(existing: Iterable[IndexKey], recommended: Iterable[IndexKey] = RECOMMENDED_TELEMETRY_INDEXES) -> List[IndexKey]:
+    existing = list(existing)
+    return [wanted for wanted in recommended if not any(index_covers(key, wanted) for key in existing)]
+
+
+def existing_index_keys(collection) -> Dict[str, IndexKey]:
+    """Nombre -> claves de los índices de la colección."""
+    return {name: [(f, int(d)) for f, d in info["key"]] for name, info in collection.index_information().items()}
+
+
+def _find_key(node: Any, key: str) -> Optional[Any]:
+    """Primer valor de `key` en un documento anidado (el explain cambia de forma entre versiones y con $cursor)."""
+    if isinstance(node, dict):
+        if key in node:
+            return node[key]
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _walk_plan(stage: Dict[str, Any], stages: List[str], indexes: List[str]):
+    if not isinstance(stage, dict):
+        return
+    if "stage" in stage:
+        stages.append(stage["stage"])
+    if "indexName" in stage:
+        indexes.append(stage["indexName"])
+    for child_key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        if child_key in stage:
+            _walk_plan(stage[child_key], stages, indexes)
+    for child in stage.get("inputStages", []):
+        _walk_plan(child, stages, indexes)
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan ganador (etapas, índices) y estadísticas de ejecución de un explain en modo executionStats."""
+    stages, indexes = [], []
+    _walk_plan(_find_key(explain, "winningPlan") or {}, stages, indexes)
+    stats = _find_key(explain, "executionStats") or {}
+    return {
+        "stages": stages,
+        "indexes": sorted(set(indexes)),
+        "collscan": "COLLSCAN" in stages,
+        "blocking_sort": "SORT" in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+        "ms": stats.get("executionTimeMillis"),
+    }
+
+
+def plan_label(summary: Dict[str, Any]) -> str:
+    """Etiqueta corta del plan: IXSCAN(nombres) / COLLSCAN, más +SORT si ordena en memoria."""
+    label = f"IXSCAN({','.join(summary['indexes'])})" if summary["indexes"] and not summary["collscan"] else "COLLSCAN"
+    return label + ("+SORT" if summary["blocking_sort"] else "")
+
+
+# =============================================================================
+# FORMAS DE CONSULTA DE LA APP
+# =============================================================================
+
+def sample_device_ids(collection, per_field: int = 3) -> Dict[str, List[str]]:
+    """Algunos IDs reales por campo de ID, de los documentos más recientes."""
+    ids: Dict[str, List[str]] = {f: [] for f in DatabaseConnection.DEVICE_ID_FIELDS}
+    projection = {f: 1 for f in DatabaseConnection.DEVICE_ID_FIELDS}
+    for doc in collection.find({}, projection).sort("_id", -1).limit(1000):
+        for field in DatabaseConnection.DEVICE_ID_FIELDS:
+            value = doc
+            for part in field.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            if value is not None and value not in ids[field] and len(ids[field]) < per_field:
+                ids[field].append(value)
+    return ids
+
+
+def telemetry_query_shapes(db: DatabaseConnection, ids: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """Consultas calientes de la app sobre telemetría (mismos filtros/pipelines que el código)."""
+    all_ids = [i for values in ids.values() for i in values] or ["__sin_datos__"]
+    one_id = all_ids[0]
+    end = now_chile()
+    day = timestamp_range_query(end - timedelta(days=1), end)
+    week = (end - timedelta(weeks=1), end)
+    legacy_or = {"$or": [{"device_id": {"$in": all_ids}}, {"dispositivo_id": {"$in": all_ids}}]}
+
+    return [
+        {"name": "Home: último por dispositivo", "pipeline": db._recent_latest_pipeline()},
+        {"name": "Home: escaneo en vivo (fallback)", "filter": {}, "sort": {"timestamp": -1}, "limit": db.LIVE_SCAN_LIMIT},
+        {"name": "Home: últimos de N dispositivos", "pipeline": [{"$match": legacy_or}] + db._latest_per_device_pipeline()},
+        {"name": "Último de un dispositivo", "filter": {"$or": [{"device_id": one_id}, {"dispositivo_id": one_id}]},
+         "sort": {"timestamp": -1}, "limit": 1},
+        {"name": "Datos: rango 1 día", "filter": day, "projection": db.TELEMETRY_PROJECTION},
+        {"name": "Datos: rango 1 día + dispositivos", "filter": {"$and": [day, db.device_filter(all_ids)]},
+         "projection": db.TELEMETRY_PROJECTION},
+        {"name": "Gráficas: buckets 1 semana", "pipeline": db._bucketed_pipeline(
+            {"$or": [db._device_range_clause(dev, {"$gte": week[0] - db.CHILE_OFFSET, "$lte": week[1] - db.CHILE_OFFSET})
+                     for dev in all_ids]}, 10, {}, {})},
+        {"name": "fetch_data (historial)", "filter": legacy_or, "sort": {"timestamp": -1}, "limit": 5000},
+    ]
+
+
+def device_query_shapes(sample_id: Any) -> List[Dict[str, Any]]:
+    return [
+        {"name": "Registro de dispositivos", "filter": {}},
+        {"name": "Dispositivo por _id", "filter": {"_id": sample_id}, "limit": 1},
+    ]
+
+
+def explain_shape(database, coll_name: str, shape: Dict[str, Any]) -> Dict[str, Any]:
+    """explain (executionStats) de una forma de consulta; agrega el tiempo de pared en ms."""
+    if "pipeline" in shape:
+        command = {"aggregate": coll_name, "pipeline": shape["pipeline"], "cursor": {}, "allowDiskUse": True}
+    else:
+        command = {"find": coll_name, "filter": shape["filter"]}
+        for key in ("sort", "limit", "projection"):
+            if key in shape:
+                command[key] = shape[key]
+    t0 = time.perf_counter()
+    explain = database.command("explain", command, verbosity="executionStats")
+    summary = summarize_explain(explain)
+    summary["wall_ms"] = (time.perf_counter() - t0) * 1000
+    return summary
+
+
+# =============================================================================
+# REPORTE
+# =============================================================================
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:,}" if isinstance(value, int) else str(value)
+
+
+def print_summaries(title: str, rows: List[Tuple[str, Dict[str, Any]]]):
+    print(f"\n  {title}")
+    print(f"  {'Consulta':<36}{'Plan':<44}{'Docs exam.':>12}{'Keys exam.':>12}{'Devueltos':>11}{'ms':>8}")
+    for name, s in rows:
+        print(f"  {name:<36}{plan_label(s):<44}{_fmt(s['docs_examined']):>12}{_fmt(s['keys_examined']):>12}"
+              f"{_fmt(s['returned']):>11}{s['wall_ms']:>8.1f}")
+
+
+def print_comparison(before: List[Tuple[str, Dict[str, Any]]], after: List[Tuple[str, Dict[str, Any]]]):
+    print(f"\n  {'Consulta':<36}{'Plan antes -> después':<70}{'Docs exam.':>22}{'ms':>18}")
+    for (name, b), (_, a) in zip(before, after):
+        plans = f"{plan_label(b)} -> {plan_label(a)}"
+        docs = f"{_fmt(b['docs_examined'])} -> {_fmt(a['docs_examined'])}"
+        ms = f"{b['wall_ms']:.1f} -> {a['wall_ms']:.1f}"
+        print(f"  {name:<36}{plans:<70}{docs:>22}{ms:>18}")
+
+
+def advise_source(db: DatabaseConnection, source: Dict[str, Any], create: bool = False) -> List[IndexKey]:
+    """Reporte de una fuente; retorna los índices que faltaban (creados si create=True)."""
+    database = source["client"][source["db"]]
+    print(f"\n[FUENTE: {source['name']}] DB={source['db']} | Telemetría={source.get('coll_telemetry')} | "
+          f"Dispositivos={source.get('coll_devices')}")
+
+    missing: List[IndexKey] = []
+    if source.get("coll_telemetry"):
+        coll_name = source["coll_telemetry"]
+        collection = database[coll_name]
+        existing = existing_index_keys(collection)
+        print(f"  Documentos: {collection.estimated_document_count():,}")
+        print("  Índices existentes: " + ", ".join(f"{n} {k}" for n, k in existing.items()))
+
+        shapes = telemetry_query_shapes(db, sample_device_ids(collection))
+        before = [(s["name"], explain_shape(database, coll_name, s)) for s in shapes]
+        print_summaries("Telemetría (antes)", before)
+
+        missing = missing_indexes(existing.values())
+        if not missing:
+            print("\n  Índices recomendados: todos presentes")
+        else:
+            print("\n  Índices recomendados FALTANTES:")
+            for key in missing:
+                print(f"    - {key}")
+            if create:
+                for key in missing:
+                    name = collection.create_index(key)
+                    print(f"    creado: {name}")
+                after = [(s["name"], explain_shape(database, coll_name, s)) for s in shapes]
+                print_comparison(before, after)
+            else:
+                print("  (usa --create para crearlos y comparar el explain antes/después)")
+
+    if source.get("coll_devices"):
+        coll_name = source["coll_devices"]
+        first = database[coll_name].find_one({}, {"_id": 1})
+        shapes = device_query_shapes(first["_id"] if first else "__sin_datos__")
+        print_summaries("Dispositivos", [(s["name"], explain_shape(database, coll_name, s)) for s in shapes])
+
+    return missing
+
+
+def local_db(client, db_name: str, telemetry: str, devices: Optional[str]) -> DatabaseConnection:
+    """DatabaseConnection apuntando SOLO a una base del cliente dado (ignora las fuentes del .env)."""
+    return client_db(client, db_name, telemetry, devices, "Local")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asesor de índices de Biofloc Monitor")
+    parser.add_argument("--uri", default=None, help="URI de un mongod (default: fuentes del .env)")
+    parser.add_argument("--db", default=os.getenv("MONGO_DB"), help="Base de datos (con --uri)")
+    parser.add_argument("--telemetry", default=os.getenv("MONGO_COLLECTION", "telemetria"), help="Colección de telemetría (con --uri)")
+    parser.add_argument("--devices", default=os.getenv("MONGO_DEVICES_COLLECTION", "devices"), help="Colección de dispositivos (con --uri)")
+    parser.add_argument("--fixture", action="store_true", help="Sembrar y usar la base de benchmark (se borra al final)")
+    parser.add_argument("--create", action="store_true", help="Crear los índices faltantes y comparar el explain")
+    args = parser.parse_args()
+
+    client = None
+    if args.uri:
+        client = get_fixture_client(args.uri)
+        if args.fixture:
+            print(f"[INFO] Fixture: {seed_telemetry(client):,} documentos en '{FIXTURE_DB}'")
+            db = get_fixture_db(client)
+        else:
+            if not args.db:
+                parser.error("--db es obligatorio con --uri (o define MONGO_DB)")
+            db = local_db(client, args.db, args.telemetry, args.devices)
+    else:
+        if args.fixture:
+            parser.error("--fixture requiere --uri (mongomock no implementa explain)")
+        db = DatabaseConnection()
+
+    if not db.sources:
+        print("[ERROR] No hay fuentes configuradas (revisa MONGO_URI / MONGO_DB en el .env)")
+        sys.exit(1)
+
+    try:
+        total_missing = sum(len(advise_source(db, source, create=args.create)) for source in db.sources)
+        print(f"\nResumen: {total_missing} índice(s) recomendados {'creados' if args.create else 'faltantes'}")
+    finally:
+        if args.fixture:
+            client.drop_database(FIXTURE_DB)
+
+
+if __name__ == "__main__":
+    main()
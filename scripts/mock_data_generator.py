@@ -20,99 +20,98 @@ DB_NAME = os.getenv("MONGO_DB")
 DEMO_COLLECTION = "SensorReadings_DEMO"
 
 
-def generate_mock_data():
-    """Genera datos de prueba con variedad de sensores por dispositivo."""
-    if not URI:
-        print("[ERROR] No se encontro MONGO_URI en .env")
-        return
+# Configuracion de dispositivos con DIFERENTES cantidades de sensores
+DEVICES_CONFIG = [
+    # --- DISPOSITIVOS CON POCOS SENSORES (1-2) ---
+    {"id": "Sensor-Simple-01", "status": "ok", "loc": "Entrada", 
+     "sensors": ["temperature"]},
+    {"id": "Sensor-Basico-02", "status": "ok", "loc": "Pasillo", 
+     "sensors": ["temperature", "humidity"]},
+    {"id": "Monitor-pH", "status": "warning", "loc": "Laboratorio", 
+     "sensors": ["ph"]},
 
-    print("[INFO] Conectando a MongoDB...")
-    try:
-        client = MongoClient(URI, tlsCAFile=certifi.where())
-        db = client[DB_NAME]
-        collection = db[DEMO_COLLECTION]
-        client.admin.command('ping')
-    except Exception as e:
-        print(f"[ERROR] Error de conexion: {e}")
-        return
+    # --- DISPOSITIVOS ESTANDAR (3-4 sensores) ---
+    {"id": "Tanque-A1 (Camarones)", "status": "ok", "loc": "Invernadero 1", 
+     "sensors": ["temperature", "ph", "do"]},
+    {"id": "Tanque-A2 (Camarones)", "status": "ok", "loc": "Invernadero 1", 
+     "sensors": ["temperature", "ph", "do", "ammonia"]},
+    {"id": "Tanque-B1 (Tilapia)", "status": "warning", "loc": "Invernadero 2", 
+     "sensors": ["temperature", "ph", "do", "turbidity"]},
+    {"id": "Main-System-Unit", "status": "ok", "loc": "Zona Tesis", 
+     "sensors": ["temperature", "ph", "do", "ammonia"]},
+
+    # --- DISPOSITIVOS CON MUCHOS SENSORES (5-8) ---
+    {"id": "Estacion-Completa-01", "status": "ok", "loc": "Centro Control", 
+     "sensors": ["temperature", "ph", "do", "ammonia", "nitrite", "salinity"]},
+    {"id": "BioReactor-Avanzado", "status": "critical", "loc": "Laboratorio", 
+     "sensors": ["temperature", "ph", "do", "ammonia", "nitrite", "nitrate", "tds"]},
+    {"id": "Monitor-Multiparametro", "status": "ok", "loc": "Exterior", 
+     "sensors": ["temperature", "humidity", "ph", "do", "conductivity", "salinity", "turbidity", "chlorophyll"]},
+
+    # --- DISPOSITIVO OFFLINE ---
+    {"id": "Sensor-Desconectado", "status": "offline", "loc": "Bodega", 
+     "sensors": ["temperature", "ph"]},
+
+    # --- DISPOSITIVO CRITICO ---
+    {"id": "Tanque-Emergencia", "status": "critical", "loc": "Cuarentena", 
+     "sensors": ["temperature", "ph", "do", "ammonia", "nitrite"]},
+]
+
+# Valores base para cada tipo de sensor
+SENSOR_VALUES = {
+    "temperature": {"base": 28.0, "range": 2.0, "critical_high": 42.0, "warning_high": 32.0},
+    "ph": {"base": 7.5, "range": 0.3, "critical_high": 9.5, "warning_high": 8.5},
+    "do": {"base": 6.0, "range": 1.0, "critical_low": 2.0, "warning_low": 4.0},
+    "ammonia": {"base": 0.1, "range": 0.05, "critical_high": 1.0, "warning_high": 0.5},
+    "nitrite": {"base": 0.05, "range": 0.02, "critical_high": 0.5, "warning_high": 0.25},
+    "nitrate": {"base": 20.0, "range": 5.0, "critical_high": 100.0, "warning_high": 50.0},
+    "humidity": {"base": 65.0, "range": 10.0},
+    "salinity": {"base": 35.0, "range": 2.0},
+    "turbidity": {"base": 15.0, "range": 5.0},
+    "tds": {"base": 500.0, "range": 50.0},
+    "conductivity": {"base": 1200.0, "range": 100.0},
+    "chlorophyll": {"base": 8.0, "range": 2.0},
+}
+
+# Unidades para el formato anidado de sensores
+SENSOR_UNITS = {
+    "temperature": "°C", "ph": "pH", "do": "mg/L", "ammonia": "mg/L", "nitrite": "mg/L",
+    "nitrate": "mg/L", "humidity": "%", "salinity": "ppt", "turbidity": "NTU", "tds": "ppm",
+    "conductivity": "µS/cm", "chlorophyll": "µg/L",
+}
+
+
+def format_sensor_value(sensor_name, value, nested=False):
+    """Valor plano, o anidado {value, unit, status} como envían los dispositivos del esquema propio."""
+    if not nested:
+        return value
+    return {"value": value, "unit": SENSOR_UNITS.get(sensor_name, ""), "status": "ok"}
 
-    # Limpiar datos demo anteriores
-    collection.delete_many({})
-    db["system_config"].delete_many({})
-    print(f"[INFO] Coleccion '{DEMO_COLLECTION}' limpiada.")
 
-    # Configuracion de dispositivos con DIFERENTES cantidades de sensores
-    devices_config = [
-        # --- DISPOSITIVOS CON POCOS SENSORES (1-2) ---
-        {"id": "Sensor-Simple-01", "status": "ok", "loc": "Entrada", 
-         "sensors": ["temperature"]},
-        {"id": "Sensor-Basico-02", "status": "ok", "loc": "Pasillo", 
-         "sensors": ["temperature", "humidity"]},
-        {"id": "Monitor-pH", "status": "warning", "loc": "Laboratorio", 
-         "sensors": ["ph"]},
-        
-        # --- DISPOSITIVOS ESTANDAR (3-4 sensores) ---
-        {"id": "Tanque-A1 (Camarones)", "status": "ok", "loc": "Invernadero 1", 
-         "sensors": ["temperature", "ph", "do"]},
-        {"id": "Tanque-A2 (Camarones)", "status": "ok", "loc": "Invernadero 1", 
-         "sensors": ["temperature", "ph", "do", "ammonia"]},
-        {"id": "Tanque-B1 (Tilapia)", "status": "warning", "loc": "Invernadero 2", 
-         "sensors": ["temperature", "ph", "do", "turbidity"]},
-        {"id": "Main-System-Unit", "status": "ok", "loc": "Zona Tesis", 
-         "sensors": ["temperature", "ph", "do", "ammonia"]},
-        
-        # --- DISPOSITIVOS CON MUCHOS SENSORES (5-8) ---
-        {"id": "Estacion-Completa-01", "status": "ok", "loc": "Centro Control", 
-         "sensors": ["temperature", "ph", "do", "ammonia", "nitrite", "salinity"]},
-        {"id": "BioReactor-Avanzado", "status": "critical", "loc": "Laboratorio", 
-         "sensors": ["temperature", "ph", "do", "ammonia", "nitrite", "nitrate", "tds"]},
-        {"id": "Monitor-Multiparametro", "status": "ok", "loc": "Exterior", 
-         "sensors": ["temperature", "humidity", "ph", "do", "conductivity", "salinity", "turbidity", "chlorophyll"]},
-        
-        # --- DISPOSITIVO OFFLINE ---
-        {"id": "Sensor-Desconectado", "status": "offline", "loc": "Bodega", 
-         "sensors": ["temperature", "ph"]},
-        
-        # --- DISPOSITIVO CRITICO ---
-        {"id": "Tanque-Emergencia", "status": "critical", "loc": "Cuarentena", 
-         "sensors": ["temperature", "ph", "do", "ammonia", "nitrite"]},
-    ]
-
-    # Valores base para cada tipo de sensor
-    sensor_values = {
-        "temperature": {"base": 28.0, "range": 2.0, "critical_high": 42.0, "warning_high": 32.0},
-        "ph": {"base": 7.5, "range": 0.3, "critical_high": 9.5, "warning_high": 8.5},
-        "do": {"base": 6.0, "range": 1.0, "critical_low": 2.0, "warning_low": 4.0},
-        "ammonia": {"base": 0.1, "range": 0.05, "critical_high": 1.0, "warning_high": 0.5},
-        "nitrite": {"base": 0.05, "range": 0.02, "critical_high": 0.5, "warning_high": 0.25},
-        "nitrate": {"base": 20.0, "range": 5.0, "critical_high": 100.0, "warning_high": 50.0},
-        "humidity": {"base": 65.0, "range": 10.0},
-        "salinity": {"base": 35.0, "range": 2.0},
-        "turbidity": {"base": 15.0, "range": 5.0},
-        "tds": {"base": 500.0, "range": 50.0},
-        "conductivity": {"base": 1200.0, "range": 100.0},
-        "chlorophyll": {"base": 8.0, "range": 2.0},
-    }
-
-    print(f"[INFO] Generando datos para {len(devices_config)} dispositivos...")
+def build_mock_records(end_time=None, nested=False, hours=24, step_minutes=60):
+    """
+    Genera los registros simulados en memoria (por defecto 24 horas, uno por hora y dispositivo).
+    nested=True emite cada sensor como subdocumento {value, unit, status}.
+    """
+    print(f"[INFO] Generando datos para {len(DEVICES_CONFIG)} dispositivos...")
     
     records = []
-    end_time = datetime.now()
+    end_time = end_time or datetime.now()
 
-    for dev in devices_config:
+    for dev in DEVICES_CONFIG:
         # Dispositivos offline tienen datos antiguos
         if dev['status'] == 'offline':
             last_seen = end_time - timedelta(days=3)
             current_time = last_seen - timedelta(hours=2)
         else:
-            current_time = end_time - timedelta(hours=24)
+            current_time = end_time - timedelta(hours=hours)
             last_seen = end_time
 
         while current_time <= last_seen:
             # Generar valores para cada sensor del dispositivo
             sensors_data = {}
             for sensor_name in dev['sensors']:
-                config = sensor_values.get(sensor_name, {"base": 50.0, "range": 10.0})
+                config = SENSOR_VALUES.get(sensor_name, {"base": 50.0, "range": 10.0})
                 base = config["base"]
                 variation = config["range"]
                 
@@ -138,7 +137,7 @@ def generate_mock_data():
                 else:
                     value = base + random.uniform(-variation, variation)
                 
-                sensors_data[sensor_name] = round(value, 2)
+                sensors_data[sensor_name] = format_sensor_value(sensor_name, round(value, 2), nested)
             
             record = {
                 "device_id": dev["id"],
@@ -147,14 +146,14 @@ def generate_mock_data():
                 "sensors": sensors_data
             }
             records.append(record)
-            current_time += timedelta(minutes=60)
+            current_time += timedelta(minutes=step_minutes)
             
         # Agregar dato MUY RECIENTE para mantener dispositivos online
         if dev['status'] != 'offline':
             # Recalcular sensores para el ultimo registro
             sensors_data = {}
             for sensor_name in dev['sensors']:
-                config = sensor_values.get(sensor_name, {"base": 50.0, "range": 10.0})
+                config = SENSOR_VALUES.get(sensor_name, {"base": 50.0, "range": 10.0})
                 base = config["base"]
                 variation = config["range"]
                 
@@ -173,15 +172,41 @@ def generate_mock_data():
                 else:
                     value = base + random.uniform(-variation, variation)
                 
-                sensors_data[sensor_name] = round(value, 2)
+                sensors_data[sensor_name] = format_sensor_value(sensor_name, round(value, 2), nested)
             
             records.append({
                 "device_id": dev["id"],
-                "timestamp": datetime.now(),
+                "timestamp": end_time,
                 "location": dev["loc"],
                 "sensors": sensors_data
             })
 
+    return records
+
+
+def generate_mock_data():
+    """Genera datos de prueba con variedad de sensores por dispositivo."""
+    if not URI:
+        print("[ERROR] No se encontro MONGO_URI en .env")
+        return
+
+    print("[INFO] Conectando a MongoDB...")
+    try:
+        client = MongoClient(URI, tlsCAFile=certifi.where())
+        db = client[DB_NAME]
+        collection = db[DEMO_COLLECTION]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] Error de conexion: {e}")
+        return
+
+    # Limpiar datos demo anteriores
+    collection.delete_many({})
+    db["system_config"].delete_many({})
+    print(f"[INFO] Coleccion '{DEMO_COLLECTION}' limpiada.")
+
+    records = build_mock_records()
+
     # Insertar datos en MongoDB
     if records:
         try:
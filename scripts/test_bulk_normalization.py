@@ -0,0 +1,177 @@
+"""
+Tests de equivalencia del normalizador columnar (modules/telemetry_normalizer.py).
+Verifica que normalize_documents() produce el mismo DataFrame que el camino documento a documento:
+    db._parse_historical_flat([db._normalize_document(d) for d in docs])
+
+Uso: python -m pytest scripts/test_bulk_normalization.py
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from modules.database import DatabaseConnection
+from modules.telemetry_normalizer import flatten_sensor_fields, normalize_documents
+
+BASE = datetime(2026, 2, 25, 15, 51, 9, 557000, tzinfo=timezone.utc)
+
+
+def per_document_path(docs):
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    return db._parse_historical_flat([db._normalize_document(d) for d in docs])
+
+
+def assert_equivalent(docs):
+    expected = per_document_path(docs)
+    result = normalize_documents(docs)
+    assert list(result.columns) == list(expected.columns)
+    # La unidad de datetime64 que infiere pandas (us/ns) depende de la versión; se comparan en ns
+    for df in (expected, result):
+        df["timestamp"] = df["timestamp"].astype("datetime64[ns]")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_esquema_propio_sensores_anidados():
+    assert_equivalent([
+        {"_id": ObjectId(), "device_id": "A", "timestamp": BASE, "location": "Tanque 1",
+         "sensors": {"temperature": {"value": 28.1, "unit": "C"}, "ph": {"value": 7.4}}},
+        {"_id": ObjectId(), "device_id": "A", "timestamp": BASE + timedelta(minutes=1), "location": "Tanque 1",
+         "sensors": {"temperature": {"value": "28.3"}, "ph": {"value": None}, "estado": {"value": "ok"}}},
+    ])
+
+
+def test_esquema_partner_campos_en_espanol():
+    assert_equivalent([
+        {"dispositivo_id": "34865D46A848", "timestamp": BASE, "ubicacion": "Sala 2",
+         "datos": {"temperatura": 23.21, "ph": 4.08, "OD": 6.1, "Oxigeno": 5.9}},
+        {"dispositivo_id": "34865D46A848", "timestamp": BASE, "datos": {"Temp ": 22, "do": 7, "activo": True}},
+    ])
+
+
+def test_device_id_en_metadata_y_desconocido():
+    assert_equivalent([
+        {"metadata": {"device_id": "ROS-1"}, "timestamp": BASE, "sensors": {"ph": 7.0}},
+        {"timestamp": BASE, "sensors": {"ph": 7.1}},
+        {"device_id": "", "dispositivo_id": "B", "timestamp": BASE, "sensors": {"ph": 7.2}},
+    ])
+
+
+def test_variantes_de_timestamp():
+    naive = BASE.replace(tzinfo=None)
+    variants = [
+        BASE,                                           # Date con zona
+        naive,                                          # Date naive (se asume UTC)
+        {"$date": BASE},                                # Extended JSON
+        {"$date": "2026-02-25T15:51:09.557Z"},
+        int(BASE.timestamp() * 1000),                   # epoch ms
+        int(BASE.timestamp()),                          # epoch s
+        BASE.timestamp(),                               # epoch s float
+        "2026-02-25T15:51:09",                          # ISO naive (hora local)
+        "2026-02-25 15:51:09.557000",                   # ISO naive con espacio y micros
+        "2026-02-25T15:51",                             # ISO sin segundos
+        "2026-02-25T15:51:09.557Z",                     # ISO UTC 'Z'
+        "2026-02-25T12:51:09-03:00",                    # ISO con offset
+        "2026-02-25T17:51:09.557000+02:00",
+        "25/02/2026 15:51",                             # No ISO -> camino escalar
+        "2026-02-25T15:51:09.5",                        # fracción no estándar -> camino escalar
+        "no-es-fecha",
+        "",
+        None,
+        ["basura"],
+    ]
+    docs = [{"device_id": f"D{i}", "timestamp": ts, "sensors": {"ph": 7.0}} for i, ts in enumerate(variants)]
+    assert_equivalent(docs)
+
+
+def test_orden_de_columnas_por_primera_aparicion():
+    assert_equivalent([
+        {"device_id": "A", "timestamp": BASE, "sensors": {"ph": 7}},
+        {"device_id": "B", "timestamp": BASE, "sensors": {"ammonia": 0.1, "temperatura": 27}},
+        {"device_id": "C", "timestamp": BASE, "sensors": {"temperature": 26, "ph": 7.2, "nitrite": 0.01}},
+    ])
+
+
+def test_lote_sintetico_mixto():
+    rnd = random.Random(7)
+    docs = []
+    for i in range(2000):
+        ts = BASE - timedelta(seconds=30 * i)
+        kind = i % 4
+        if kind == 0:
+            docs.append({"device_id": f"T{i % 13}", "timestamp": ts,
+                         "sensors": {"temperature": {"value": rnd.uniform(20, 30)}, "ph": {"value": rnd.uniform(6, 8)}}})
+        elif kind == 1:
+            docs.append({"dispositivo_id": f"P{i % 7}", "timestamp": ts.isoformat(),
+                         "datos": {"temperatura": rnd.uniform(20, 30), "od": rnd.uniform(3, 9)}})
+        elif kind == 2:
+            docs.append({"device_id": f"T{i % 13}", "timestamp": int(ts.timestamp() * 1000),
+                         "sensors": {"ammonia": rnd.uniform(0, 1)}})
+        else:
+            docs.append({"dispositivo_id": f"P{i % 7}", "timestamp": ts.replace(tzinfo=None).isoformat(),
+                         "datos": {"ph": rnd.uniform(6, 8)}})
+    assert_equivalent(docs)
+
+
+def test_proyeccion_plana_no_cambia_el_resultado():
+    docs = [
+        {"_id": ObjectId(), "device_id": "A", "timestamp": BASE, "location": "Tanque 1", "alerts": ["x"],
+         "sensors": {"temperature": {"value": "28.3", "unit": "C", "status": "ok"}, "ph": {"value": None},
+                     "estado": {"value": "ok"}, "flag": {"value": True}, "od": 6}},
+        {"dispositivo_id": "P", "timestamp": BASE.isoformat(), "sensors": {},
+         "datos": {"temperatura": 23.2, "texto": "n/a", "activo": False}},
+        {"metadata": {"device_id": "ROS-1", "fw": "1.2"}, "timestamp": BASE, "sensors": {"ph": 7.0}},
+    ]
+    expected = normalize_documents(docs)
+    result = normalize_documents([flatten_sensor_fields(d) for d in docs])
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_lote_vacio():
+    assert normalize_documents([]).empty
+
+
+class FailingAggregate:
+    """Colección cuyo aggregate falla con el error dado; find() entrega los documentos."""
+
+    def __init__(self, error, docs):
+        self.error, self.docs = error, docs
+
+    def aggregate(self, *args, **kwargs):
+        raise self.error
+
+    def find(self, *args, **kwargs):
+        return FindCursor(self.docs)
+
+
+class FindCursor(list):
+    def batch_size(self, size):
+        return self
+
+
+@pytest.mark.parametrize("error, unsupported", [
+    (NotImplementedError("$convert"), True),
+    (OperationFailure("Unrecognized expression '$isNumber'", code=168), True),
+    (AutoReconnect("conexión perdida"), False),
+    (OperationFailure("cursor killed", code=237), False),
+])
+def test_proyeccion_plana_solo_se_degrada_si_no_esta_soportada(error, unsupported):
+    docs = [{"_id": 1, "device_id": "A", "timestamp": BASE, "sensors": {"ph": {"value": 7.1}}}]
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    for fetch in (db.fetch_telemetry_docs, lambda s, q: [d for batch in db.iter_telemetry_docs(s, q) for d in batch]):
+        source = {"name": "Test", "client": {"hist": {"telemetria": FailingAggregate(error, docs)}},
+                  "db": "hist", "coll_telemetry": "telemetria"}
+        if unsupported:
+            assert fetch(source, {}) == docs
+            assert source["projection_strategy"] == "find"
+        else:
+            # Error transitorio: se propaga (quien llama lo reporta) y el próximo intento vuelve a la proyección plana
+            with pytest.raises(type(error)):
+                fetch(source, {})
+            assert source.get("projection_strategy", "flat") == "flat"
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,162 @@
+"""
+Tests del refresco en vivo del dashboard (views/dashboard.py).
+Verifica que refrescar la página de tarjetas hace UNA consulta de telemetría por fuente
+(no una por tarjeta) y da los mismos estados que el refresco anterior, tarjeta por tarjeta.
+Con la foto del poller compartido (modules/live_state.py) no consulta Mongo.
+
+Requiere mongomock (pip install mongomock) como fixture en memoria.
+Uso: python -m pytest scripts/test_dashboard_refresh.py
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from modules.config_manager import ConfigManager, invalidate_device_metadata
+from modules.database import DatabaseConnection
+from modules.device_manager import DeviceManager
+from views.dashboard import refresh_devices
+
+class CountingCollection:
+    """Envuelve una colección contando las consultas que llegan a la base de datos."""
+
+    def __init__(self, coll):
+        self.coll = coll
+        self.queries = 0
+
+    def aggregate(self, *args, **kwargs):
+        self.queries += 1
+        return self.coll.aggregate(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        self.queries += 1
+        return self.coll.find(*args, **kwargs)
+
+    def find_one(self, *args, **kwargs):
+        self.queries += 1
+        return self.coll.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.coll, name)
+
+
+@pytest.fixture
+def db():
+    invalidate_device_metadata()
+    client = mongomock.MongoClient()
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(9):
+        for age in (5, 40, 600):
+            ts = now - timedelta(seconds=age + i)
+            if i % 2:
+                docs.append({"device_id": f"D{i}", "timestamp": ts,
+                             "sensors": {"ph": {"value": 6.0 + i / 2 + age / 1000}}})
+            else:
+                docs.append({"dispositivo_id": f"D{i}", "timestamp": ts,
+                             "datos": {"ph": 6.0 + i / 2 + age / 1000, "temperatura": 27.0}})
+    client["live"]["telemetria"].insert_many(docs)
+    client["live"]["devices"].insert_many([
+        {"_id": "D3", "alias": "Estanque 3", "umbrales": {"ph_min": 6.5, "ph_max": 7.0}},
+    ])
+    telemetry = CountingCollection(client["live"]["telemetria"])
+    devices = CountingCollection(client["live"]["devices"])
+    conn = DatabaseConnection.__new__(DatabaseConnection)
+    conn.sources = [{"name": "Test", "client": {"live": {"telemetria": telemetry, "devices": devices}},
+                     "db": "live", "coll_telemetry": "telemetria", "coll_devices": "devices",
+                     "writable": True}]
+    conn.telemetry, conn.devices = telemetry, devices
+    yield conn
+    invalidate_device_metadata()
+
+
+def refresco_tarjeta_por_tarjeta(db, ids):
+    """Camino anterior: una consulta y un DeviceManager por tarjeta."""
+    result = {}
+    for dev_id in ids:
+        cfg = ConfigManager(db)
+        dev_specifics = {k: v.get('thresholds', {}) for k, v in cfg.get_device_metadata().items()}
+        mgr = DeviceManager(cfg.get_all_configured_sensors(), {}, dev_specifics)
+        infos = mgr.get_all_devices_info(db.get_latest_for_single_device(dev_id))
+        if infos:
+            result[dev_id] = infos[0]
+    return result
+
+
+def test_una_consulta_por_pagina(db):
+    ids = [f"D{i}" for i in range(9)]
+    fresh = refresh_devices(ConfigManager(db), ids, {})
+
+    assert db.telemetry.queries == 1
+    assert db.devices.queries == 1
+    assert sorted(fresh) == ids
+
+    expected = refresco_tarjeta_por_tarjeta(db, ids)
+    for dev_id in ids:
+        assert fresh[dev_id] == expected[dev_id]
+    # El umbral específico de D3 cambia su salud respecto del resto
+    assert fresh["D3"].health != fresh["D1"].health
+
+
+def test_dispositivos_sin_datos(db):
+    assert refresh_devices(ConfigManager(db), ["NO-EXISTE"], {}) == {}
+    fresh = refresh_devices(ConfigManager(db), ["D1", "NO-EXISTE"], {})
+    assert list(fresh) == ["D1"]
+
+
+def test_foto_compartida_sin_consultas(db):
+    ids = ["D1", "D2", "D3"]
+    snapshot_df = db.get_latest_by_device()
+    db.telemetry.queries = 0
+
+    fresh = refresh_devices(ConfigManager(db), ids, {}, latest_df=snapshot_df)
+    assert db.telemetry.queries == 0
+    # Misma lectura y salud; la foto además trae la ubicación del registro (como show_view)
+    direct = refresh_devices(ConfigManager(db), ids, {})
+    for dev_id in ids:
+        assert (fresh[dev_id].last_update, fresh[dev_id].sensor_data, fresh[dev_id].health) == \
+               (direct[dev_id].last_update, direct[dev_id].sensor_data, direct[dev_id].health)
+
+
+class FailingAggregate(CountingCollection):
+    """Colección cuyo aggregate falla con el error dado."""
+
+    def __init__(self, coll, error):
+        super().__init__(coll)
+        self.error = error
+
+    def aggregate(self, *args, **kwargs):
+        self.queries += 1
+        raise self.error
+
+
+@pytest.mark.parametrize("error, strategy", [
+    (OperationFailure("stage desconocido", code=40324), "scan"),
+    (NotImplementedError("$group"), "scan"),
+    (AutoReconnect("conexión perdida"), "aggregate"),
+    (OperationFailure("timeout", code=50), "aggregate"),
+])
+def test_solo_agregacion_no_soportada_degrada_a_escaneo(db, error, strategy):
+    source = db.sources[0]
+    source["client"]["live"]["telemetria"] = FailingAggregate(db.telemetry.coll, error)
+
+    docs = db._fetch_latest_docs(source)
+    assert len({d.get("device_id") or d.get("dispositivo_id") for d in docs}) == 9
+    # Un error transitorio usa el escaneo sólo en esta llamada; el próximo sondeo reintenta
+    assert source.get("latest_strategy", "aggregate") == strategy
+
+
+def test_dispositivo_fuera_de_la_ventana_reciente(db):
+    old = datetime.now(timezone.utc) - db.LATEST_WINDOW - timedelta(days=2)
+    db.telemetry.coll.insert_one({"device_id": "VIEJO", "timestamp": old, "sensors": {"ph": {"value": 7.1}}})
+    db.devices.coll.insert_one({"_id": "VIEJO"})
+
+    live = {d.get("device_id") or d.get("dispositivo_id") for d in db._fetch_latest_docs(db.sources[0])}
+    assert "VIEJO" not in live
+    # El registro lo completa con get_latest_for_devices
+    latest = db.get_latest_by_device().set_index("device_id")
+    assert latest.loc["VIEJO", "sensor_data"]["ph"] == 7.1
+    assert latest.loc["VIEJO", "timestamp"] < latest.loc["D1", "timestamp"]
@@ -0,0 +1,63 @@
+"""
+Tests del motor de decimación de trazos (modules/decimation.py).
+
+Uso: python -m pytest scripts/test_decimation.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.decimation import decimate, lttb_indices, minmax_indices
+
+
+def serie_con_spike(n=50_000, spike_at=31_337):
+    rnd = np.random.default_rng(3)
+    x = pd.date_range("2026-02-20", periods=n, freq="5s").to_numpy()
+    y = 0.1 + 0.01 * rnd.standard_normal(n)
+    y[spike_at] = 2.5          # spike de amoníaco
+    y[spike_at + 100] = -1.0   # caída puntual
+    return x, y
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+def test_respeta_presupuesto_y_extremos(method):
+    x, y = serie_con_spike()
+    x_out, y_out = decimate(x, y, 1000, method=method)
+    assert len(x_out) <= 1002
+    assert x_out[0] == x[0] and x_out[-1] == x[-1]
+    assert (np.diff(x_out.astype("int64")) > 0).all()
+    # Los picos visuales sobreviven
+    assert y_out.max() == 2.5
+    assert y_out.min() == -1.0
+
+
+def test_minmax_incluye_el_extremo_de_cada_bucket():
+    y = np.arange(100, dtype=float)[::-1].copy()
+    y[::10] += 1000
+    idx = minmax_indices(y, 20)
+    assert set(range(0, 100, 10)) <= set(idx.tolist())
+
+
+def test_lttb_tamano_exacto_y_linea_recta():
+    x = np.arange(10_000, dtype=float)
+    y = 3 * x + 1
+    idx = lttb_indices(x, y, 500)
+    assert len(idx) == 500 and len(np.unique(idx)) == 500
+    assert idx[0] == 0 and idx[-1] == 9_999
+
+
+def test_series_cortas_no_se_tocan():
+    x = np.arange(10)
+    y = np.linspace(0, 1, 10)
+    for method in ("minmax", "lttb"):
+        x_out, y_out = decimate(x, y, 2000, method=method)
+        np.testing.assert_array_equal(y_out, y)
+
+
+def test_metodo_desconocido():
+    with pytest.raises(ValueError):
+        decimate(np.arange(5), np.arange(5), 3, method="random")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,128 @@
+"""
+Tests de la evaluación de salud vectorizada (modules/device_manager.py).
+Compara la matriz de umbrales + NumPy contra la evaluación anterior, dispositivo por
+dispositivo y sensor por sensor, sobre configuraciones y lecturas aleatorias.
+
+Uso: python -m pytest scripts/test_device_health.py
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from modules.device_manager import DeviceManager, HealthStatus, get_threshold_matrix
+
+SENSORS = ["temperature", "ph", "oxygen", "conductivity", "turbidity", "tds", "orp", "salinity", "ammonia", "nitrite"]
+
+
+def salud_anterior(global_thresholds, device_thresholds, device_id, sensors, alerts):
+    """Evaluación anterior (por sensor, en Python)."""
+    if alerts:
+        return HealthStatus.CRITICAL
+    new_health = HealthStatus.OK
+    dev = {k.lower(): v for k, v in device_thresholds.get(device_id, {}).items()}
+    glob = {k.lower(): v for k, v in global_thresholds.items()}
+    for sensor, value in sensors.items():
+        config = dev.get(sensor.lower(), glob.get(sensor.lower()))
+        if not config:
+            continue
+        c_min = float(config.get("critical_min", config.get("min", -9999)))
+        c_max = float(config.get("critical_max", config.get("max", 9999)))
+        o_min = float(config.get("min_value", config.get("optimal_min", -9999)))
+        o_max = float(config.get("max_value", config.get("optimal_max", 9999)))
+        if value < c_min or value > c_max:
+            return HealthStatus.CRITICAL
+        elif value < o_min or value > o_max:
+            new_health = HealthStatus.WARNING
+    return new_health
+
+
+def random_config(rng):
+    """Mezcla de formatos: defaults JSON, personalizados, parciales y strings numéricos."""
+    lo = rng.uniform(0, 10)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return {"min": lo, "max": lo + 10, "optimal_min": lo + 2, "optimal_max": lo + 8}
+    if kind == 1:
+        return {"critical_min": lo, "critical_max": lo + 10, "min_value": lo + 3, "max_value": lo + 7}
+    if kind == 2:
+        return {"min": str(lo), "max_value": lo + 6}
+    if kind == 3:
+        return {"optimal_max": lo + 5}
+    return {}
+
+
+def fixture(n_devices, seed=0):
+    rng = random.Random(seed)
+    global_thresholds = {s if i % 3 else s.upper(): random_config(rng) for i, s in enumerate(SENSORS[:8])}
+    device_thresholds = {
+        f"D{i}": {rng.choice(SENSORS) if rng.random() < 0.8 else rng.choice(SENSORS).capitalize(): random_config(rng)
+                  for _ in range(rng.randrange(1, 4))}
+        for i in range(0, n_devices, 3)
+    }
+    now = datetime.now(timezone(timedelta(hours=-3))).replace(tzinfo=None)
+    rows = []
+    for i in range(n_devices):
+        sensors = {s if rng.random() < 0.9 else s.title(): {"value": rng.uniform(-2, 22)}
+                   for s in rng.sample(SENSORS, rng.randrange(0, len(SENSORS)))}
+        rows.append({
+            "device_id": f"D{i}",
+            "timestamp": now - timedelta(seconds=rng.choice([5, 5, 5, 600])),
+            "location": "Tanque",
+            "sensor_data": sensors,
+            "alerts": ["Sensor desconectado"] if rng.random() < 0.05 else [],
+        })
+    return global_thresholds, device_thresholds, pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_misma_salud_que_la_evaluacion_anterior(seed):
+    global_thresholds, device_thresholds, df = fixture(300, seed)
+    manager = DeviceManager(global_thresholds, {}, device_thresholds)
+    devices = manager.get_all_devices_info(df)
+
+    counts = {}
+    for device in devices:
+        if device.connection.value == "offline":
+            assert device.health == HealthStatus.UNKNOWN
+            assert device.device_id not in manager.get_health_states()
+            continue
+        expected = salud_anterior(global_thresholds, device_thresholds, device.device_id,
+                                  device.sensor_data, device.alerts)
+        assert device.health == expected, device
+        assert manager.get_health_states()[device.device_id] == expected
+        counts[expected] = counts.get(expected, 0) + 1
+    # El fixture cubre los tres estados
+    assert set(counts) == {HealthStatus.OK, HealthStatus.WARNING, HealthStatus.CRITICAL}
+
+
+def test_matriz_compilada_una_vez_por_version():
+    global_thresholds, device_thresholds, _ = fixture(30)
+    first = get_threshold_matrix(global_thresholds, device_thresholds)
+    # Otra instancia con el mismo contenido (nueva lectura de la configuración): misma matriz
+    copy = {k: dict(v) for k, v in device_thresholds.items()}
+    assert get_threshold_matrix(dict(global_thresholds), copy) is first
+
+    copy["D0"] = {"ph": {"min": 1, "max": 2}}
+    changed = get_threshold_matrix(global_thresholds, copy)
+    assert changed is not first
+    assert changed.c_max[changed.device_rows["D0"], changed.sensor_index["ph"]] == 2
+
+
+def test_umbral_especifico_vacio_anula_el_global():
+    manager = DeviceManager({"ph": {"min": 6, "max": 8}}, {}, {"D1": {"PH": {}}})
+    now = datetime.now(timezone(timedelta(hours=-3))).replace(tzinfo=None)
+    df = pd.DataFrame([{"device_id": d, "timestamp": now, "sensor_data": {"ph": 3.0}, "alerts": []} for d in ("D1", "D2")])
+    assert [d.health for d in manager.get_all_devices_info(df)] == [HealthStatus.OK, HealthStatus.CRITICAL]
+
+
+def test_umbral_invalido():
+    manager = DeviceManager({"ph": {"min": "bajo"}}, {})
+    now = datetime.now(timezone(timedelta(hours=-3))).replace(tzinfo=None)
+    df = pd.DataFrame([{"device_id": "D1", "timestamp": now, "sensor_data": {"ph": 7.0}, "alerts": []}])
+    with pytest.raises(ValueError):
+        manager.get_all_devices_info(df)
+    # Sin lecturas de ese sensor la configuración inválida no se usa
+    df.at[0, "sensor_data"] = {"temperature": 27.0}
+    assert manager.get_all_devices_info(df)[0].health == HealthStatus.OK
@@ -0,0 +1,100 @@
+"""
+Tests de la caché compartida de metadatos de dispositivos (modules/config_manager.py).
+Verifica que renderizar muchas tarjetas lee 'devices' una sola vez (sin find_one por
+tarjeta), que guardar desde Configuración invalida la caché y que el TTL la renueva.
+
+Requiere mongomock (pip install mongomock) como fixture en memoria.
+Uso: python -m pytest scripts/test_device_metadata.py
+"""
+from datetime import datetime
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from modules import config_manager as cm
+from modules.config_manager import ConfigManager, invalidate_device_metadata
+from modules.database import DatabaseConnection
+from modules.device_manager import ConnectionStatus, DeviceInfo, HealthStatus
+from views.dashboard import build_card_html
+
+
+class CountingCollection:
+    """Envuelve la colección 'devices' contando las lecturas a la base de datos."""
+
+    def __init__(self, coll):
+        self.coll = coll
+        self.reads = 0
+
+    def find(self, *args, **kwargs):
+        self.reads += 1
+        return self.coll.find(*args, **kwargs)
+
+    def find_one(self, *args, **kwargs):
+        self.reads += 1
+        return self.coll.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.coll, name)
+
+
+@pytest.fixture
+def db():
+    invalidate_device_metadata()
+    client = mongomock.MongoClient()
+    devices = client["meta"]["devices"]
+    devices.insert_many([
+        {"_id": f"BIOFLOC-{i:02d}", "alias": f"Estanque {i}", "location": f"Tanque {i}",
+         "umbrales": {"ph_min": 6.5, "ph_max": 8.5}}
+        for i in range(12)
+    ])
+    counting = CountingCollection(devices)
+    conn = DatabaseConnection.__new__(DatabaseConnection)
+    conn.sources = [{"name": "Test", "client": {"meta": {"devices": counting}}, "db": "meta",
+                     "coll_devices": "devices", "writable": True}]
+    conn.counting = counting
+    yield conn
+    invalidate_device_metadata()
+
+
+def card(device_id):
+    return DeviceInfo(device_id=device_id, location="", last_update=datetime.now(),
+                      connection=ConnectionStatus.ONLINE, health=HealthStatus.OK,
+                      sensor_data={"ph": 7.2})
+
+
+def test_tarjetas_sin_lecturas_por_dispositivo(db):
+    meta = ConfigManager(db).get_device_metadata()
+    assert meta["BIOFLOC-03"]["thresholds"] == {"ph": {"min": 6.5, "max": 8.5}}
+
+    # Cada render (y cada refresh del fragmento) crea su propio ConfigManager
+    for _ in range(3):
+        for i in range(12):
+            html = build_card_html(card(f"BIOFLOC-{i:02d}"), {}, ConfigManager(db))
+            assert f"Estanque {i}" in html and f"Tanque {i}" in html
+    assert db.counting.reads == 1
+
+    info = ConfigManager(db).get_device_info("SIN-REGISTRO")
+    assert info == {"alias": "SIN-REGISTRO", "location": "Desconocido"}
+    assert db.counting.reads == 1
+
+
+def test_guardar_invalida_la_cache(db):
+    cfg = ConfigManager(db)
+    assert cfg.get_device_info("BIOFLOC-01")["alias"] == "Estanque 1"
+
+    assert cfg.update_device_metadata("BIOFLOC-01", "Nuevo nombre", "Hall")
+    assert ConfigManager(db).get_device_info("BIOFLOC-01") == {"alias": "Nuevo nombre", "location": "Hall"}
+
+    assert cfg.update_device_threshold("BIOFLOC-01", "ph", {"min": 7.0, "max": 8.0})
+    assert ConfigManager(db).get_device_metadata()["BIOFLOC-01"]["thresholds"]["ph"] == {"min": 7.0, "max": 8.0}
+
+
+def test_ttl_renueva_la_cache(db, monkeypatch):
+    ConfigManager(db).get_device_metadata()
+    db.counting.update_one({"_id": "BIOFLOC-02"}, {"$set": {"alias": "Externo"}})
+    assert ConfigManager(db).get_device_info("BIOFLOC-02")["alias"] == "Estanque 2"
+
+    monkeypatch.setattr(cm, "DEVICE_METADATA_TTL_SECONDS", 0)
+    assert ConfigManager(db).get_device_info("BIOFLOC-02")["alias"] == "Externo"
+    assert db.counting.reads == 2
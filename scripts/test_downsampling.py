@@ -0,0 +1,114 @@
+"""
+Tests del downsampling por buckets (modules/downsampling.py y DatabaseConnection.fetch_bucketed_telemetry).
+
+Uso: python -m pytest scripts/test_downsampling.py
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from pymongo.errors import AutoReconnect
+
+from modules.database import DatabaseConnection
+from modules.downsampling import bucket_frame, bucket_minutes_for, combine_buckets, floor_to_bucket
+
+BASE = datetime(2026, 2, 25, 12, 0, 0)
+
+
+def test_tamano_de_bucket_acota_los_puntos():
+    assert bucket_minutes_for(timedelta(hours=1)) == 1
+    assert bucket_minutes_for(timedelta(days=3)) == 3
+    assert bucket_minutes_for(timedelta(weeks=1)) == 10
+    assert timedelta(weeks=1) / timedelta(minutes=bucket_minutes_for(timedelta(weeks=1))) <= 1500
+
+
+def test_alineamiento_igual_a_datetrunc():
+    ts = pd.Series(pd.to_datetime(["2026-02-25 12:07:59", "2026-02-25 12:10:00", "2026-02-25 23:59:59"]))
+    assert floor_to_bucket(ts, 10).tolist() == [
+        pd.Timestamp("2026-02-25 12:00"), pd.Timestamp("2026-02-25 12:10"), pd.Timestamp("2026-02-25 23:50")
+    ]
+
+
+def test_min_mean_max_por_bucket():
+    df = pd.DataFrame({
+        "timestamp": [BASE + timedelta(minutes=m) for m in (0, 3, 7, 12, 14)],
+        "device_id": ["A", "A", "A", "A", "B"],
+        "ph": [7.0, 8.0, np.nan, 6.0, 7.5],
+        "temperatura": [20.0, 99.0, 22.0, np.nan, 25.0],
+    })
+    out = bucket_frame(df, 10, sensor_aliases={"temperatura": "temperature"}, value_bounds={"temperature": (0, 60)})
+    out = out.set_index(["device_id", "sensor", "timestamp"])
+
+    assert out.loc[("A", "ph", BASE), ["min", "mean", "max", "count"]].tolist() == [7.0, 7.5, 8.0, 2]
+    assert out.loc[("A", "ph", BASE + timedelta(minutes=10)), "count"] == 1
+    # 99 °C queda fuera de los límites físicos
+    assert out.loc[("A", "temperature", BASE), ["min", "max", "count"]].tolist() == [20.0, 22.0, 2]
+    assert out.loc[("B", "temperature", BASE + timedelta(minutes=10)), "mean"] == 25.0
+
+
+def test_combinar_buckets_promedia_ponderado():
+    parts = pd.DataFrame({
+        "device_id": ["A", "A"], "timestamp": [BASE, BASE], "sensor": ["ph", "ph"],
+        "min": [6.0, 7.0], "mean": [7.0, 8.0], "max": [8.0, 9.0], "count": [3, 1],
+    })
+    row = combine_buckets(parts).iloc[0]
+    assert (row["min"], row["max"], row["count"]) == (6.0, 9.0, 4)
+    assert row["mean"] == pytest.approx(7.25)
+
+
+def test_fetch_bucketed_mezcla_date_e_iso():
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["hist"]["telemetria"]
+    docs = []
+    for i in range(600):
+        local = BASE + timedelta(minutes=i)
+        docs.append({"device_id": "A", "timestamp": local.replace(tzinfo=timezone(timedelta(hours=-3))).astimezone(timezone.utc),
+                     "sensors": {"ph": {"value": 7 + (i % 10) / 10, "unit": "pH"}}})
+        docs.append({"dispositivo_id": "P", "timestamp": local.isoformat(), "datos": {"temperatura": 20 + i % 5}})
+    docs.append({"device_id": "X", "timestamp": BASE, "sensors": {"ph": 7.0}})
+    coll.insert_many(docs)
+
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.sources = [{"name": "Test", "client": client, "db": "hist", "coll_telemetry": "telemetria"}]
+    ranges = {"A": (BASE, BASE + timedelta(hours=5)), "P": (BASE + timedelta(hours=2), BASE + timedelta(hours=9))}
+    result = db.fetch_bucketed_telemetry(ranges, 15, sensor_aliases={"temperatura": "temperature"})
+
+    assert set(result["device_id"]) == {"A", "P"}
+    assert set(result["sensor"]) == {"ph", "temperature"}
+    a = result[result["device_id"] == "A"]
+    assert a["count"].sum() == 5 * 60 + 1
+    assert a["timestamp"].min() == BASE and a["timestamp"].max() == BASE + timedelta(hours=5)
+    p = result[result["device_id"] == "P"]
+    assert p["count"].sum() == 7 * 60 + 1
+    assert p["mean"].between(20, 24).all()
+
+
+def test_error_transitorio_no_pasa_a_agrupar_en_python():
+    class Flaky:
+        calls = {"aggregate": 0, "find": 0}
+
+        def aggregate(self, *args, **kwargs):
+            self.calls["aggregate"] += 1
+            raise AutoReconnect("conexión perdida")
+
+        def find(self, *args, **kwargs):
+            self.calls["find"] += 1
+            return []
+
+    coll = Flaky()
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.sources = [{"name": "Test", "client": {"hist": {"telemetria": coll}}, "db": "hist", "coll_telemetry": "telemetria"}]
+    ranges = {"A": (BASE, BASE + timedelta(hours=5))}
+
+    assert db.fetch_bucketed_telemetry(ranges, 15).empty
+    # No se descargan los documentos crudos y la próxima llamada vuelve a agregar en el servidor
+    assert db.sources[0].get("bucket_strategy", "server") == "server"
+    assert coll.calls["find"] == 0
+    db.fetch_bucketed_telemetry(ranges, 15)
+    assert coll.calls["aggregate"] == 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,147 @@
+"""
+Tests de la línea de tiempo de salud (modules/health_timeline.py).
+Compara los intervalos fuera de rango vectorizados contra un recorrido fila a fila con la
+misma interpretación de umbrales que el dashboard, el resumen de tiempo fuera de rango y
+el tiempo de cálculo para una semana de datos de todos los dispositivos.
+
+Uso: python -m pytest scripts/test_health_timeline.py
+"""
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.device_manager import get_threshold_matrix
+from modules.health_timeline import MAX_GAP, time_out_of_range, violation_intervals
+
+GLOBAL = {
+    "temperature": {"min": 15, "max": 35, "optimal_min": 24, "optimal_max": 30},
+    "PH": {"critical_min": 6, "critical_max": 9, "min_value": 7, "max_value": 8.5},
+    "oxygen": {"optimal_min": 5},
+}
+DEVICES = {"D1": {"ph": {"min": 5, "max": 10}}, "D2": {"Temperature": {}}}
+SENSORS = ["temperature", "ph", "oxygen"]
+
+
+def nivel(config, value):
+    """Clasificación anterior de una lectura (0 = OK, 1 = alerta, 2 = crítico)."""
+    if not config:
+        return 0
+    if value < float(config.get("critical_min", config.get("min", -9999))) or \
+            value > float(config.get("critical_max", config.get("max", 9999))):
+        return 2
+    if value < float(config.get("min_value", config.get("optimal_min", -9999))) or \
+            value > float(config.get("max_value", config.get("optimal_max", 9999))):
+        return 1
+    return 0
+
+
+def intervalos_fila_a_fila(df, sensors):
+    """Rachas recorriendo cada dispositivo y sensor lectura por lectura."""
+    glob = {k.lower(): v for k, v in GLOBAL.items()}
+    result = []
+    for sensor in sensors:
+        for dev, group in df.sort_values("timestamp").groupby("device_id"):
+            dev_conf = {k.lower(): v for k, v in DEVICES.get(dev, {}).items()}
+            config = dev_conf.get(sensor, glob.get(sensor))
+            o_min = float(config.get("min_value", config.get("optimal_min", -9999))) if config else 0
+            o_max = float(config.get("max_value", config.get("optimal_max", 9999))) if config else 0
+            current, prev_ts = None, None
+            for ts, value in zip(group["timestamp"], group[sensor]):
+                if pd.isna(value):
+                    continue
+                level = nivel(config, value)
+                if current and (level != current["lvl"] or ts - prev_ts > MAX_GAP):
+                    current["end"] = ts if ts - prev_ts <= MAX_GAP else prev_ts
+                    result.append(current)
+                    current = None
+                if level and current is None:
+                    current = {"device_id": dev, "sensor": sensor, "lvl": level, "start": ts,
+                               "peak": value, "samples": 0}
+                if current:
+                    if abs(value - (o_max if value > o_max else o_min)) > abs(current["peak"] - (o_max if current["peak"] > o_max else o_min)):
+                        current["peak"] = value
+                    current["samples"] += 1
+                prev_ts = ts
+            if current:
+                current["end"] = prev_ts
+                result.append(current)
+    return result
+
+
+def history(n_devices, minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2026, 3, 1)
+    n = n_devices * minutes
+    df = pd.DataFrame({
+        "timestamp": np.tile(pd.date_range(start, periods=minutes, freq="min").to_numpy(), n_devices),
+        "device_id": np.repeat([f"D{i}" for i in range(n_devices)], minutes),
+    })
+    for sensor, (lo, hi) in {"temperature": (10, 40), "ph": (4, 11), "oxygen": (2, 9)}.items():
+        # Paseo aleatorio: rachas largas dentro y fuera de rango
+        walk = np.cumsum(rng.normal(0, (hi - lo) / 60, n))
+        values = lo + (hi - lo) * (np.sin(walk) + 1) / 2
+        values[rng.random(n) < 0.02] = np.nan
+        df[sensor] = values
+    # Huecos: un dispositivo sin datos una hora
+    gap = (df["device_id"] == "D1") & df["timestamp"].between(start + timedelta(hours=2), start + timedelta(hours=3))
+    return df[~gap].sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_intervalos_iguales_a_fila_a_fila(seed):
+    df = history(4, 600, seed)
+    matrix = get_threshold_matrix(GLOBAL, DEVICES)
+    result = violation_intervals(df, matrix, SENSORS)
+    expected = intervalos_fila_a_fila(df, SENSORS)
+
+    assert len(result) == len(expected) > 0
+    expected = pd.DataFrame(expected).sort_values(["sensor", "device_id", "start"]).reset_index(drop=True)
+    result = result.sort_values(["sensor", "device_id", "start"]).reset_index(drop=True)
+    assert list(result["level"]) == list(expected["lvl"].map({1: "warning", 2: "critical"}))
+    for col in ["device_id", "start", "end", "samples"]:
+        assert list(result[col]) == list(expected[col]), col
+    np.testing.assert_allclose(result["peak"], expected["peak"])
+    assert (result["duration"] == result["end"] - result["start"]).all()
+    # D2 anula el umbral global de temperatura: nunca fuera de rango
+    assert not ((result["device_id"] == "D2") & (result["sensor"] == "temperature")).any()
+
+
+def test_resumen_tiempo_fuera_de_rango():
+    t0 = datetime(2026, 3, 1)
+    df = pd.DataFrame({
+        "timestamp": [t0 + timedelta(minutes=m) for m in range(6)],
+        "device_id": "D9",
+        "ph": [7.5, 6.5, 6.8, 7.5, 5.0, 7.6],
+    })
+    intervals = violation_intervals(df, get_threshold_matrix(GLOBAL, DEVICES))
+    assert list(intervals["level"]) == ["warning", "critical"]
+    assert list(intervals["duration"]) == [timedelta(minutes=2), timedelta(minutes=1)]
+    assert list(intervals["peak"]) == [6.5, 5.0]
+
+    summary = time_out_of_range(intervals, df).iloc[0]
+    assert summary["warning"] == timedelta(minutes=2)
+    assert summary["critical"] == timedelta(minutes=1)
+    assert summary["episodes"] == 2
+    assert summary["worst"] == 5.0
+    assert summary["pct_out"] == pytest.approx(60.0)
+
+    assert violation_intervals(df.iloc[:0], get_threshold_matrix(GLOBAL, DEVICES)).empty
+    assert time_out_of_range(intervals.iloc[:0], df).empty
+
+
+def test_semana_de_todos_los_dispositivos_bajo_un_segundo():
+    # 20 dispositivos x 1 lectura por minuto x 7 días = ~200.000 filas, 3 sensores
+    df = history(20, 7 * 24 * 60)
+    matrix = get_threshold_matrix(GLOBAL, DEVICES)
+    violation_intervals(df.head(1000), matrix, SENSORS)
+
+    start = time.perf_counter()
+    intervals = violation_intervals(df, matrix, SENSORS)
+    time_out_of_range(intervals, df)
+    elapsed = time.perf_counter() - start
+    print(f"{len(df):,} filas -> {len(intervals):,} intervalos en {elapsed * 1000:.0f} ms")
+    assert len(intervals) > 0
+    assert elapsed < 1.0
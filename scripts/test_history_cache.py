@@ -0,0 +1,195 @@
+"""
+Tests de la caché incremental del historial (modules/history_cache.py).
+Verifica que carga completa + deltas entregan lo mismo que una carga completa desde cero,
+para timestamps Date y strings ISO, con _id ObjectId y con _id propios, sin perder documentos
+de escritores con el reloj atrasado ni los que llegan con retraso dentro de LATE_OVERLAP.
+Una fuente que empieza a recibir el otro esquema de timestamp no pierde esos documentos y
+varias sesiones que piden el historial a la vez disparan una sola consulta.
+
+Requiere mongomock (pip install mongomock) como fixture en memoria.
+Uso: python -m pytest scripts/test_history_cache.py
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip("mongomock")
+
+from modules.database import DatabaseConnection
+from modules.history_cache import LATE_OVERLAP, IncrementalHistoryCache, now_chile
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Caché Parquet en un directorio temporal (no en .cache/ del repo)."""
+    monkeypatch.setenv("TELEMETRY_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def make_db(client):
+    """DatabaseConnection apuntando sólo a la colección de prueba (sin leer el .env)."""
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.sources = [{"name": "Test", "client": client, "db": "hist", "coll_telemetry": "telemetria"}]
+    return db
+
+
+def make_doc(i, ts, schema, custom_id=False):
+    doc = ({"device_id": f"A{i % 3}", "timestamp": ts, "sensors": {"ph": {"value": 7 + i / 1000}}}
+           if schema == "date" else
+           {"dispositivo_id": f"P{i % 3}", "timestamp": ts.isoformat(), "datos": {"ph": 7 + i / 1000}})
+    if custom_id:
+        doc["_id"] = f"doc-{i:05d}"
+    return doc
+
+
+def full_reload(client):
+    return IncrementalHistoryCache().refresh(make_db(client))
+
+
+def assert_same(result, expected):
+    key = ["timestamp", "device_id"]
+    result = result.sort_values(key).reset_index(drop=True)
+    expected = expected.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("schema", ["date", "iso"])
+@pytest.mark.parametrize("custom_id", [False, True])
+def test_deltas_equivalen_a_carga_completa(schema, custom_id):
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["hist"]["telemetria"]
+    now = datetime.now(timezone.utc)
+    coll.insert_many([make_doc(i, now - timedelta(minutes=10 * (200 - i)), schema, custom_id) for i in range(200)])
+
+    cache = IncrementalHistoryCache()
+    db = make_db(client)
+    cache.refresh(db)
+
+    # Llegan datos nuevos, incluido uno con el MISMO timestamp que el último cargado
+    last_ts = now - timedelta(minutes=10)
+    coll.insert_many([make_doc(200, last_ts, schema, custom_id)] +
+                     [make_doc(i, now - timedelta(seconds=300 - i), schema, custom_id) for i in range(201, 205)])
+    cache.refresh(db)
+    assert cache.stats["last_delta_docs"] == 5
+
+    # Un refresco sin novedades no trae nada
+    cache.refresh(db)
+    assert cache.stats["last_delta_docs"] == 0
+    assert (cache.stats["full_loads"], cache.stats["delta_loads"]) == (1, 2)
+
+    assert_same(cache.snapshot(), full_reload(client))
+
+
+def test_ventana_descarta_filas_antiguas():
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["hist"]["telemetria"]
+    now = datetime.now(timezone.utc)
+    coll.insert_many([make_doc(i, now - timedelta(hours=i), "date") for i in range(48)])
+
+    cache = IncrementalHistoryCache(window=timedelta(days=1))
+    cache.refresh(make_db(client))
+    assert len(cache.snapshot()) == 24
+
+    cache.window = timedelta(hours=12)
+    cache.refresh(make_db(client))
+    df = cache.snapshot()
+    assert len(df) == 12
+    assert df["timestamp"].min() >= now_chile() - timedelta(hours=12)
+
+
+def test_datos_del_futuro_quedan_pendientes(monkeypatch):
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["hist"]["telemetria"]
+    now = datetime.now(timezone.utc)
+    coll.insert_many([make_doc(0, now - timedelta(minutes=5), "date"),
+                      make_doc(1, now + timedelta(seconds=2), "date")])
+
+    cache = IncrementalHistoryCache()
+    db = make_db(client)
+    cache.refresh(db)
+    assert len(cache.snapshot()) == 1
+
+    # Cuando llega su hora se incorpora una sola vez
+    later = now_chile() + timedelta(seconds=3)
+    monkeypatch.setattr("modules.history_cache.now_chile", lambda: later)
+    cache.refresh(db)
+    cache.refresh(db)
+    assert len(cache.snapshot()) == 2
+
+
+def test_escritor_con_reloj_atrasado_y_datos_tardios():
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["hist"]["telemetria"]
+    now = datetime.now(timezone.utc)
+    coll.insert_many([make_doc(i, now - timedelta(minutes=2 * (30 - i)), "date") for i in range(30)])
+
+    cache = IncrementalHistoryCache()
+    db = make_db(client)
+    cache.refresh(db)
+
+    # Otro escritor con el reloj atrasado: su ObjectId es MENOR que los ya cargados
+    skewed = make_doc(30, now - timedelta(seconds=30), "date")
+    skewed["_id"] = ObjectId.from_datetime(now - timedelta(hours=2))
+    # Un gateway que reenvía una lectura con algunos minutos de retraso (dentro del solape)
+    late = make_doc(31, now - LATE_OVERLAP + timedelta(minutes=3), "date")
+    coll.insert_many([skewed, late])
+
+    cache.refresh(db)
+    assert cache.stats["last_delta_docs"] == 2
+    cache.refresh(db)
+    assert cache.stats["last_delta_docs"] == 0
+    assert_same(cache.snapshot(), full_reload(client))
+
+
+@pytest.mark.parametrize("first, then", [("date", "iso"), ("iso", "date")])
+def test_delta_trae_el_esquema_que_aun_no_tenia_mark(first, then):
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["hist"]["telemetria"]
+    now = datetime.now(timezone.utc)
+    coll.insert_many([make_doc(i, now - timedelta(minutes=10 * (20 - i)), first) for i in range(20)])
+
+    cache = IncrementalHistoryCache()
+    db = make_db(client)
+    cache.refresh(db)
+
+    # La fuente empieza a recibir el otro esquema (hasta ahora sólo tenía mark del primero)
+    coll.insert_many([make_doc(i, now - timedelta(minutes=25 - i), then) for i in range(20, 24)])
+    cache.refresh(db)
+    assert cache.stats["last_delta_docs"] == 4
+    cache.refresh(db)
+    assert cache.stats["last_delta_docs"] == 0
+    assert_same(cache.snapshot(), full_reload(client))
+
+
+def test_sesiones_concurrentes_refrescan_una_vez():
+    client = mongomock.MongoClient(tz_aware=True)
+    client["hist"]["telemetria"].insert_many([make_doc(i, datetime.now(timezone.utc), "date") for i in range(3)])
+    db = make_db(client)
+    calls = []
+
+    def slow_fetch(source, query):
+        calls.append(query)
+        time.sleep(0.2)
+        return DatabaseConnection.fetch_telemetry_docs(db, source, query)
+
+    db.fetch_telemetry_docs = slow_fetch
+    cache = IncrementalHistoryCache(persist=False)
+    # Todas ven la caché vencida antes de tomar el lock; sólo la primera debe consultar
+    threads = [threading.Thread(target=cache.get, args=(db,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert cache.stats["full_loads"] + cache.stats["delta_loads"] == 1
+    cache.get(db, force=True)
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
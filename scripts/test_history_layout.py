@@ -0,0 +1,195 @@
+"""
+Tests de la disposición compacta del historial (modules/history_layout.py).
+Verifica que el frame compacto tiene las mismas lecturas (categóricas, float32 dentro de la
+tolerancia, ordenado por dispositivo y tiempo), que la memoria por millón de filas baja
+varias veces, y que filtros e intervalos fuera de rango dan lo mismo que sobre el frame original.
+El filtro por ventana de tiempo usa offsets por dispositivo + searchsorted: slices sin copia
+y un costo que no depende del tamaño del historial.
+
+Uso: python -m pytest scripts/test_history_layout.py
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.device_manager import get_threshold_matrix
+from modules.health_timeline import time_out_of_range, violation_intervals
+from modules.history_layout import (FLOAT32_TOLERANCE, compact_history, concat_history, device_blocks,
+                                    expand_history, layout_report, memory_per_million_rows, prepare_history,
+                                    restore_float64)
+from views.graphs import filtrar_dataframe
+
+
+@pytest.fixture
+def history():
+    rng = np.random.default_rng(5)
+    n = 50_000
+    ids = np.array([f"BIOFLOC-{i:02d}" for i in range(12)])
+    dev = ids[rng.integers(0, len(ids), n)]
+    df = pd.DataFrame({
+        "timestamp": pd.Timestamp("2026-03-01") + pd.to_timedelta(rng.integers(0, 7 * 86400, n), unit="s"),
+        "device_id": dev,
+        "location": np.char.replace(dev, "BIOFLOC", "Tanque"),
+        "temperature": np.round(rng.uniform(18, 34, n), 2),
+        "ph": np.round(rng.uniform(5, 10, n), 2),
+        "conductivity": np.round(rng.uniform(900, 1500, n), 1),
+    })
+    df.loc[rng.random(n) < 0.1, "ph"] = np.nan
+    return df
+
+
+def by_device_time(df):
+    df = df.astype({"device_id": str, "location": str})
+    return df.sort_values(["device_id", "timestamp"], kind="stable").reset_index(drop=True)
+
+
+def test_mismas_lecturas_en_disposicion_compacta(history):
+    compact = compact_history(history)
+
+    assert isinstance(compact["device_id"].dtype, pd.CategoricalDtype)
+    assert isinstance(compact["location"].dtype, pd.CategoricalDtype)
+    assert all(compact[c].dtype == np.float32 for c in ["temperature", "ph", "conductivity"])
+    assert list(compact.columns) == list(history.columns)
+    # Bloques contiguos por dispositivo, en orden de tiempo
+    codes = compact["device_id"].cat.codes.to_numpy()
+    assert (np.diff(codes) >= 0).all()
+    assert compact.groupby("device_id")["timestamp"].is_monotonic_increasing.all()
+
+    expected = by_device_time(history)
+    result = by_device_time(compact)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, atol=FLOAT32_TOLERANCE, rtol=0)
+
+
+def test_lotes_nuevos_se_unen_sin_reprocesar_el_historial(history):
+    base = prepare_history(history.iloc[:40_000])
+    batch = history.iloc[40_000:].copy()
+    batch.loc[batch.index[:50], "device_id"] = "BIOFLOC-NUEVO"
+    batch = batch.rename(columns={"temperature": "Temperatura"}).assign(od=6.5)
+
+    merged = concat_history([base, prepare_history(batch)])
+    assert isinstance(merged["device_id"].dtype, pd.CategoricalDtype)
+    # Sensor que sólo trae el lote nuevo: NaN en el resto, pero sigue en float32
+    assert merged["oxygen"].dtype == np.float32 and merged["temperature"].dtype == np.float32
+    assert device_blocks(merged) is not None and "BIOFLOC-NUEVO" in device_blocks(merged)
+
+    expected = compact_history(pd.concat([history.iloc[:40_000], batch.rename(columns={
+        "Temperatura": "temperature", "od": "oxygen"})], ignore_index=True))
+    pd.testing.assert_frame_equal(by_device_time(merged)[expected.columns], by_device_time(expected), check_dtype=False)
+
+
+def test_vuelta_a_float64_entrega_la_lectura_original(history):
+    values = np.array([7.2, 27.3, 0.0, -1.5, 1234.5, 0.00125, 98765.4, np.nan])
+    assert np.array_equal(restore_float64(values.astype(np.float32)), values, equal_nan=True)
+
+    # Datos y exportaciones: mismos tipos y valores EXACTOS que el historial plano
+    expanded = expand_history(compact_history(history))
+    pd.testing.assert_frame_equal(expanded.sort_values(["device_id", "timestamp"], kind="stable").reset_index(drop=True),
+                                  history.sort_values(["device_id", "timestamp"], kind="stable").reset_index(drop=True),
+                                  check_exact=True)
+
+
+def test_columna_sin_precision_suficiente_queda_en_float64(history):
+    history["contador"] = 123_456_789.123 + np.arange(len(history))
+    compact = compact_history(history)
+    assert compact["contador"].dtype == np.float64
+    assert compact["ph"].dtype == np.float32
+
+
+def test_memoria_por_millon_de_filas(history):
+    report = layout_report(history)
+    print(f"{report['mb_per_million_before']:.0f} MB -> {report['mb_per_million_after']:.0f} MB por millón de filas")
+    assert report["ratio"] > 2.5
+    # Con strings como objetos de Python (pandas < 3) la diferencia es aún mayor
+    legacy = history.astype({"device_id": object, "location": object})
+    assert memory_per_million_rows(legacy) / memory_per_million_rows(compact_history(legacy)) > 5
+
+
+@pytest.mark.parametrize("delta", [timedelta(minutes=30), timedelta(days=1), None])
+def test_filtro_igual_sobre_frame_compacto(history, delta):
+    compact = compact_history(history)
+    before = compact.copy()
+    devices = ["BIOFLOC-03", "BIOFLOC-07", "BIOFLOC-11"]
+
+    result = filtrar_dataframe(compact, devices, delta)
+    expected = filtrar_dataframe(history, devices, delta)
+    assert len(result) == len(expected) > 0
+    pd.testing.assert_frame_equal(by_device_time(result), by_device_time(expected),
+                                  check_dtype=False, atol=FLOAT32_TOLERANCE, rtol=0)
+    # El historial cacheado no cambia
+    pd.testing.assert_frame_equal(compact, before)
+
+
+def test_intervalos_iguales_con_float32():
+    # Lecturas justo en el umbral: float32 no debe cambiarlas de lado
+    thresholds = {"ph": {"min": 6.3, "max": 9.1, "optimal_min": 6.8, "optimal_max": 8.2}}
+    values = [6.8, 6.79, 8.2, 8.21, 6.3, 6.29, 9.1, 9.11, 7.3]
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2026-03-01", periods=len(values), freq="min"),
+        "device_id": "D1",
+        "location": "Tanque",
+        "ph": values,
+    })
+    matrix = get_threshold_matrix(thresholds, {})
+    expected = violation_intervals(df, matrix)
+    result = violation_intervals(compact_history(df), matrix)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(result.astype({"device_id": str}), expected, atol=1e-5, rtol=0)
+
+
+def test_subconjunto_de_dispositivos_sin_categorias_vacias(history):
+    # El filtro conserva TODAS las categorías del historial; con pandas 2 (observed=False por
+    # defecto) cada groupby devolvería también los dispositivos no seleccionados, vacíos
+    devices = ["BIOFLOC-02", "BIOFLOC-09"]
+    subset = filtrar_dataframe(compact_history(history), devices, None)
+    assert len(subset["device_id"].cat.categories) == 12
+
+    thresholds = {"ph": {"min": 5.5, "max": 9.5, "optimal_min": 6.5, "optimal_max": 8.5}}
+    intervals = violation_intervals(subset, get_threshold_matrix(thresholds, {}))
+    assert not isinstance(intervals["device_id"].dtype, pd.CategoricalDtype)
+    assert set(intervals["device_id"]) == set(devices)
+
+    summary = time_out_of_range(intervals, subset)
+    assert sorted(summary["device_id"].unique()) == devices
+    assert summary[["warning", "critical"]].notna().all().all()
+    assert (summary["episodes"] > 0).all()
+
+
+def test_ventana_por_dispositivo_son_slices_sin_copia(history):
+    compact = compact_history(history)
+    blocks = device_blocks(compact)
+    assert device_blocks(compact) is blocks  # memorizado por frame
+    assert sum(hi - lo for lo, hi in blocks.values()) == len(compact)
+    # Fuera del orden compacto se usa el filtro por máscara
+    assert device_blocks(compact.iloc[::-1]) is None
+    assert device_blocks(history) is None
+
+    window = filtrar_dataframe(compact, ["BIOFLOC-05"], timedelta(hours=6))
+    assert np.shares_memory(window["ph"].to_numpy(), compact["ph"].to_numpy())
+    assert window["timestamp"].iloc[-1] - window["timestamp"].iloc[0] <= timedelta(hours=6)
+    assert filtrar_dataframe(compact, ["NO-EXISTE"], timedelta(hours=6)).empty
+
+
+def test_cambiar_rango_cuesta_milisegundos_sin_importar_el_tamano():
+    rng = np.random.default_rng(9)
+
+    def build(n):
+        dev = rng.integers(0, 60, n)
+        return compact_history(pd.DataFrame({
+            "timestamp": pd.Timestamp("2026-03-01") + pd.to_timedelta(rng.integers(0, 7 * 86400, n), unit="s"),
+            "device_id": np.array([f"D{i:02d}" for i in range(60)])[dev],
+            "ph": rng.uniform(5, 10, n),
+        }))
+
+    timings = {}
+    for n in (20_000, 1_000_000):
+        df = build(n)
+        device_blocks(df)  # offsets precalculados (una vez por refresco del historial)
+        start = time.perf_counter()
+        for delta in (timedelta(minutes=5), timedelta(hours=24), timedelta(weeks=1)):
+            filtrar_dataframe(df, ["D01", "D02", "D03"], delta)
+        timings[n] = (time.perf_counter() - start) / 3
+    print({n: f"{t * 1000:.2f} ms" for n, t in timings.items()})
+    assert timings[1_000_000] < 0.02
@@ -0,0 +1,57 @@
+"""
+Tests de los helpers de la vista Datos (views/history.py).
+Verifica que el filtro de texto vectorizado sobre categóricas da las mismas filas que el
+filtro fila a fila anterior, y los alias de la vista previa.
+
+Uso: python -m pytest scripts/test_history_view.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from views.history import filtrar_por_texto, preparar_resultado, vista_previa
+
+ALIAS = {"BIOFLOC-01": "Estanque Norte", "BIOFLOC-03": "Tanque Sur"}
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(3)
+    n = 2000
+    ids = np.array([f"BIOFLOC-{i:02d}" for i in range(6)] + ["Lab (C+)"])
+    locs = np.array(["Tanque 1", "Tanque 12", "Hall", None], dtype=object)
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2026-03-01", periods=n, freq="min"),
+        "device_id": ids[rng.integers(0, len(ids), n)],
+        "location": locs[rng.integers(0, len(locs), n)],
+        "ph": rng.random(n),
+    })
+
+
+def filtro_fila_a_fila(df, text):
+    """Implementación anterior (texto literal)."""
+    s = text.lower()
+    alias = df["device_id"].map(lambda x: ALIAS.get(x, "").lower())
+    keep = (df["device_id"].astype(str).str.lower().str.contains(s, regex=False)
+            | df["location"].fillna("").astype(str).str.lower().str.contains(s, regex=False)
+            | alias.str.contains(s, regex=False))
+    return df[keep]
+
+
+@pytest.mark.parametrize("text", ["tanque 1", "NORTE", "biofloc-0", "(c+)", "  hall ", "sin coincidencias"])
+def test_filtro_texto_igual_a_fila_a_fila(df, text):
+    prepared = preparar_resultado(df.copy())
+    result = filtrar_por_texto(prepared, text, ALIAS)
+    expected = filtro_fila_a_fila(df, text.strip())
+    assert result.index.equals(expected.index)
+
+
+def test_preparar_y_vista_previa(df):
+    prepared = preparar_resultado(df.copy())
+    assert isinstance(prepared["device_id"].dtype, pd.CategoricalDtype)
+    assert filtrar_por_texto(prepared, "", ALIAS) is prepared
+
+    preview = vista_previa(prepared, ALIAS, rows=50)
+    assert list(preview.columns) == ["timestamp", "Dispositivo", "location", "ph"]
+    expected = df["device_id"].head(50).map(lambda x: ALIAS.get(x, x))
+    assert list(preview["Dispositivo"].astype(str)) == list(expected)
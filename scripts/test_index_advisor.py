@@ -0,0 +1,81 @@
+"""
+Tests del asesor de índices (scripts/index_advisor.py).
+Sólo la parte pura: cobertura de índices por prefijo, lectura de planes de explain() y que
+--uri no se conecta a las fuentes del .env. (Correr el asesor requiere un mongod real;
+mongomock no implementa explain.)
+
+Uso: python -m pytest scripts/test_index_advisor.py
+"""
+from modules import database
+from scripts.index_advisor import (
+    RECOMMENDED_TELEMETRY_INDEXES, index_covers, local_db, missing_indexes, plan_label, summarize_explain,
+)
+
+
+def test_index_covers_prefix_and_direction():
+    wanted = [("device_id", 1), ("timestamp", -1)]
+    assert index_covers([("device_id", 1), ("timestamp", -1)], wanted)
+    assert index_covers([("device_id", -1), ("timestamp", 1)], wanted)  # recorrido inverso
+    assert index_covers([("device_id", 1), ("timestamp", -1), ("location", 1)], wanted)
+    assert not index_covers([("device_id", 1), ("timestamp", 1)], wanted)  # sentido mixto distinto
+    assert not index_covers([("device_id", 1)], wanted)
+    assert not index_covers([("timestamp", -1), ("device_id", 1)], wanted)
+
+
+def test_missing_indexes():
+    existing = [[("_id", 1)], [("timestamp", 1)], [("device_id", 1), ("timestamp", -1)]]
+    assert missing_indexes(existing) == [
+        [("dispositivo_id", 1), ("timestamp", -1)],
+        [("metadata.device_id", 1), ("timestamp", -1)],
+    ]
+    assert missing_indexes(RECOMMENDED_TELEMETRY_INDEXES) == []
+
+
+def test_summarize_find_explain():
+    explain = {
+        "queryPlanner": {"winningPlan": {
+            "stage": "SORT",
+            "inputStage": {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN", "direction": "forward"}},
+        }},
+        "executionStats": {"nReturned": 10, "executionTimeMillis": 42, "totalKeysExamined": 0, "totalDocsExamined": 5000},
+    }
+    summary = summarize_explain(explain)
+    assert summary["stages"] == ["SORT", "FETCH", "COLLSCAN"]
+    assert summary["collscan"] and summary["blocking_sort"]
+    assert summary["docs_examined"] == 5000 and summary["returned"] == 10
+    assert plan_label(summary) == "COLLSCAN+SORT"
+
+
+def test_summarize_aggregate_explain_with_or():
+    # aggregate: el plan viene dentro de stages[0].$cursor; con SBE el árbol cuelga de queryPlan
+    explain = {"stages": [
+        {"$cursor": {
+            "queryPlanner": {"winningPlan": {"queryPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "OR", "inputStages": [
+                    {"stage": "IXSCAN", "indexName": "device_id_1_timestamp_-1"},
+                    {"stage": "IXSCAN", "indexName": "dispositivo_id_1_timestamp_-1"},
+                ]},
+            }}},
+            "executionStats": {"nReturned": 3, "executionTimeMillis": 1, "totalKeysExamined": 3, "totalDocsExamined": 3},
+        }},
+        {"$group": {}},
+    ]}
+    summary = summarize_explain(explain)
+    assert summary["indexes"] == ["device_id_1_timestamp_-1", "dispositivo_id_1_timestamp_-1"]
+    assert not summary["collscan"] and not summary["blocking_sort"]
+    assert summary["keys_examined"] == 3
+    assert plan_label(summary) == "IXSCAN(device_id_1_timestamp_-1,dispositivo_id_1_timestamp_-1)"
+
+
+def test_local_db_no_usa_el_env(monkeypatch):
+    monkeypatch.setenv("MONGO_URI", "mongodb://env-host:27017")
+    monkeypatch.setenv("MONGO_DB", "produccion")
+
+    def fail(uri):
+        raise AssertionError(f"no debe conectarse a {uri}")
+
+    monkeypatch.setattr(database, "get_mongo_client", fail)
+    client = object()
+    db = local_db(client, "local", "telemetria", "devices")
+    assert [(s["client"], s["db"], s["coll_telemetry"]) for s in db.sources] == [(client, "local", "telemetria")]
@@ -0,0 +1,252 @@
+"""
+Tests del estado en vivo compartido (modules/live_state.py).
+Prueba de carga: N sesiones simuladas leyendo la foto del poller mientras corre el hilo.
+Las consultas a la base de datos no crecen con la cantidad de sesiones. También verifica
+que los refresh() simultáneos se agrupan en una consulta, el modo inactivo y los errores.
+Feed de lecturas nuevas: change stream simulado y, sin change streams (mongomock, como un
+mongod standalone), consulta por cursor de _id.
+
+Uso: python -m pytest scripts/test_live_state.py
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from modules.database import DatabaseConnection
+from modules.live_state import LiveStatePoller
+
+
+class FakeDB:
+    """Expone get_latest_by_device contando las consultas (cada una tarda `latency` segundos)."""
+
+    def __init__(self, latency=0.01, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def get_latest_by_device(self):
+        with self._lock:
+            self.queries += 1
+            n = self.queries
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("Mongo no disponible")
+        self.last_timings = {"total": self.latency}
+        return pd.DataFrame({"device_id": ["D1", "D2"], "timestamp": [pd.Timestamp.now()] * 2, "poll": [n, n]})
+
+
+def run_sessions(n_sessions, seconds=1.0, interval=0.2):
+    """N sesiones leyendo la foto cada ~20 ms (fragmentos / reruns) mientras corre el poller."""
+    db = FakeDB()
+    poller = LiveStatePoller(db, interval_seconds=interval).start()
+    stop = time.time() + seconds
+    seen = []
+
+    def session():
+        versions = set()
+        while time.time() < stop:
+            snap = poller.snapshot()
+            versions.add(snap.version)
+            time.sleep(0.02)
+        seen.append(versions)
+
+    threads = [threading.Thread(target=session) for _ in range(n_sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    poller.stop()
+    return db.queries, poller, seen
+
+
+def test_consultas_constantes_con_mas_sesiones():
+    results = {n: run_sessions(n) for n in (1, 10, 50)}
+    queries = {n: r[0] for n, r in results.items()}
+    print(f"consultas por cantidad de sesiones: {queries}")
+
+    # 1 s a un poll cada 0.2 s: ~5-6 consultas, sean 1 o 50 sesiones
+    for n, (q, poller, seen) in results.items():
+        assert 3 <= q <= 8, (n, q)
+        assert len(seen) == n and all(len(v) >= 3 for v in seen)
+        assert poller.stats["reads"] >= n * 20
+    assert queries[50] <= queries[1] + 2
+
+
+def test_refresh_simultaneos_una_consulta():
+    db = FakeDB(latency=0.05)
+    poller = LiveStatePoller(db, interval_seconds=60)
+    poller.poll()
+    time.sleep(0.1)
+
+    barrier = threading.Barrier(20)
+    snaps = []
+
+    def click():
+        barrier.wait()
+        snaps.append(poller.refresh(max_age=0.08))
+
+    threads = [threading.Thread(target=click) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert db.queries == 2
+    assert {s.version for s in snaps} == {2}
+    assert poller.stats["forced"] == 1
+
+
+def test_inactivo_deja_de_consultar_y_despierta():
+    db = FakeDB()
+    poller = LiveStatePoller(db, interval_seconds=0.05, idle_seconds=0.2).start()
+    poller.snapshot()
+    time.sleep(0.5)
+    idle_queries = db.queries
+    time.sleep(0.3)
+    assert db.queries == idle_queries
+    assert poller.metrics()["idle"]
+
+    # La próxima lectura trae una foto nueva (no la vieja del momento en que se durmió)
+    snap = poller.snapshot()
+    assert snap.age_seconds < 0.05
+    assert db.queries > idle_queries
+    poller.stop()
+
+
+def test_error_conserva_la_foto_anterior():
+    db = FakeDB()
+    poller = LiveStatePoller(db, interval_seconds=0.05)
+    first = poller.poll()
+    db.fail = True
+    assert poller.refresh(max_age=0) is first
+
+    metrics = poller.metrics()
+    assert metrics["errors"] == 1 and "no disponible" in metrics["last_error"]
+    assert metrics["version"] == 1 and metrics["devices"] == 2
+    assert metrics["poll_s"] >= 0.01 and not metrics["running"]
+
+    assert LiveStatePoller(db).snapshot() is None
+
+
+# --- Feed de lecturas nuevas ---
+
+def wait_for(condition, timeout=3.0):
+    stop = time.time() + timeout
+    while time.time() < stop:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def reading(device, minutes_ago, ph):
+    return {"device_id": device, "timestamp": datetime.now(timezone.utc) - timedelta(minutes=minutes_ago),
+            "sensors": {"ph": {"value": ph}}}
+
+
+def row(poller, device):
+    frame = poller.snapshot().frame
+    return frame[frame["device_id"] == device].iloc[0]
+
+
+@pytest.fixture
+def mongo_db():
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient(tz_aware=True)
+    client["live"]["telemetria"].insert_many([reading("D1", 10, 7.0), reading("D2", 10, 7.1)])
+    conn = DatabaseConnection.__new__(DatabaseConnection)
+    conn.sources = [{"name": "Test", "client": client, "db": "live", "coll_telemetry": "telemetria",
+                     "coll_devices": None, "writable": True}]
+    conn.collection = client["live"]["telemetria"]
+    return conn
+
+
+def test_feed_sin_change_streams_consulta_por_id(mongo_db):
+    poller = LiveStatePoller(mongo_db, interval_seconds=0.05, reconcile_seconds=60)
+    first = poller.poll()
+    poller.start_feeds(use_change_stream=True, tail_seconds=0.05).start()
+    feed = poller.feeds[0]
+    assert wait_for(lambda: feed.mode == "tail" and feed._cursor_value is not None)
+    assert poller.full_interval == 60
+
+    mongo_db.collection.insert_many([
+        reading("D1", 0, 7.9),    # más nueva: reemplaza
+        reading("D2", 30, 5.0),   # más vieja que la foto: se ignora
+        reading("D9", 0, 6.5),    # dispositivo nuevo
+    ])
+    assert wait_for(lambda: poller._snapshot.version > first.version)
+    assert row(poller, "D1")["sensor_data"] == {"ph": 7.9}
+    assert row(poller, "D2")["sensor_data"] == {"ph": 7.1}
+    assert row(poller, "D9")["sensor_data"] == {"ph": 6.5}
+
+    # Sin lecturas nuevas no hay versiones nuevas, y la consulta completa no se repitió
+    version = poller._snapshot.version
+    time.sleep(0.3)
+    poller.stop()
+    assert poller._snapshot.version == version
+    assert poller.stats["polls"] == 1 and poller.stats["pushed"] == 2
+    metrics = poller.metrics()["feeds"][0]
+    assert metrics["docs"] == 3 and metrics["queries"] >= 3 and metrics["errors"] == 1
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+        self.alive = True
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self.events:
+            event = self.events.pop(0)
+            self.resume_token = {"_data": id(event)}
+            return event
+        time.sleep(0.01)
+        return None
+
+
+class StreamCollection:
+    """Colección con change streams: watch() entrega los inserts; find() no debería usarse."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.events = []
+        self.finds = 0
+
+    def insert(self, doc):
+        self.collection.insert_one(doc)
+        self.events.append({"operationType": "insert", "fullDocument": doc})
+
+    def watch(self, pipeline, **kwargs):
+        return FakeStream(self.events)
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+        return self.collection.find(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_feed_por_change_stream(mongo_db):
+    stream_coll = StreamCollection(mongo_db.collection)
+    mongo_db.sources[0]["client"] = {"live": {"telemetria": stream_coll}}
+    poller = LiveStatePoller(mongo_db, interval_seconds=60)
+    first = poller.poll()
+    poller.start_feeds(use_change_stream=True, tail_seconds=0.05)
+
+    stream_coll.insert(reading("D2", 0, 8.2))
+    assert wait_for(lambda: poller._snapshot.version > first.version)
+    assert row(poller, "D2")["sensor_data"] == {"ph": 8.2}
+    poller.stop()
+
+    assert poller.feeds[0].mode == "change_stream"
+    assert stream_coll.finds == 0
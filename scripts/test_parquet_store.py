@@ -0,0 +1,144 @@
+"""
+Tests de la caché Parquet en disco (modules/parquet_store.py).
+Verifica el plan días cerrados / faltantes / abiertos, el roundtrip escritura-lectura,
+y que el historial sembrado desde disco es igual a una carga completa desde Mongo.
+
+Uso: python -m pytest scripts/test_parquet_store.py
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from modules.parquet_store import CLOSED_DAY_GRACE, ParquetTelemetryStore, contiguous_runs, get_telemetry_store
+
+NOW = datetime(2026, 2, 25, 12, 30, 0)
+DAY = datetime(2026, 2, 20)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr("modules.parquet_store.now_chile", lambda: NOW)
+    return ParquetTelemetryStore(tmp_path)
+
+
+def day_frame(day, devices=("A", "B")):
+    rows = []
+    for i in range(24):
+        for dev in devices:
+            row = {"timestamp": day + timedelta(hours=i), "device_id": dev, "location": "Lab"}
+            row["ph" if dev == "A" else "od"] = 7.0 + i / 100
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def test_plan_separa_cerrados_faltantes_y_abierto(store):
+    store.write_days(day_frame(DAY), [DAY])
+    cached, missing, open_from = store.plan(DAY - timedelta(days=1), NOW)
+    assert cached == [DAY]
+    # Con el margen de 48 h el 23 y el 24 siguen abiertos (pueden llegar datos atrasados)
+    assert missing == [DAY - timedelta(days=1)] + [DAY + timedelta(days=d) for d in range(1, 3)]
+    assert open_from == datetime(2026, 2, 23)
+
+    # Un rango que termina antes de hoy no tiene tramo abierto
+    assert store.plan(DAY, DAY + timedelta(hours=5))[2] is None
+    assert contiguous_runs(missing) == [(missing[0], missing[0]), (missing[1], missing[-1])]
+
+
+def test_dia_recien_terminado_sigue_abierto(tmp_path, monkeypatch):
+    # 00:30 del 25: el 24 terminó hace menos que el margen de gracia, no se puede guardar aún
+    monkeypatch.setattr("modules.parquet_store.now_chile", lambda: datetime(2026, 2, 25, 0, 30))
+    store = ParquetTelemetryStore(tmp_path)
+    yesterday = datetime(2026, 2, 24)
+    assert store.plan(yesterday, datetime(2026, 2, 25, 0, 30)) == ([], [], yesterday)
+    store.write_days(day_frame(yesterday), [yesterday])
+    assert not store.has_day(yesterday)
+
+
+def test_datos_atrasados_alcanzan_a_llegar_antes_de_cerrar(tmp_path, monkeypatch):
+    assert CLOSED_DAY_GRACE >= timedelta(hours=24)
+    # 30 h después de terminado el 24 un gateway sube su respaldo: el día sigue abierto
+    monkeypatch.setattr("modules.parquet_store.now_chile", lambda: datetime(2026, 2, 26, 6, 0))
+    store = ParquetTelemetryStore(tmp_path)
+    yesterday = datetime(2026, 2, 24)
+    assert yesterday not in store.plan(yesterday, datetime(2026, 2, 26, 6, 0))[1]
+    # Margen configurable por instancia (TELEMETRY_CLOSED_DAY_GRACE_HOURS para el global)
+    short = ParquetTelemetryStore(tmp_path, grace=timedelta(hours=1))
+    assert short.plan(yesterday, datetime(2026, 2, 26, 6, 0))[1] == [yesterday, datetime(2026, 2, 25)]
+
+
+def test_roundtrip_con_esquemas_distintos_por_dispositivo(store):
+    df = day_frame(DAY)
+    store.write_days(df, [DAY])
+    assert sorted(store.devices_for_day(DAY)) == ["A", "B"]
+
+    out = store.read_days([DAY]).sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+    expected = df.sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(out[expected.columns], expected, check_dtype=False)
+    # Cada archivo guarda sólo sus sensores; al unirlos los faltantes quedan NaN
+    assert out.loc[out["device_id"] == "A", "od"].isna().all()
+
+    only_b = store.read_days([DAY], devices=["B"])
+    assert set(only_b["device_id"]) == {"B"} and len(only_b) == 24
+
+
+def test_dia_sin_datos_queda_marcado(store):
+    store.write_days(pd.DataFrame(), [DAY])
+    assert store.has_day(DAY)
+    assert store.read_days([DAY]).empty
+
+
+def test_ids_con_caracteres_especiales(store):
+    df = day_frame(DAY, devices=("sala/1", "ñandú 2"))
+    store.write_days(df, [DAY])
+    assert sorted(store.devices_for_day(DAY)) == ["sala/1", "ñandú 2"]
+    assert len(store.read_days([DAY], devices=["sala/1"])) == 24
+
+
+def test_desactivado_por_env(monkeypatch):
+    class FakeDb:
+        sources = [{"name": "Test", "db": "hist", "coll_telemetry": "telemetria"}]
+
+    monkeypatch.setenv("TELEMETRY_CACHE_DIR", "off")
+    assert get_telemetry_store(FakeDb()) is None
+
+
+def test_historial_sembrado_desde_disco_igual_a_mongo(tmp_path, monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    from modules.database import DatabaseConnection
+    from modules.history_cache import IncrementalHistoryCache
+
+    client = mongomock.MongoClient(tz_aware=True)
+    now = datetime.now(timezone.utc)
+    client["hist"]["telemetria"].insert_many([
+        {"device_id": f"A{i % 3}", "timestamp": now - timedelta(minutes=30 * i),
+         "sensors": {"ph": {"value": 7 + i / 1000}}} for i in range(400)
+    ])
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.sources = [{"name": "Test", "client": client, "db": "hist", "coll_telemetry": "telemetria"}]
+
+    expected = IncrementalHistoryCache(persist=False).refresh(db)
+
+    monkeypatch.setenv("TELEMETRY_CACHE_DIR", str(tmp_path))
+    cold = IncrementalHistoryCache().refresh(db)
+    store = get_telemetry_store(db)
+    assert store.stats["days_written"] >= 5
+
+    warm_cache = IncrementalHistoryCache()
+    warm = warm_cache.refresh(db)
+    assert store.stats["days_read"] >= 5
+
+    key = ["timestamp", "device_id"]
+    for df in (cold, warm):
+        pd.testing.assert_frame_equal(
+            df.sort_values(key).reset_index(drop=True)[expected.columns],
+            expected.sort_values(key).reset_index(drop=True),
+            check_dtype=False,
+        )
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,131 @@
+"""
+Tests de las cotas exactas por rango (timestamp_range_query) usadas por la vista de Datos.
+Matriz: variantes de timestamp (Date aware/naive, ISO local con 'T' o espacio, sin segundos,
+Z, +00:00, America/Santiago con horario de verano, Europe/Madrid, +05:30, offsets sin ':' como
+-0300 y strings de sólo fecha) x instantes alrededor de bordes de día, cambios de horario (Chile
+y Europa) y fin de año.
+Verifica que la consulta en el servidor no pierde ningún registro del rango y que, para las
+variantes con cota exacta, sólo trae lo pedido (más a lo sumo un minuto por borde).
+
+Requiere mongomock (pip install mongomock) como fixture en memoria.
+Uso: python -m pytest scripts/test_range_bounds.py
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from modules.database import DatabaseConnection
+from modules.telemetry_normalizer import CHILE_TZ, parse_timestamps, timestamp_range_query
+from modules.telemetry_repository import load_range_mongo
+
+# Bordes en hora local (Chile fija UTC-3, la del normalizador)
+BOUNDARIES = [
+    datetime(2026, 2, 25),   # día normal
+    datetime(2026, 3, 29),   # Europa pasa a horario de verano
+    datetime(2026, 4, 5),    # Chile continental: -03:00 -> -04:00
+    datetime(2026, 9, 6),    # Chile continental: -04:00 -> -03:00
+    datetime(2026, 10, 25),  # Europa vuelve a horario de invierno
+    datetime(2027, 1, 1),    # fin de año
+]
+OFFSETS = [timedelta(days=-1), timedelta(hours=-4), timedelta(hours=-3), timedelta(minutes=-1), timedelta(seconds=-1),
+           timedelta(milliseconds=-1), timedelta(0), timedelta(milliseconds=1), timedelta(seconds=1),
+           timedelta(minutes=1), timedelta(hours=3), timedelta(hours=4), timedelta(days=1) - timedelta(milliseconds=1),
+           timedelta(days=1)]
+
+# Variantes con cota exacta (el resto usa la cota amplia de offsets desconocidos)
+EXACT_VARIANTS = {"date_aware", "date_naive", "iso_local", "iso_local_space", "iso_local_minutes",
+                  "iso_z", "iso_utc", "iso_santiago", "iso_chile_fixed"}
+
+
+def variants(local: datetime):
+    utc = local.replace(tzinfo=CHILE_TZ).astimezone(timezone.utc)
+    return {
+        "date_aware": utc,
+        "date_naive": utc.replace(tzinfo=None),
+        "iso_local": local.isoformat(timespec="milliseconds"),
+        "iso_local_space": local.isoformat(" ", timespec="milliseconds"),
+        "iso_local_minutes": local.isoformat(timespec="minutes"),
+        "iso_z": utc.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        "iso_utc": utc.isoformat(timespec="milliseconds"),
+        "iso_santiago": utc.astimezone(ZoneInfo("America/Santiago")).isoformat(timespec="milliseconds"),
+        "iso_chile_fixed": utc.astimezone(CHILE_TZ).isoformat(timespec="milliseconds"),
+        "iso_madrid": utc.astimezone(ZoneInfo("Europe/Madrid")).isoformat(timespec="milliseconds"),
+        "iso_kolkata": utc.astimezone(ZoneInfo("Asia/Kolkata")).isoformat(timespec="milliseconds"),
+        # Formatos fuera de las cotas exactas: van por la banda amplia
+        "iso_compact_offset": utc.astimezone(ZoneInfo("America/Santiago")).strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "iso_date_only": local.date().isoformat(),
+    }
+
+
+@pytest.fixture(scope="module")
+def coll():
+    client = mongomock.MongoClient(tz_aware=True)
+    coll = client["bounds"]["telemetria"]
+    docs = []
+    for b in BOUNDARIES:
+        for off in OFFSETS:
+            for name, ts in variants(b + off).items():
+                docs.append({"device_id": f"D-{name}", "variant": name, "timestamp": ts, "sensors": {"ph": 7.0}})
+    coll.insert_many(docs)
+    return coll
+
+
+def local_times(docs):
+    return parse_timestamps([d["timestamp"] for d in docs])
+
+
+@pytest.mark.parametrize("boundary", BOUNDARIES, ids=lambda b: b.strftime("%Y-%m-%d"))
+@pytest.mark.parametrize("span", ["dia", "cruza_medianoche", "un_minuto"])
+def test_no_se_pierden_registros_en_los_bordes(coll, boundary, span):
+    start, end = {
+        "dia": (boundary, boundary + timedelta(days=1) - timedelta(microseconds=1)),
+        "cruza_medianoche": (boundary - timedelta(hours=3), boundary + timedelta(hours=3)),
+        "un_minuto": (boundary - timedelta(seconds=1), boundary + timedelta(seconds=1)),
+    }[span]
+    all_docs = list(coll.find())
+    ts = local_times(all_docs)
+    lo, hi = np.datetime64(start, "us"), np.datetime64(end, "us")
+    expected = {d["_id"] for d, t in zip(all_docs, ts) if lo <= t <= hi}
+    assert expected, "la matriz debe tener registros dentro del rango"
+
+    fetched = list(coll.find(timestamp_range_query(start, end)))
+    fetched_ids = {d["_id"] for d in fetched}
+    missing = [(d["variant"], d["timestamp"]) for d in all_docs if d["_id"] in expected - fetched_ids]
+    assert not missing
+
+    # Variantes con cota exacta: lo que sobra está a lo más a un minuto del borde
+    margin = np.timedelta64(1, "m")
+    extra = [(d["variant"], t) for d, t in zip(fetched, local_times(fetched))
+             if d["variant"] in EXACT_VARIANTS and not (lo - margin <= t <= hi + margin)]
+    assert not extra
+
+
+def test_un_dia_ya_no_trae_cinco(coll):
+    day = datetime(2026, 2, 25)
+    fetched = list(coll.find(timestamp_range_query(day, day + timedelta(days=1) - timedelta(microseconds=1))))
+    exact = [d for d in fetched if d["variant"] in EXACT_VARIANTS]
+    ts = local_times(exact)
+    assert ts.min() >= np.datetime64(day - timedelta(minutes=1), "us")
+    assert ts.max() <= np.datetime64(day + timedelta(days=1, minutes=1), "us")
+
+
+def test_loader_entrega_exactamente_el_rango(coll):
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.sources = [{"name": "Test", "client": coll.database.client, "db": "bounds", "coll_telemetry": "telemetria"}]
+    start = datetime(2026, 4, 5)
+    end = start + timedelta(days=1) - timedelta(microseconds=1)
+
+    df, complete = load_range_mongo(db, start, end)
+    all_docs = list(coll.find())
+    ts = local_times(all_docs)
+    expected = sum(1 for t in ts if np.datetime64(start, "us") <= t <= np.datetime64(end, "us"))
+    assert complete and len(df) == expected
+    assert df["timestamp"].between(start, end).all()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
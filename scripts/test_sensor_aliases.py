@@ -0,0 +1,87 @@
+"""
+Tests del registro de alias de sensores (modules/sensor_registry.py).
+Verifica que todos los normalizadores resuelven cada variante conocida de nombre al mismo
+sensor estándar: documento a documento (_normalize_document), columnar (normalize_documents),
+columnas del historial (normalize_sensor_columns) y umbrales de dispositivos (_normalize_thresholds).
+
+Uso: python -m pytest scripts/test_sensor_aliases.py
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.config_manager import ConfigManager
+from modules.database import DatabaseConnection
+from modules.sensor_registry import SensorRegistry, resolve_sensor_name
+from modules.telemetry_normalizer import normalize_documents, normalize_sensor_columns
+
+# Variante cruda -> nombre estándar (esquema propio, partner en español, legacy con mayúsculas/espacios)
+VARIANTS = {
+    "temperature": "temperature", "Temperature": "temperature", "temp": "temperature",
+    "Temp ": "temperature", "TEMP": "temperature", "temperatura": "temperature", "TEMPERATURA": "temperature",
+    "oxygen": "oxygen", "oxigeno": "oxygen", "Oxigeno": "oxygen", "od": "oxygen", "OD": "oxygen",
+    "do": "oxygen", "DO": "oxygen",
+    "humedad": "humidity", "humidity": "humidity",
+    "ph": "ph", "PH": "ph", "Ph": "ph", " ph": "ph",
+    "conductivity": "conductivity", "Sensor_Nuevo": "sensor_nuevo",
+}
+BASE = datetime(2026, 2, 25, 15, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("raw, name", VARIANTS.items())
+def test_resolucion_directa(raw, name):
+    assert resolve_sensor_name(raw) == name
+    # Cacheado e internado: la segunda resolución es el mismo objeto
+    assert resolve_sensor_name(raw) is resolve_sensor_name(raw)
+
+
+def test_alias_cargados_desde_sensor_defaults():
+    aliases = SensorRegistry.get_aliases()
+    assert aliases["temperatura"] == "temperature"
+    assert aliases["do"] == "oxygen"
+    assert all(alias == alias.lower().strip() for alias in aliases)
+    # Un alias nunca es además un sensor propio: sus lecturas y umbrales quedarían partidos en dos
+    assert not set(aliases) & set(SensorRegistry._defaults)
+
+
+@pytest.mark.parametrize("raw, name", VARIANTS.items())
+def test_documentos_todos_los_esquemas(raw, name):
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    docs = [
+        {"device_id": "A", "timestamp": BASE, "sensors": {raw: {"value": 1.5}}},
+        {"dispositivo_id": "B", "timestamp": BASE.isoformat(), "datos": {raw: 2.5}},
+        {"metadata": {"device_id": "C"}, "timestamp": int(BASE.timestamp()), "sensors": {raw: 3.5}},
+    ]
+    for doc in docs:
+        assert list(db._normalize_document(doc)["sensors"]) == [name]
+    bulk = normalize_documents(docs)
+    assert list(bulk.columns) == ["timestamp", "device_id", "location", name]
+    assert list(bulk[name]) == [1.5, 2.5, 3.5]
+
+
+def test_columnas_del_historial_combinan_variantes():
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2026-03-01", periods=3, freq="min"),
+        "device_id": ["A", "B", "C"],
+        "do": [np.nan, 6.0, np.nan],
+        "oxygen": [5.0, np.nan, np.nan],
+        "OD": [9.0, 9.0, 7.0],
+        "Temperatura": [20.0, 21.0, 22.0],
+        "humedad": [60.0, 61.0, 62.0],
+    })
+    result = normalize_sensor_columns(df)
+    assert list(result.columns) == ["timestamp", "device_id", "oxygen", "temperature", "humidity"]
+    # La columna estándar manda; las variantes rellenan en orden de aparición
+    assert list(result["oxygen"]) == [5.0, 6.0, 7.0]
+    assert normalize_sensor_columns(result) is result
+
+
+def test_umbrales_de_dispositivo():
+    manager = ConfigManager.__new__(ConfigManager)
+    flat = manager._normalize_thresholds({"temp_min": 20, "temperatura_max": 30, "OD_min": 4, "PH_max": 9})
+    assert flat == {"temperature": {"min": 20, "max": 30}, "oxygen": {"min": 4}, "ph": {"max": 9}}
+
+    nested = manager._normalize_thresholds({"oxygen": {"min": 5}, "do": {"min": 1}, "Temperatura": {"max": 31}})
+    assert nested == {"oxygen": {"min": 5}, "temperature": {"max": 31}}
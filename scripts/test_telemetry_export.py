@@ -0,0 +1,251 @@
+"""
+Tests de la exportación en streaming (modules/telemetry_export.py).
+Verifica que el CSV por lotes tiene las mismas filas que una carga directa (unión de columnas
+de sensores entre esquemas), que el pico de memoria (RSS) no crece con el tamaño del rango
+y que el Excel write-only reparte las filas en varias hojas pasado el límite.
+Parquet / Arrow IPC: mismas filas que el CSV y device_id / location como diccionario.
+El backup completo sale en partes por año (por mes si el año pasa el tope de bytes): la descarga
+lee a memoria una parte, así que se verifica que las partes cubren todo y respetan el tope.
+
+Requiere mongomock (pip install mongomock) como fixture en memoria.
+Uso: python -m pytest scripts/test_telemetry_export.py
+"""
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("pyarrow")
+
+from modules import telemetry_export
+from modules.database import DatabaseConnection
+from modules.telemetry_export import (export_backup_parts, export_csv, export_excel, export_range, frame_chunks,
+                                      write_arrow, write_excel)
+from modules.telemetry_normalizer import now_chile
+from modules.telemetry_repository import load_range_mongo
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture
+def db():
+    client = mongomock.MongoClient(tz_aware=True)
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(3 * 48):
+        ts = now - timedelta(minutes=30 * i)
+        if i % 2:
+            docs.append({"device_id": f"A{i % 3}", "timestamp": ts, "sensors": {"ph": {"value": 7 + i / 1000}}})
+        else:
+            docs.append({"dispositivo_id": f"P{i % 3}", "timestamp": ts.isoformat(),
+                         "datos": {"temperatura": 20 + i / 1000, "oxigeno": 5 + i / 1000}})
+    client["hist"]["telemetria"].insert_many(docs)
+    conn = DatabaseConnection.__new__(DatabaseConnection)
+    conn.sources = [{"name": "Test", "client": client, "db": "hist", "coll_telemetry": "telemetria"}]
+    return conn
+
+
+def read_csv(path):
+    df = pd.read_csv(path, parse_dates=["timestamp"])
+    return df.sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("devices", [None, ["A1", "P0"]])
+def test_csv_igual_a_carga_directa(db, tmp_path, devices):
+    start, end = now_chile() - timedelta(days=2), now_chile()
+    # Lotes chicos: las partes con sólo 'ph' y sólo temperatura/oxígeno se unen en un encabezado
+    rows = export_csv(db, start, end, tmp_path / "out.csv", devices, batch_size=7)
+
+    expected, _ = load_range_mongo(db, start, end, devices)
+    expected = expected.sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+    result = read_csv(tmp_path / "out.csv")
+
+    assert rows == len(expected) > 0
+    assert list(result.columns[:3]) == ["timestamp", "device_id", "location"]
+    assert set(result.columns) == set(expected.columns)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_excel_en_varias_hojas(tmp_path):
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2026-01-01", periods=23, freq="min"),
+        "device_id": [f"D{i % 3}" for i in range(23)],
+        "ph": [7.0 + i / 10 if i % 4 else None for i in range(23)],
+    })
+    # 10 filas por hoja = encabezado + 9 datos -> 3 hojas
+    rows = write_excel(frame_chunks(df, size=4), tmp_path / "out.xlsx", max_rows=10)
+
+    sheets = pd.read_excel(tmp_path / "out.xlsx", sheet_name=None)
+    assert rows == 23
+    assert list(sheets) == ["Datos", "Datos 2", "Datos 3"]
+    assert [len(s) for s in sheets.values()] == [9, 9, 5]
+    result = pd.concat(sheets.values(), ignore_index=True)
+    pd.testing.assert_frame_equal(result, df, check_dtype=False)
+
+
+def test_excel_del_rango_igual_al_csv(db, tmp_path):
+    start, end = now_chile() - timedelta(days=2), now_chile()
+    rows = export_excel(db, start, end, tmp_path / "out.xlsx", batch_size=7)
+    export_csv(db, start, end, tmp_path / "out.csv", batch_size=7)
+
+    result = pd.read_excel(tmp_path / "out.xlsx").sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+    expected = read_csv(tmp_path / "out.csv")
+    assert rows == len(expected)
+    # Excel guarda las fechas con precisión de milisegundos
+    for df in (result, expected):
+        df["timestamp"] = df["timestamp"].dt.floor("s")
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("fmt, read", [("parquet", pd.read_parquet), ("arrow", pd.read_feather)])
+def test_formatos_columnares_iguales_al_csv(db, tmp_path, fmt, read):
+    start, end = now_chile() - timedelta(days=2), now_chile()
+    rows = export_range(db, start, end, tmp_path / f"out.{fmt}", fmt, batch_size=7)
+    export_csv(db, start, end, tmp_path / "out.csv", batch_size=7)
+
+    result = read(tmp_path / f"out.{fmt}")
+    assert isinstance(result["device_id"].dtype, pd.CategoricalDtype)
+    assert isinstance(result["location"].dtype, pd.CategoricalDtype)
+    result = result.astype({"device_id": str, "location": str})
+    result = result.sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+    expected = read_csv(tmp_path / "out.csv")
+    assert rows == len(expected)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_arrow_diccionario_crece_entre_lotes(tmp_path, monkeypatch):
+    # Record batches de 4 filas: cada uno trae dispositivos nuevos (deltas de diccionario)
+    monkeypatch.setattr(telemetry_export, "ROW_GROUP_ROWS", 4)
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2026-01-01", periods=12, freq="min"),
+        "device_id": [f"D{i // 2}" for i in range(12)],
+        "location": ["Tanque 1"] * 12,
+        "ph": [7.0 + i / 10 for i in range(12)],
+    })
+    assert write_arrow(frame_chunks(df, size=3), tmp_path / "out.arrow") == 12
+
+    table = pa.ipc.open_file(tmp_path / "out.arrow").read_all()
+    assert table.num_rows == 12
+    assert pa.types.is_dictionary(table.schema.field("device_id").type)
+    result = table.to_pandas().astype({"device_id": str, "location": str})
+    pd.testing.assert_frame_equal(result, df, check_dtype=False)
+
+
+def test_sin_datos_no_escribe(db, tmp_path):
+    start = datetime(2020, 1, 1)
+    assert export_csv(db, start, start + timedelta(days=1), tmp_path / "out.csv") == 0
+    assert not (tmp_path / "out.csv").exists()
+
+
+def test_backup_en_partes_por_anio_y_mes(tmp_path):
+    client = mongomock.MongoClient(tz_aware=True)
+    chile = timezone(timedelta(hours=-3))
+    local = [datetime(2024, 12, 31, 23, 59, 59), datetime(2025, 1, 1)]
+    local += [datetime(2025, m, d, h) for m in (1, 2, 3) for d in (5, 20) for h in range(0, 24, 2)]
+    local += [datetime(2026, 1, 10, h) for h in range(3)]
+    client["hist"]["telemetria"].insert_many([
+        {"device_id": f"D{i % 4}", "timestamp": ts.replace(tzinfo=chile).astimezone(timezone.utc),
+         "sensors": {"ph": {"value": 7 + i / 1000}}} for i, ts in enumerate(local)
+    ])
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.sources = [{"name": "Test", "client": client, "db": "hist", "coll_telemetry": "telemetria"}]
+    start, end = datetime(2020, 1, 1), datetime(2026, 12, 31, 23, 59, 59)
+
+    (tmp_path / "anual").mkdir()
+    yearly = export_backup_parts(db, start, end, tmp_path / "anual", batch_size=7)
+    assert [p.label for p in yearly] == ["2024", "2025", "2026"]
+    assert [p.rows for p in yearly] == [1, 1 + 3 * 2 * 12, 3]
+
+    # Tope bajo el tamaño de 2025: ese año se rehace por mes, los demás quedan enteros
+    cap = yearly[1].size - 1
+    (tmp_path / "partes").mkdir()
+    parts = export_backup_parts(db, start, end, tmp_path / "partes", max_bytes=cap, batch_size=7)
+    assert [p.label for p in parts] == ["2024", "2025-01", "2025-02", "2025-03", "2026"]
+    assert max(p.size for p in parts) <= cap
+    assert sorted(f.name for f in (tmp_path / "partes").iterdir()) == sorted(p.path.name for p in parts)
+
+    result = pd.concat([read_csv(p.path) for p in parts]).sort_values(["timestamp", "device_id"]).reset_index(drop=True)
+    export_csv(db, start, end, tmp_path / "todo.csv")
+    pd.testing.assert_frame_equal(result, read_csv(tmp_path / "todo.csv"))
+
+
+# Proceso aparte: ru_maxrss es el pico de TODO el proceso. El cursor es un generador
+# (como el de pymongo, los documentos se crean a medida que se leen) para medir sólo al exportador.
+RSS_SCRIPT = textwrap.dedent("""
+    import gc, os, resource, sys
+    from datetime import datetime, timedelta
+    sys.path.insert(0, {root!r})
+    import pandas as pd
+    from modules.database import DatabaseConnection
+    from modules.telemetry_export import export_csv
+    from modules.telemetry_normalizer import normalize_documents
+
+    N = int(sys.argv[2])
+    START = datetime(2026, 1, 1)
+
+    class Cursor:
+        def __init__(self, n):
+            self.n = n
+        def batch_size(self, size):
+            return self
+        def __iter__(self):
+            for i in range(self.n):
+                yield {{"_id": i, "device_id": f"D{{i % 40}}", "location": f"Tanque {{i % 40}}",
+                        "timestamp": START + timedelta(seconds=i),
+                        "sensors": {{"temperature": {{"value": 28 + i % 7}}, "ph": {{"value": 7.5}},
+                                     "oxygen": {{"value": 5.5 + i % 3}}, "conductivity": {{"value": 1200.0}}}}}}
+
+    class Collection:
+        def __init__(self, n):
+            self.n = n
+        def aggregate(self, *args, **kwargs):
+            raise NotImplementedError("sin proyección plana")
+        def find(self, *args, **kwargs):
+            return Cursor(self.n)
+
+    def make_db(n):
+        db = DatabaseConnection.__new__(DatabaseConnection)
+        db.sources = [{{"name": "Gen", "client": {{"db": {{"telemetria": Collection(n)}}}}, "db": "db",
+                        "coll_telemetry": "telemetria"}}]
+        return db
+
+    def rss_mb():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    end = START + timedelta(days=365)
+    out = os.path.join(sys.argv[3], "out.csv")
+    # Calentar imports y cachés con un rango chico antes de medir
+    export_csv(make_db(2000), START, end, out)
+    gc.collect()
+    before = rss_mb()
+    if sys.argv[1] == "stream":
+        export_csv(make_db(N), START, end, out)
+    else:
+        # Camino anterior: todo el rango en un DataFrame y el CSV completo en bytes
+        docs = list(Cursor(N))
+        data = normalize_documents(docs).to_csv(index=False).encode("utf-8")
+    print(rss_mb() - before)
+""")
+
+
+def peak_rss_delta(mode, n, tmp_path):
+    script = RSS_SCRIPT.format(root=ROOT)
+    out = subprocess.run([sys.executable, "-c", script, mode, str(n), str(tmp_path)],
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="ru_maxrss en KB sólo en Linux")
+def test_pico_de_memoria_acotado(tmp_path):
+    n = 200_000
+    stream = peak_rss_delta("stream", n, tmp_path)
+    full = peak_rss_delta("full", n, tmp_path)
+    print(f"pico RSS: streaming +{stream:.0f} MB vs todo en memoria +{full:.0f} MB")
+    assert stream < 64
+    assert stream < full / 4
@@ -0,0 +1,171 @@
+"""
+Tests del repositorio de telemetría compartido (modules/telemetry_repository.py).
+Verifica que los rangos servidos desde memoria (tramo reciente + LRU de rangos antiguos)
+son iguales a una carga directa desde Mongo, que el tramo reciente es una sola copia compacta
+que recibe los deltas, y la contabilidad de memoria y reutilización.
+
+Requiere mongomock (pip install mongomock) como fixture en memoria.
+Uso: python -m pytest scripts/test_telemetry_repository.py
+"""
+import io
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from modules.database import DatabaseConnection
+from modules.history_layout import device_blocks, expand_history
+from modules.telemetry_export import frame_chunks, write_csv
+from modules.telemetry_normalizer import now_chile
+from modules.telemetry_repository import (LOAD_METRIC_FIELDS, TelemetryRepository, frame_bytes, load_range,
+                                          load_range_mongo)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("TELEMETRY_CACHE_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def db():
+    client = mongomock.MongoClient(tz_aware=True)
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(20 * 48):
+        ts = now - timedelta(minutes=30 * i)
+        if i % 2:
+            docs.append({"device_id": f"A{i % 3}", "timestamp": ts, "sensors": {"ph": {"value": round(7 + i / 1000, 3)}}})
+        else:
+            docs.append({"dispositivo_id": f"P{i % 3}", "timestamp": ts.isoformat(),
+                         "datos": {"temperatura": round(20 + i / 1000, 3)}})
+    client["hist"]["telemetria"].insert_many(docs)
+    conn = DatabaseConnection.__new__(DatabaseConnection)
+    conn.sources = [{"name": "Test", "client": client, "db": "hist", "coll_telemetry": "telemetria"}]
+    return conn
+
+
+def assert_same(result, expected, check_exact=False):
+    key = ["timestamp", "device_id"]
+    result = result.sort_values(key).reset_index(drop=True)
+    expected = expected.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=True, check_exact=check_exact)
+
+
+@pytest.mark.parametrize("persist", [False, True])
+@pytest.mark.parametrize("days_back, span, devices", [
+    (2, timedelta(days=1), None),                 # dentro del tramo reciente
+    (12, timedelta(days=3), None),                # sólo tramo antiguo
+    (10, timedelta(days=6), ["A1", "P0"]),        # cruza el borde antiguo/reciente
+])
+def test_rangos_iguales_a_carga_directa(db, monkeypatch, days_back, span, devices, persist):
+    repo = TelemetryRepository(persist=persist)
+    start = now_chile() - timedelta(days=days_back)
+    end = start + span
+    result = repo.get_range(db, start, end, devices)
+    monkeypatch.setenv("TELEMETRY_CACHE_DIR", "off")
+    # Mismos tipos y valores EXACTOS: el float32 del tramo reciente no llega a Datos ni a las exportaciones
+    assert_same(result, load_range(db, start, end, devices), check_exact=True)
+
+
+def test_rango_que_cruza_el_borde_exporta_las_lecturas_originales(db):
+    repo = TelemetryRepository(persist=False)
+    assert repo.recent(db)["ph"].dtype == np.float32
+    start = now_chile() - timedelta(days=10)
+    result = repo.get_range(db, start, now_chile())
+    assert result["ph"].dtype == np.float64 and result["timestamp"].min() < repo.recent_cache.covered_from
+
+    out = io.BytesIO()
+    write_csv(frame_chunks(result), out)
+    values = {v for line in out.getvalue().decode("utf-8").splitlines()[1:] for v in line.split(",")[3:] if v}
+    # Sólo las lecturas con sus 3 decimales (nada como 7.199999809265137)
+    assert values and all(len(v.split(".")[-1]) <= 3 for v in values)
+
+
+def test_filtro_de_dispositivos_en_el_servidor(db):
+    coll = db.sources[0]["client"]["hist"]["telemetria"]
+    coll.insert_one({"metadata": {"device_id": "M0"}, "timestamp": datetime.now(timezone.utc) - timedelta(days=1),
+                     "sensors": {"ph": 7.1}})
+    start, end = now_chile() - timedelta(days=3), now_chile()
+    devices = ["A1", "P0", "M0"]
+
+    metrics = []
+    df, complete = load_range_mongo(db, start, end, devices, metrics)
+    everything, _ = load_range_mongo(db, start, end)
+
+    assert complete and set(df["device_id"]) == set(devices)
+    assert_same(df, everything[everything["device_id"].isin(devices)])
+    # Sólo viajan los documentos de los dispositivos pedidos
+    (record,) = metrics
+    assert set(LOAD_METRIC_FIELDS) <= set(record)
+    assert record["device_filter"] == 0 and record["fetched"] == record["kept"] + record["out_of_range"]
+    assert record["fetched"] < len(everything)
+
+
+def test_tramo_reciente_no_consulta_mongo(db):
+    repo = TelemetryRepository(persist=False)
+    repo.recent(db)
+    start = now_chile() - timedelta(days=3)
+    df = repo.get_range(db, start, now_chile(), ["A0"])
+    assert not df.empty and set(df["device_id"]) == {"A0"}
+    assert repo.stats["range_loads"] == 0
+    assert repo.recent_cache.stats["full_loads"] == 1
+
+
+def test_rango_antiguo_se_reutiliza(db):
+    repo = TelemetryRepository(persist=False)
+    start = now_chile() - timedelta(days=15)
+    first = repo.get_range(db, start, start + timedelta(days=4))
+    assert repo.stats["range_loads"] == 1
+
+    # Sub-rango del ya cargado: desde memoria
+    sub = repo.get_range(db, start + timedelta(days=1), start + timedelta(days=2))
+    assert (repo.stats["range_loads"], repo.stats["range_hits"]) == (1, 1)
+    assert len(sub) < len(first)
+
+    repo.invalidate()
+    repo.get_range(db, start, start + timedelta(days=4))
+    assert repo.stats["range_loads"] == 2
+
+
+def test_tramo_reciente_es_una_sola_copia_compacta(db):
+    repo = TelemetryRepository(persist=False)
+    df = repo.recent(db)
+    assert df is repo.recent_cache.snapshot()
+    assert isinstance(df["device_id"].dtype, pd.CategoricalDtype)
+    assert device_blocks(df) is not None  # ordenado por dispositivo y tiempo
+
+    # El delta se prepara solo (incluido un dispositivo nuevo) y se une al frame compacto
+    coll = db.sources[0]["client"]["hist"]["telemetria"]
+    coll.insert_many([{"device_id": dev, "timestamp": datetime.now(timezone.utc) - timedelta(seconds=30),
+                       "sensors": {"ph": {"value": 7.25}}} for dev in ("A1", "NUEVO")])
+    merged = repo.recent(db, force=True)
+    assert repo.recent_cache.stats["last_delta_docs"] == 2
+    assert isinstance(merged["device_id"].dtype, pd.CategoricalDtype) and merged["ph"].dtype == np.float32
+    assert device_blocks(merged) is not None and "NUEVO" in device_blocks(merged)
+
+    # Las categorías nuevas se agregan al final: se comparan los valores en los tipos planos
+    assert_same(expand_history(merged), expand_history(TelemetryRepository(persist=False).recent(db)), check_exact=True)
+
+    report = repo.memory_report()
+    assert report["recent_rows"] == len(merged)
+    assert report["recent_bytes"] == frame_bytes(merged)
+
+
+def test_memoria_acotada(db):
+    repo = TelemetryRepository(persist=False, max_range_bytes=1)
+    start = now_chile() - timedelta(days=15)
+    df = repo.get_range(db, start, start + timedelta(days=2))
+    assert not df.empty
+
+    report = repo.memory_report()
+    # El rango no cabe en el tope: se entrega pero no se retiene
+    assert report["range_entries"] == 0 and report["range_bytes"] == 0
+    assert report["recent_rows"] == len(repo.recent_cache.snapshot()) > 0
+    assert report["total_bytes"] == report["recent_bytes"] + report["range_bytes"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
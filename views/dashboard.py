@@ -5,9 +5,10 @@ from typing import List, Dict
 import re
 
 from modules.database import DatabaseConnection
-from modules.config_manager import ConfigManager
+from modules.config_manager import ConfigManager, invalidate_device_metadata
 from modules.sensor_registry import SensorRegistry
 from modules.device_manager import DeviceManager, ConnectionStatus, HealthStatus, DeviceInfo
+from modules.live_state import LIVE_FEED, LIVE_POLL_SECONDS, LIVE_TAIL_SECONDS, get_live_poller
 
 # --- SVGs CONSTANTS ---
 ICON_LOC = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="vertical-align: text-bottom; margin-right: 2px;"><path d="M20 10c0 6-8 12-8 12s-8-6-8-12a8 8 0 0 1 16 0Z"/><circle cx="12" cy="10" r="3"/></svg>'
@@ -120,6 +121,9 @@ def show_view():
         st.error(f"Error Database Connection: {e}")
         return
 
+    # Estado en vivo: foto compartida por todas las sesiones (un solo hilo consulta Mongo)
+    poller = get_live_poller()
+
     # --- Toolbar ---
     c1, c2 = st.columns([6, 1])
     with c1:
@@ -130,6 +134,8 @@ def show_view():
             keys_to_delete = [k for k in st.session_state.keys() if k.startswith('live_data_')]
             for k in keys_to_delete:
                 del st.session_state[k]
+            invalidate_device_metadata()
+            poller.refresh()
             st.rerun()
     
     # --- Data Loading ---
@@ -141,7 +147,17 @@ def show_view():
         del st.session_state['device_health_states']
     
     try:
-        df = db.get_latest_by_device()
+        snapshot = poller.snapshot()
+        if snapshot is None:
+            raise RuntimeError(poller.stats["last_error"] or "sin datos en vivo")
+        df = snapshot.frame
+        feed_modes = sorted({f.mode for f in poller.feeds if f.running})
+        updates = (f"lecturas nuevas por {' / '.join(feed_modes)}" if feed_modes
+                   else f"cada {poller.full_interval:.0f}s")
+        st.caption(
+            f"Datos en vivo de hace {snapshot.age_seconds:.0f}s · consulta {snapshot.poll_seconds:.2f}s · "
+            f"compartidos por todas las sesiones, {updates}"
+        )
         prev_states = {}  # Siempre vacío para forzar actualización
         
         if df is None or df.empty:
@@ -167,6 +183,7 @@ def show_view():
             # estados obsoletos de una iteración anterior (bug de color incorrecto).
             for _dev in all_devices:
                 st.session_state[f'live_data_{_dev.device_id}'] = _dev
+            st.session_state[LIVE_VERSION_KEY] = snapshot.version
 
     except Exception as e:
         st.error(f"Error fetching devices: {str(e)}")
@@ -213,59 +230,66 @@ except ImportError:
             return func
 
 
-@fragment(run_every=120)
-def render_live_device_card(device_obj: DeviceInfo, thresholds: Dict, config_manager: ConfigManager):
+# Refresco en vivo: UN temporizador para toda la página de tarjetas (no uno por tarjeta).
+# Lee la foto del poller compartido, así que no consulta Mongo: puede ir al ritmo del poller,
+# o al del feed de lecturas nuevas si está activo.
+LIVE_REFRESH_SECONDS = LIVE_POLL_SECONDS if LIVE_FEED == "off" else LIVE_TAIL_SECONDS
+LIVE_VERSION_KEY = "dashboard_live_version"
+
+
+def refresh_devices(config_manager: ConfigManager, device_ids: List[str], prev_states: Dict = None,
+                    latest_df: pd.DataFrame = None) -> Dict[str, DeviceInfo]:
+    """
+    Última lectura de varios dispositivos y salud calculada una sola vez para todos.
+    Con latest_df (foto del poller compartido) no consulta Mongo; sin ella, una consulta por fuente.
+    Usa los umbrales del ConfigManager y la caché de metadatos.
+    Retorna {device_id: DeviceInfo} (sólo los dispositivos con datos).
+    """
+    if latest_df is None:
+        new_df = config_manager.db.get_latest_frame_for_devices(device_ids)
+    else:
+        new_df = latest_df[latest_df["device_id"].isin(device_ids)] if not latest_df.empty else latest_df
+    if new_df.empty:
+        return {}
+    
+    global_thresholds = config_manager.get_all_configured_sensors()
+    all_meta = config_manager.get_device_metadata()
+    dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
+    
+    mgr = DeviceManager(global_thresholds, prev_states, dev_specifics)
+    return {info.device_id: info for info in mgr.get_all_devices_info(new_df)}
+
+
+def refresh_live_devices(device_ids: List[str], config_manager: ConfigManager, latest_df: pd.DataFrame = None) -> bool:
+    """Refresca las tarjetas indicadas y reparte los resultados en session_state."""
+    try:
+        prev_states = st.session_state.setdefault('device_health_states', {})
+        fresh = refresh_devices(config_manager, device_ids, prev_states, latest_df)
+    except Exception as e:
+        print(f"Error refreshing {', '.join(device_ids)}: {e}")
+        return False
+    
+    for dev_id, info in fresh.items():
+        st.session_state[f"live_data_{dev_id}"] = info
+    return bool(fresh)
+
+
+def render_device_card(device_obj: DeviceInfo, thresholds: Dict, config_manager: ConfigManager):
     """
-    Renderiza la tarjeta con actualizacion PARCIAL gracias a @fragment.
+    Renderiza la tarjeta con los datos de session_state (refrescados por render_device_grid).
     Incluye paginacion minimalista para sensores.
     """
     dev_id = device_obj.device_id
     state_key = f"live_data_{dev_id}"
     page_key = f"sensor_page_{dev_id}"
-    last_update_key = f"last_fetch_{dev_id}"
     
     # state_key ya fue escrito por show_view() con el cálculo fresco antes de llegar aquí.
-    # Solo inicializamos page_key y last_update_key si es la primera vez.
     if page_key not in st.session_state:
         st.session_state[page_key] = 0
-    if last_update_key not in st.session_state:
-        st.session_state[last_update_key] = datetime.now().timestamp()
     # Fallback: si por alguna razón show_view() no pudo escribirlo (ej: error de DB),
     # usamos el device_obj que recibimos como parámetro.
     if state_key not in st.session_state:
         st.session_state[state_key] = device_obj
-
-    # --- HELPER DE ACTUALIZACIÓN ---
-    def fetch_latest_data():
-        try:
-            db = DatabaseConnection()
-            new_df = db.get_latest_for_single_device(dev_id)
-            if not new_df.empty:
-                cfg = ConfigManager(db)
-                # Recalcular estados con configuración fresca
-                global_thresholds = cfg.get_all_configured_sensors()
-                all_meta = cfg.get_device_metadata()
-                dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
-                prev_states = st.session_state.get('device_health_states', {})
-                
-                mgr = DeviceManager(global_thresholds, prev_states, dev_specifics)
-                new_infos = mgr.get_all_devices_info(new_df)
-                
-                if new_infos:
-                    st.session_state[state_key] = new_infos[0]
-                    st.session_state[last_update_key] = datetime.now().timestamp()
-                    return True
-        except Exception as e:
-            print(f"Error refreshing {dev_id}: {e}")
-        return False
-    
-    # 1. Lógica de Auto-Refresh (TIEMPO): Ejecutar ANTES de renderizar
-    now_ts = datetime.now().timestamp()
-    time_diff = now_ts - st.session_state[last_update_key]
-    
-    # Si pasaron > 115s (margen para el timer de 120s), actualizamos YA
-    if time_diff > 115:
-        fetch_latest_data()
     
     # --- RENDER HTML DE LA TARJETA (Con datos frescos) ---
     current_device = st.session_state[state_key]
@@ -308,14 +332,18 @@ def render_live_device_card(device_obj: DeviceInfo, thresholds: Dict, config_man
     else:
         refresh_clicked = st.button("Actualizar", key=f"refresh_{dev_id}", width="stretch")
 
-    # 2. Lógica de Refresh MANUAL
-    if refresh_clicked:
-        if fetch_latest_data():
-            st.rerun()
+    # Refresh MANUAL: foto nueva del poller compartido (una consulta aunque varias sesiones pulsen)
+    if refresh_clicked and config_manager:
+        get_live_poller().refresh()
+        st.rerun()
 
 
+@fragment(run_every=LIVE_REFRESH_SECONDS)
 def render_device_grid(devices, thresholds, config_manager=None):
-    
+    """
+    Grilla paginada con actualizacion PARCIAL gracias a @fragment: al vencer el temporizador
+    se toman los dispositivos visibles de la foto compartida y se recalcula su salud una sola vez.
+    """
     with st.container():
         PER_PAGE = 9
         total_pages = max(1, (len(devices) + PER_PAGE - 1) // PER_PAGE)
@@ -327,10 +355,17 @@ def render_device_grid(devices, thresholds, config_manager=None):
         end = start + PER_PAGE
         page_items = devices[start:end]
         
+        # Auto-Refresh: sólo si el poller publicó una foto nueva desde la última vez
+        if config_manager and page_items:
+            snapshot = get_live_poller().snapshot()
+            if snapshot is not None and snapshot.version != st.session_state.get(LIVE_VERSION_KEY):
+                refresh_live_devices([d.device_id for d in page_items], config_manager, snapshot.frame)
+                st.session_state[LIVE_VERSION_KEY] = snapshot.version
+        
         cols = st.columns(3)
         for i, device in enumerate(page_items):
             with cols[i % 3]:
-                render_live_device_card(device, thresholds, config_manager)
+                render_device_card(device, thresholds, config_manager)
                 
         if total_pages > 1:
             st.markdown("<br>", unsafe_allow_html=True)
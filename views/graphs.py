@@ -4,16 +4,21 @@ Arquitectura: Carga completa -> DataFrame cacheado -> Filtrado en memoria
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
 
 from modules.database import DatabaseConnection
 from modules.config_manager import ConfigManager
-from modules.device_manager import DeviceManager, ConnectionStatus
+from modules.sensor_registry import SensorRegistry
+from modules.device_manager import DeviceManager, ConnectionStatus, get_threshold_matrix
+from modules.health_timeline import time_out_of_range, violation_intervals
+from modules.telemetry_repository import get_telemetry_repository
+from modules.downsampling import DEFAULT_TARGET_POINTS, bucket_minutes_for
+from modules.decimation import DEFAULT_POINT_BUDGET, decimate
+from modules.history_layout import device_blocks, memory_per_million_rows, window_slices
 
 # =============================================================================
 # ICONOS SVG INLINE
@@ -45,28 +50,6 @@ ICON_LIGHTBULB = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14"
 
 ICON_CLOCK = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="vertical-align: middle; margin-right: 6px;"><circle cx="12" cy="12" r="10"></circle><polyline points="12 6 12 12 16 14"></polyline></svg>'
 
-# Mapa de normalizacion de nombres de sensores (diferentes esquemas -> nombre estandar)
-SENSOR_ALIASES = {
-    # Temperatura
-    "temperatura": "temperature",
-    "temp": "temperature",
-    "temperature": "temperature",
-    "TEMPERATURA": "temperature",
-    "TEMP": "temperature",
-    # pH
-    "ph": "ph",
-    "PH": "ph",
-    "Ph": "ph",
-    # Oxigeno
-    "oxigeno": "oxygen",
-    "oxygen": "oxygen",
-    "do": "oxygen",
-    "OD": "oxygen",
-    # Otros
-    "humedad": "humidity",
-    "humidity": "humidity",
-}
-
 # Labels para mostrar al usuario
 SENSOR_LABELS = {
     "temperature": {"label": "Temperatura", "unit": "°C"},
@@ -76,34 +59,6 @@ SENSOR_LABELS = {
 }
 
 
-def normalize_sensor_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Normaliza nombres de columnas de sensores para unificar datos de diferentes fuentes."""
-    if df.empty:
-        return df
-    
-    df = df.copy()
-    columns_to_rename = {}
-    
-    for col in df.columns:
-        col_lower = col.lower().strip()
-        if col_lower in SENSOR_ALIASES:
-            standard_name = SENSOR_ALIASES[col_lower]
-            # Si ya existe la columna estandar, combinar datos
-            if standard_name in df.columns and standard_name != col:
-                df[standard_name] = df[standard_name].combine_first(df[col])
-                df = df.drop(columns=[col])
-            elif standard_name != col:
-                columns_to_rename[col] = standard_name
-    
-    if columns_to_rename:
-        df = df.rename(columns=columns_to_rename)
-    
-    # Eliminar columnas duplicadas que puedan quedar
-    df = df.loc[:, ~df.columns.duplicated()]
-    
-    return df
-
-
 def get_sensor_display_info(sensor_name: str, sensor_config: dict) -> tuple:
     """Obtiene label y unidad para un sensor, usando config o defaults."""
     # Primero buscar en config del usuario
@@ -124,158 +79,103 @@ def get_sensor_display_info(sensor_name: str, sensor_config: dict) -> tuple:
 # ARQUITECTURA OPTIMIZADA: Carga completa + Cache + Filtrado en memoria
 # =============================================================================
 
-# TTL de 1 hora (3600 segundos) - balance entre performance y datos frescos
-# La carga de datos tarda ~4 minutos, así que un TTL corto no es práctico
-# El usuario puede forzar la recarga con el botón "Actualizar"
-@st.cache_data(ttl=3600, show_spinner=False)
-def cargar_historial_completo() -> pd.DataFrame:
+# Límites físicos por sensor (los valores fuera de rango son errores de medición)
+# Temperatura: 0 a 60 (Biofloc no se congela ni hierve) | pH: 0 a 14 (Rango físico químico)
+LIMITES_FISICOS = {
+    "temperature": (0, 60),
+    "ph": (0, 14),
+}
+
+# Rangos largos: las gráficas usan series agregadas por bucket (min/promedio/max)
+# en vez de cada punto crudo, con ~GRAPH_TARGET_POINTS puntos por traza como máximo.
+RANGOS_AGREGADOS = {"3 Días", "1 Semana"}
+GRAPH_TARGET_POINTS = DEFAULT_TARGET_POINTS
+
+# Opciones de presupuesto de puntos por trazo (None = sin decimar)
+PRESUPUESTOS_PUNTOS = {
+    "1.000": 1000,
+    "2.000": 2000,
+    "5.000": 5000,
+    "Todos": None,
+}
+
+# Bandas de intervalos fuera de rango (mismos colores que las tarjetas del dashboard)
+COLORES_FUERA_DE_RANGO = {
+    "warning": "rgba(245, 158, 11, 0.15)",
+    "critical": "rgba(239, 68, 68, 0.18)",
+}
+
+
+def limpiar_historial(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Limpieza de Gráficas sobre la ventana filtrada: outliers físicamente imposibles y timestamps
+    corruptos. El historial compartido queda intacto (la vista de Datos muestra las lecturas crudas);
+    como se aplica a la ventana y no a la semana completa, no se guarda una segunda copia.
     """
-    Carga TODO el historial de datos sin límite.
-    Esta función se cachea por 1 HORA para evitar recargas constantes.
+    if df.empty:
+        return df
+    keep = np.ones(len(df), dtype=bool)
+
+    # =====================================================================
+    # LIMPIEZA DE OUTLIERS Y DATOS IMPOSIBLES
+    # =====================================================================
+    for sensor, (lo, hi) in LIMITES_FISICOS.items():
+        if sensor in df.columns:
+            values = df[sensor]
+            valid = (values.isna() | ((values >= lo) & (values <= hi))).to_numpy()
+            if not valid.all():
+                print(f"[graphs.py] Filtrados {int((keep & ~valid).sum())} registros con {sensor} fuera de rango ({lo}-{hi})")
+            keep &= valid
+
+    # =====================================================================
+    # FILTRAR TIMESTAMPS INVÁLIDOS
+    # Excluir registros con fechas anteriores a 2020 (datos corruptos)
+    # Esto elimina timestamps epoch=0 que aparecen como 1970
+    # =====================================================================
+    if 'timestamp' in df.columns:
+        valid = (df['timestamp'] >= pd.Timestamp('2020-01-01')).to_numpy()
+        registros_filtrados = int((keep & ~valid).sum())
+        if registros_filtrados > 0:
+            print(f"[graphs.py] Filtrados {registros_filtrados} registros con timestamps inválidos (<2020)")
+        keep &= valid
+
+    # Sin outliers la ventana se devuelve tal cual (slices del historial, sin copia)
+    return df if keep.all() else df[keep]
+
+
+def cargar_historial_completo(force: bool = False) -> pd.DataFrame:
+    """
+    Retorna el historial de la última semana desde el repositorio de telemetría compartido
+    con la vista de Datos (una sola copia en memoria por proceso).
     
-    Para obtener datos nuevos, el usuario debe presionar "Actualizar".
+    - Primera llamada: carga completa de la ventana (todas las fuentes).
+    - Llamadas siguientes: delta de documentos nuevos como máximo una vez por minuto,
+      o inmediatamente si force=True (botón "Actualizar").
     
     Arquitectura basada en recomendación: 
     - Crear la solicitud una vez
     - Trabajar en un DataFrame que haga toda la pega
-    - Sin límite de datos
     """
     try:
-        start_time_total = time.time()
         db = DatabaseConnection()
         
         if not db.sources:
             return pd.DataFrame()
         
-        all_norm_docs = []
-        
-        # Definir TIEMPO DE CORTE común para todas las fuentes
-        # Esto asegura que si una fuente tarda más en cargar, no incluya datos
-        # posteriores al inicio de la carga, manteniendo la sincronización.
-        cut_off_time = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=-3))).replace(tzinfo=None)
-        print(f"[graphs.py] Tiempo de corte de sincronización: {cut_off_time}")
-        
-        # Calcular fecha de inicio para la consulta (1 semana atrás + margen de 1 hora)
-        # Esto reduce drásticamente la cantidad de datos transferidos
-        start_date = cut_off_time - timedelta(weeks=1, hours=1)
-        # Crear versiones del timestamp para diferentes formatos de BD
-        start_date_iso = start_date.isoformat()
-        
-        print(f"[graphs.py] Limitando consulta a datos desde: {start_date}")
-
-        def load_source_data(source):
-            """Función auxiliar para cargar datos de una fuente individual."""
-            try:
-                database = source["client"][source["db"]]
-                collection = database[source["coll_telemetry"]]
-                
-                # Proyección optimizada
-                projection = {
-                    '_id': 1, 'timestamp': 1, 'device_id': 1, 'dispositivo_id': 1,
-                    'sensors': 1, 'datos': 1, 'location': 1, 'metadata': 1
-                }
-                
-                # Construir Query con filtro de fecha (Soporta Date objects y ISO Strings)
-                # Usamos $or para cubrir ambos casos sin saber el esquema a priori
-                query = {
-                    "$or": [
-                        {"timestamp": {"$gte": start_date}},        # Para objetos Date (Victor)
-                        {"timestamp": {"$gte": start_date_iso}}     # Para strings ISO (Martin)
-                    ]
-                }
-                
-                # Cargar documentos (intenta sort, fallback a sin sort)
-                try:
-                    cursor = collection.find(query, projection).sort('timestamp', -1)
-                    raw_documents = list(cursor)
-                except Exception as sort_error:
-                    print(f"[graphs.py] Sort falló para {source['name']}: {sort_error}")
-                    cursor = collection.find(query, projection)
-                    raw_documents = list(cursor)
-                
-                print(f"[graphs.py] Fuente '{source['name']}': {len(raw_documents)} documentos cargados")
-                
-                # Normalizar documentos y FILTRAR por cut_off_time
-                source_docs = []
-                docs_futuros = 0
-                for doc in raw_documents:
-                    norm_doc = db._normalize_document(doc)
-                    ts = norm_doc.get("timestamp")
-                    
-                    if ts is not None and norm_doc.get("device_id") != "unknown":
-                        # Filtro de sincronización: ignorar datos posteriores al corte
-                        if ts > cut_off_time:
-                            docs_futuros += 1
-                            continue
-                            
-                        source_docs.append(norm_doc)
-                
-                print(f"[graphs.py] Fuente '{source['name']}': {len(source_docs)} documentos válidos ({docs_futuros} ignorados por ser posteriores al corte)")
-                return source_docs
-                
-            except Exception as e:
-                print(f"[graphs.py] ERROR cargando fuente {source['name']}: {str(e)}")
-                return []
-
-        # EJECUCIÓN PARALELA: Cargar todas las fuentes al mismo tiempo
-        # Esto reduce drásticamente el "gap" de tiempo entre una y otra
-        with ThreadPoolExecutor(max_workers=len(db.sources)) as executor:
-            future_to_source = {executor.submit(load_source_data,  s): s for s in db.sources}
-            
-            for future in as_completed(future_to_source):
-                docs = future.result()
-                all_norm_docs.extend(docs)
-        
-        if not all_norm_docs:
-            return pd.DataFrame()
-        
-        # Convertir a DataFrame flat
-        df = db._parse_historical_flat(all_norm_docs)
-        
-        # Normalizar columnas de sensores
-        df = normalize_sensor_columns(df)
+        df = get_telemetry_repository().recent(db, force=force)
         
-        # =====================================================================
-        # LIMPIEZA DE OUTLIERS Y DATOS IMPOSIBLES
-        # =====================================================================
-        # Temperatura: 0 a 60 (Biofloc no se congela ni hierve)
-        if 'temperature' in df.columns:
-            cnt_pre = len(df)
-            df = df[(df['temperature'].isna()) | ((df['temperature'] >= 0) & (df['temperature'] <= 60))]
-            if len(df) < cnt_pre:
-                print(f"[graphs.py] Filtrados {cnt_pre - len(df)} registros con Temperatura fuera de rango (0-60)")
-
-        # pH: 0 a 14 (Rango físico químico)
-        if 'ph' in df.columns:
-            df = df[(df['ph'].isna()) | ((df['ph'] >= 0) & (df['ph'] <= 14))]
-
-        # =====================================================================
-        # FILTRAR TIMESTAMPS INVÁLIDOS
-        # Excluir registros con fechas anteriores a 2020 (datos corruptos)
-        # Esto elimina timestamps epoch=0 que aparecen como 1970
-        # =====================================================================
-        if 'timestamp' in df.columns and not df.empty:
-            fecha_minima_valida = pd.Timestamp('2020-01-01')
-            registros_antes = len(df)
-            df = df[df['timestamp'] >= fecha_minima_valida]
-            registros_filtrados = registros_antes - len(df)
-            if registros_filtrados > 0:
-                print(f"[graphs.py] Filtrados {registros_filtrados} registros con timestamps inválidos (<2020)")
-        
-        # Ordenar por timestamp ascendente
-        if 'timestamp' in df.columns and not df.empty:
-            df = df.sort_values('timestamp', ascending=True)
-        
-        elapsed_time = time.time() - start_time_total
-        print(f"[graphs.py] Tiempo total de carga y procesamiento: {elapsed_time:.2f} segundos")
-        
-        # DEBUG: Mostrar t_max por dispositivo inmediatamente después de cargar
-        if 'timestamp' in df.columns and 'device_id' in df.columns and not df.empty:
+        # DEBUG: Mostrar t_max por dispositivo después de refrescar
+        if force and 'timestamp' in df.columns and 'device_id' in df.columns and not df.empty:
             print(f"\n[graphs.py] === DATOS CARGADOS (t_max por dispositivo) ===")
-            device_summary = df.groupby('device_id')['timestamp'].agg(['max', 'count']).reset_index()
+            device_summary = df.groupby('device_id', observed=True)['timestamp'].agg(['max', 'count']).reset_index()
             for _, row in device_summary.iterrows():
                 print(f"  - {row['device_id']}: último dato = {row['max']} ({row['count']} registros)")
-            print(f"  [Hora actual del servidor: no disponible, ver hora en consola]")
+            repo = get_telemetry_repository()
+            mem = repo.memory_report()
+            print(f"[graphs.py] Repositorio: {mem['total_bytes'] / 1e6:.1f} MB en memoria "
+                  f"(reciente {mem['recent_bytes'] / 1e6:.1f} MB, rangos {mem['range_bytes'] / 1e6:.1f} MB) "
+                  f"| reutilización: {repo.stats}")
+            print(f"[graphs.py] Historial de Gráficas: {memory_per_million_rows(df) / 1e6:.1f} MB por millón de filas")
         
         return df
         
@@ -284,6 +184,66 @@ def cargar_historial_completo() -> pd.DataFrame:
         return pd.DataFrame()
 
 
+@st.cache_data(ttl=120, show_spinner=False)
+def cargar_series_agregadas(device_ranges: tuple, bucket_minutes: int) -> pd.DataFrame:
+    """
+    Series min/promedio/max por bucket para rangos largos, agregadas en el servidor.
+    device_ranges: tupla de (device_id, inicio, fin) para que sea hasheable por el caché.
+    """
+    try:
+        db = DatabaseConnection()
+        return db.fetch_bucketed_telemetry(
+            {dev: (start, end) for dev, start, end in device_ranges},
+            bucket_minutes,
+            sensor_aliases=SensorRegistry.get_aliases(),
+            value_bounds=LIMITES_FISICOS,
+        )
+    except Exception as e:
+        print(f"[graphs.py] Error cargando series agregadas: {e}")
+        return pd.DataFrame()
+
+
+def agregar_bandas_fuera_de_rango(fig: go.Figure, intervals: pd.DataFrame, dev_name: str):
+    """
+    Sombrea los intervalos fuera de rango de un dispositivo: un solo trazo por nivel con
+    todos sus rectángulos (separados por None) en un eje Y auxiliar de 0 a 1, así la banda
+    cubre la altura completa sin importar la escala del sensor.
+    """
+    for level, level_intervals in intervals.groupby('level', sort=False):
+        starts = level_intervals['start'].astype(object).to_numpy()
+        ends = level_intervals['end'].astype(object).to_numpy()
+        n = len(starts)
+        x = np.empty(n * 6, dtype=object)
+        x[0::6], x[1::6], x[2::6], x[3::6], x[4::6], x[5::6] = starts, starts, ends, ends, starts, None
+        y = np.tile(np.array([0, 1, 1, 0, 0, None], dtype=object), n)
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=y,
+            yaxis='y2',
+            mode='lines',
+            line=dict(width=0),
+            fill='toself',
+            fillcolor=COLORES_FUERA_DE_RANGO.get(level, COLORES_FUERA_DE_RANGO['warning']),
+            hoverinfo='skip',
+            legendgroup=dev_name,
+            showlegend=False
+        ))
+
+
+def formatear_duracion(duration: pd.Timedelta) -> str:
+    """Duración legible para las tablas (ej: '2 h 05 min', '12 min', '40 s')."""
+    seconds = int(pd.Timedelta(duration).total_seconds())
+    if seconds <= 0:
+        return "-"
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    if hours:
+        return f"{hours} h {minutes:02d} min"
+    if minutes:
+        return f"{minutes} min"
+    return f"{secs} s"
+
+
 def filtrar_dataframe(
     df: pd.DataFrame, 
     dispositivos: List[str], 
@@ -300,7 +260,22 @@ def filtrar_dataframe(
     if df.empty:
         return df
     
-    df_filtrado = df.copy()
+    # Historial compacto (ordenado por dispositivo y tiempo): cada ventana es un slice del
+    # bloque del dispositivo, ubicado con searchsorted; no recorre ni copia el frame completo
+    blocks = device_blocks(df)
+    if blocks is not None:
+        parts = window_slices(df, blocks, dispositivos, delta)
+        if debug:
+            print(f"\n[filtrar_dataframe] Ventanas para delta={delta}:")
+            for part in parts:
+                print(f"  - {part['device_id'].iloc[0]}: {part['timestamp'].iloc[0]} -> "
+                      f"{part['timestamp'].iloc[-1]} ({len(part)} registros)")
+        if not parts:
+            return df.iloc[:0]
+        return parts[0] if len(parts) == 1 else pd.concat(parts)
+    
+    # Sin copia: los filtros devuelven nuevos frames y el historial cacheado no se modifica
+    df_filtrado = df
     
     # Filtrar por dispositivos
     if dispositivos and 'device_id' in df_filtrado.columns:
@@ -308,7 +283,7 @@ def filtrar_dataframe(
     
     # DEBUG: Mostrar t_max por dispositivo ANTES del filtro de tiempo
     if debug and 'timestamp' in df_filtrado.columns and 'device_id' in df_filtrado.columns:
-        pre_filter = df_filtrado.groupby('device_id').agg({
+        pre_filter = df_filtrado.groupby('device_id', observed=True).agg({
             'timestamp': ['min', 'max', 'count']
         }).reset_index()
         pre_filter.columns = ['device_id', 't_min', 't_max', 'count']
@@ -320,7 +295,7 @@ def filtrar_dataframe(
     # Esto evita que un dispositivo con latencia diferente "oculte" a otro
     if delta is not None and 'timestamp' in df_filtrado.columns and 'device_id' in df_filtrado.columns:
         # Calcular t_max y t_min por dispositivo (vectorizado, mucho más rápido que apply)
-        device_times = df_filtrado.groupby('device_id')['timestamp'].max().reset_index()
+        device_times = df_filtrado.groupby('device_id', observed=True)['timestamp'].max().reset_index()
         device_times.columns = ['device_id', 't_max']
         device_times['t_min'] = device_times['t_max'] - delta
         
@@ -339,7 +314,7 @@ def filtrar_dataframe(
         
         # DEBUG: Mostrar resultado después del filtro
         if debug:
-            post_filter = df_filtrado.groupby('device_id')['timestamp'].agg(['min', 'max', 'count']).reset_index()
+            post_filter = df_filtrado.groupby('device_id', observed=True)['timestamp'].agg(['min', 'max', 'count']).reset_index()
             post_filter.columns = ['device_id', 't_min', 't_max', 'count']
             print(f"\n[filtrar_dataframe] DESPUÉS del filtro de tiempo:")
             for _, row in post_filter.iterrows():
@@ -362,9 +337,9 @@ def show_view():
     with col_h2:
         if st.button("Actualizar", type="secondary", help="Recargar datos desde la base de datos"):
             print(f"\n[graphs.py] ========================================")
-            print(f"[graphs.py] BOTÓN ACTUALIZAR PRESIONADO - Limpiando cache...")
+            print(f"[graphs.py] BOTÓN ACTUALIZAR PRESIONADO - Trayendo datos nuevos...")
             print(f"[graphs.py] ========================================")
-            cargar_historial_completo.clear()
+            st.session_state.graphs_force_refresh = True
             st.rerun()
     
     # --- CONEXION Y CONFIG ---
@@ -377,9 +352,10 @@ def show_view():
         st.error(f"Error de conexión: {str(e)}")
         return
     
-    # --- CARGA INICIAL DE DATOS (CACHEADA POR 24 HORAS) ---
+    # --- CARGA DE DATOS (CACHÉ INCREMENTAL) ---
+    force_refresh = st.session_state.pop('graphs_force_refresh', False)
     with st.spinner("Cargando historial completo (solo la primera vez, después será instantáneo)..."):
-        df_completo = cargar_historial_completo()
+        df_completo = cargar_historial_completo(force=force_refresh)
     
     if df_completo is None or df_completo.empty:
         st.warning("No se encontraron datos en la base de datos.")
@@ -535,6 +511,8 @@ def show_view():
         st.session_state.graphs_data_loaded = None
     if 'graphs_last_delta' not in st.session_state:
         st.session_state.graphs_last_delta = None
+    if 'graphs_buckets_loaded' not in st.session_state:
+        st.session_state.graphs_buckets_loaded = None
     
     # Detectar si cambió el rango de tiempo
     delta_changed = st.session_state.graphs_last_delta is not None and st.session_state.graphs_last_delta != delta
@@ -570,11 +548,25 @@ def show_view():
     if should_regenerate:
         # Filtrar datos
         with st.spinner("Generando gráficas..."):
-            filtered_df = filtrar_dataframe(df_completo, selected_devices, delta, debug=False)
+            filtered_df = limpiar_historial(filtrar_dataframe(df_completo, selected_devices, delta, debug=False))
             st.session_state.graphs_data_loaded = filtered_df
+            
+            # Rangos largos: series agregadas en el servidor para los trazos
+            # (promedios y estadísticas siguen saliendo de los datos crudos en memoria)
+            buckets = None
+            if selected_range in RANGOS_AGREGADOS and not filtered_df.empty:
+                device_times = filtered_df.groupby('device_id', observed=True)['timestamp'].agg(['min', 'max'])
+                device_ranges = tuple(
+                    (dev, row['max'] - delta, row['max']) for dev, row in device_times.iterrows()
+                )
+                bucket_minutes = bucket_minutes_for(delta, GRAPH_TARGET_POINTS)
+                buckets = cargar_series_agregadas(device_ranges, bucket_minutes)
+                print(f"[graphs.py] Series agregadas: buckets de {bucket_minutes} min, {len(buckets)} puntos")
+            st.session_state.graphs_buckets_loaded = buckets
     
     # Obtener datos de sesión
     filtered_df = st.session_state.graphs_data_loaded
+    buckets_df = st.session_state.graphs_buckets_loaded
     
     # Si no hay datos, mostrar mensaje instructivo
     if filtered_df is None:
@@ -596,8 +588,19 @@ def show_view():
         alias = device_display_map.get(dev_id, dev_id)
         return alias
     
-    filtered_df = filtered_df.copy()
-    filtered_df['device_name'] = filtered_df['device_id'].apply(get_display_name)
+    # assign: con copy-on-write no duplica las columnas existentes; sobre la categórica
+    # el alias se resuelve una vez por dispositivo y no por fila
+    filtered_df = filtered_df.assign(device_name=filtered_df['device_id'].map(get_display_name))
+
+    # --- SALUD HISTÓRICA: cada lectura contra los mismos umbrales del dashboard ---
+    try:
+        threshold_matrix = get_threshold_matrix(
+            sensor_config, {k: v.get('thresholds', {}) for k, v in device_metadata.items()}
+        )
+        intervals_df = violation_intervals(filtered_df, threshold_matrix, selected_params)
+    except Exception as e:
+        print(f"[graphs.py] Error calculando intervalos fuera de rango: {e}")
+        intervals_df = None
 
     # --- INFO DE RANGO ---
     t_min = filtered_df['timestamp'].min()
@@ -617,12 +620,33 @@ def show_view():
     # --- GRÁFICOS ---
     st.markdown("<br>", unsafe_allow_html=True)
     
+    c_scale, c_budget = st.columns([3, 1])
+    
     # Opción de escala compartida (con estado persistente)
-    use_shared_scale = st.checkbox(
-        "Usar escala Y compartida entre dispositivos", 
-        value=True,
-        key="graphs_shared_scale"
-    )
+    with c_scale:
+        use_shared_scale = st.checkbox(
+            "Usar escala Y compartida entre dispositivos", 
+            value=True,
+            key="graphs_shared_scale"
+        )
+        show_bands = st.checkbox(
+            "Sombrear intervalos fuera de rango",
+            value=True,
+            key="graphs_out_of_range_bands",
+            help="Ámbar: fuera del rango óptimo. Rojo: fuera del rango crítico.",
+            disabled=intervals_df is None
+        )
+    
+    # Presupuesto de puntos por trazo (decimación min-max / LTTB en el servidor de Streamlit)
+    with c_budget:
+        budget_label = st.selectbox(
+            "Puntos por trazo",
+            list(PRESUPUESTOS_PUNTOS.keys()),
+            index=list(PRESUPUESTOS_PUNTOS.values()).index(DEFAULT_POINT_BUDGET),
+            key="graphs_point_budget",
+            help="Máximo de puntos enviados al navegador por cada línea. Los picos se conservan."
+        )
+    point_budget = PRESUPUESTOS_PUNTOS[budget_label]
 
     for param in selected_params:
         label, unit = get_sensor_display_info(param, sensor_config)
@@ -637,12 +661,16 @@ def show_view():
         # Ordenar por dispositivo y timestamp
         chart_data = chart_data.sort_values(['device_name', 'timestamp'])
 
+        param_intervals = None
+        if intervals_df is not None and not intervals_df.empty:
+            param_intervals = intervals_df[intervals_df['sensor'] == param]
+
         with st.container(border=True):
             # Header del gráfico con promedios por dispositivo
             st.markdown(f"### {label}{unit_str}")
             
             # Calcular promedios por dispositivo
-            promedios_dispositivos = chart_data.groupby('device_name')[param].mean()
+            promedios_dispositivos = chart_data.groupby('device_name', observed=True)[param].mean()
             promedio_global = chart_data[param].mean()
             
             # Mostrar promedios por dispositivo en columnas dinámicas
@@ -685,38 +713,93 @@ def show_view():
             n_total = len(chart_data)
             window = 5 if n_total < 1000 else (20 if n_total < 10000 else 50)
             
-            # Agregar trazos por dispositivo
-            for idx, (dev_name, dev_data) in enumerate(chart_data.groupby('device_name', sort=False)):
-                color = colors[idx % len(colors)]
-                dev_sorted = dev_data.sort_values('timestamp')
-                
-                # Línea de valores reales (fina, semi-transparente)
-                fig.add_trace(go.Scatter(
-                    x=dev_sorted['timestamp'],
-                    y=dev_sorted[param],
-                    mode='lines',
-                    name=f'{dev_name}',
-                    line=dict(color=color, width=1),
-                    opacity=0.5,
-                    hovertemplate=f'{dev_name}<br>%{{x}}<br>{label}: %{{y:.2f}}{unit}<extra></extra>',
-                    legendgroup=dev_name
-                ))
-                
-                # Línea de tendencia (SMA) - gruesa, sólida
-                if len(dev_sorted) > window:
-                    sma = dev_sorted[param].rolling(window=window, min_periods=1).mean()
+            # Bandas fuera de rango (debajo de las líneas)
+            if show_bands and param_intervals is not None and not param_intervals.empty:
+                for dev_id, dev_intervals in param_intervals.groupby('device_id', sort=False, observed=True):
+                    agregar_bandas_fuera_de_rango(fig, dev_intervals, get_display_name(dev_id))
+
+            # Series agregadas para este parámetro (rangos largos)
+            param_buckets = None
+            if buckets_df is not None and not buckets_df.empty:
+                param_buckets = buckets_df[buckets_df['sensor'] == param]
+                if param_buckets.empty:
+                    param_buckets = None
+            
+            if param_buckets is not None:
+                # Banda min-max + línea de promedio por bucket (un punto por bucket)
+                for idx, (dev_id, dev_buckets) in enumerate(param_buckets.groupby('device_id', sort=False, observed=True)):
+                    color = colors[idx % len(colors)]
+                    dev_name = get_display_name(dev_id)
                     fig.add_trace(go.Scatter(
-                        x=dev_sorted['timestamp'],
-                        y=sma,
+                        x=dev_buckets['timestamp'],
+                        y=dev_buckets['min'],
                         mode='lines',
-                        name=f'{dev_name} (Tendencia)',
-                        line=dict(color=color, width=2.5),
-                        opacity=1.0,
+                        line=dict(color=color, width=0),
                         hoverinfo='skip',
                         legendgroup=dev_name,
-                        showlegend=True
+                        showlegend=False
                     ))
-            
+                    fig.add_trace(go.Scatter(
+                        x=dev_buckets['timestamp'],
+                        y=dev_buckets['max'],
+                        mode='lines',
+                        name=f'{dev_name} (Mín-Máx)',
+                        line=dict(color=color, width=0),
+                        fill='tonexty',
+                        opacity=0.2,
+                        hoverinfo='skip',
+                        legendgroup=dev_name
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=dev_buckets['timestamp'],
+                        y=dev_buckets['mean'],
+                        mode='lines',
+                        name=f'{dev_name}',
+                        line=dict(color=color, width=2),
+                        customdata=dev_buckets[['min', 'max']].to_numpy(),
+                        hovertemplate=f'{dev_name}<br>%{{x}}<br>{label}: %{{y:.2f}}{unit} (%{{customdata[0]:.2f}} - %{{customdata[1]:.2f}})<extra></extra>',
+                        legendgroup=dev_name
+                    ))
+            else:
+                # Agregar trazos por dispositivo (datos crudos + SMA)
+                for idx, (dev_name, dev_data) in enumerate(chart_data.groupby('device_name', sort=False, observed=True)):
+                    color = colors[idx % len(colors)]
+                    dev_sorted = dev_data.sort_values('timestamp')
+                    
+                    x_full = dev_sorted['timestamp'].to_numpy()
+                    y_full = dev_sorted[param].to_numpy()
+                    
+                    # Línea de valores reales (fina, semi-transparente)
+                    # Envolvente min-max: cada pico sigue visible aunque se envíen menos puntos
+                    x_raw, y_raw = decimate(x_full, y_full, point_budget, method="minmax") if point_budget else (x_full, y_full)
+                    fig.add_trace(go.Scatter(
+                        x=x_raw,
+                        y=y_raw,
+                        mode='lines',
+                        name=f'{dev_name}',
+                        line=dict(color=color, width=1),
+                        opacity=0.5,
+                        hovertemplate=f'{dev_name}<br>%{{x}}<br>{label}: %{{y:.2f}}{unit}<extra></extra>',
+                        legendgroup=dev_name
+                    ))
+                    
+                    # Línea de tendencia (SMA) - gruesa, sólida
+                    if len(dev_sorted) > window:
+                        # SMA sobre la serie completa; la curva suave se reduce con LTTB
+                        sma = dev_sorted[param].rolling(window=window, min_periods=1).mean().to_numpy()
+                        x_sma, y_sma = decimate(x_full, sma, point_budget, method="lttb") if point_budget else (x_full, sma)
+                        fig.add_trace(go.Scatter(
+                            x=x_sma,
+                            y=y_sma,
+                            mode='lines',
+                            name=f'{dev_name} (Tendencia)',
+                            line=dict(color=color, width=2.5),
+                            opacity=1.0,
+                            hoverinfo='skip',
+                            legendgroup=dev_name,
+                            showlegend=True
+                        ))
+                
             # Personalización del layout
             fig.update_layout(
                 hovermode="x unified",
@@ -741,14 +824,15 @@ def show_view():
                     gridcolor='rgba(0,0,0,0.05)',
                     range=y_range,
                     title=f'{label}{unit_str}'
-                )
+                ),
+                yaxis2=dict(overlaying='y', range=[0, 1], visible=False, fixedrange=True)
             )
             
             st.plotly_chart(fig, width='stretch')
             
             # --- ESTADÍSTICAS ---
             with st.expander("Estadísticas Detalladas", expanded=False):
-                stats = chart_data.groupby('device_name')[param].agg(
+                stats = chart_data.groupby('device_name', observed=True)[param].agg(
                     Mínimo='min',
                     Promedio='mean',
                     Mediana='median',
@@ -766,4 +850,20 @@ def show_view():
                     stats,
                     width='stretch',
                     hide_index=True
-                )
\ No newline at end of file
+                )
+
+                # Tiempo fuera de rango por dispositivo (intervalos ya calculados)
+                if param_intervals is not None and not param_intervals.empty:
+                    fuera = time_out_of_range(param_intervals, filtered_df)
+                    fuera['Dispositivo'] = fuera['device_id'].map(get_display_name)
+                    fuera['En alerta'] = fuera['warning'].map(formatear_duracion)
+                    fuera['En crítico'] = fuera['critical'].map(formatear_duracion)
+                    fuera['% del período'] = fuera['pct_out'].map(lambda p: f"{p:.1f}%" if pd.notna(p) else "-")
+                    fuera['Peor valor'] = fuera['worst'].map('{:.2f}'.format)
+                    fuera = fuera.rename(columns={'episodes': 'Episodios'})
+                    st.markdown("**Tiempo fuera de rango**")
+                    st.dataframe(
+                        fuera[['Dispositivo', 'En alerta', 'En crítico', '% del período', 'Episodios', 'Peor valor']],
+                        width='stretch',
+                        hide_index=True
+                    )
\ No newline at end of file
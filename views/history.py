@@ -1,13 +1,18 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone, time as dt_time
 from io import BytesIO
 from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
+import tempfile
 import time
 
 from modules.database import DatabaseConnection
 from modules.config_manager import ConfigManager
+from modules.telemetry_normalizer import normalize_sensor_columns
+from modules.telemetry_repository import get_telemetry_repository
+from modules.telemetry_export import BACKUP_PART_MAX_BYTES, EXPORT_FORMATS, export_backup_parts, frame_chunks
 
 # ICONOS SVG
 ICON_SEARCH = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="11" cy="11" r="8"/><line x1="21" y1="21" x2="16.65" y2="16.65"/></svg>'
@@ -20,20 +25,16 @@ ICON_LIST = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" view
 ICON_CPU = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><rect x="4" y="4" width="16" height="16" rx="2" ry="2"/><rect x="9" y="9" width="6" height="6"/><line x1="9" y1="1" x2="9" y2="4"/><line x1="15" y1="1" x2="15" y2="4"/><line x1="9" y1="20" x2="9" y2="23"/><line x1="15" y1="20" x2="15" y2="23"/><line x1="20" y1="9" x2="23" y2="9"/><line x1="20" y1="14" x2="23" y2="14"/><line x1="1" y1="9" x2="4" y2="9"/><line x1="1" y1="14" x2="4" y2="14"/></svg>'
 
 # =============================================================================
-# FUNCIÓN DE CARGA OPTIMIZADA (Paralela + Caché por Rango)
+# FUNCIÓN DE CARGA OPTIMIZADA (Repositorio compartido con Gráficas)
 # =============================================================================
-@st.cache_data(ttl=3600, show_spinner=False)
 def cargar_datos_rango(start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Carga datos corrigiendo desfases de zona horaria (UTC vs Local).
-    Estrategia: Busca 2 días extra alrededor del rango para capturar datos UTC y luego normaliza a Local.
+    Sale del repositorio de telemetría compartido con Gráficas: la última semana ya está
+    en memoria; lo anterior viene de la caché Parquet en disco y Mongo sólo por lo que falta.
     """
     start_time_total = time.time()
     
-    # 1. Extender rango de búsqueda en DB generosamente (+/- 2 días)
-    mongo_end_date = end_date + timedelta(days=2)
-    mongo_start_date = start_date - timedelta(days=2)
-    
     # Normalizar inputs para comparaciones
     if start_date.tzinfo: start_date = start_date.replace(tzinfo=None)
     if end_date.tzinfo: end_date = end_date.replace(tzinfo=None)
@@ -42,112 +43,16 @@ def cargar_datos_rango(start_date: datetime, end_date: datetime, devices: Option
         db = DatabaseConnection()
         if not db.sources: return pd.DataFrame()
 
-        mongo_start_iso = mongo_start_date.isoformat()
-        mongo_end_iso = mongo_end_date.isoformat()
+        df = get_telemetry_repository().get_range(db, start_date, end_date, devices)
+        if df.empty: return pd.DataFrame()
         
-        all_norm_docs = []
-
-        def load_source(source):
-            source_name = source.get('name', 'Unknown')
-            try:
-                database = source["client"][source["db"]]
-                collection = database[source["coll_telemetry"]]
-                
-                # Base Query de tiempo EXTENDIDA AMBOS LADOS (+/- 2 DIAS)
-                time_query = {
-                    "$or": [
-                        {"timestamp": {"$gte": mongo_start_date, "$lte": mongo_end_date}},
-                        {"timestamp": {"$gte": mongo_start_iso, "$lte": mongo_end_iso}}
-                    ]
-                }
-                
-                projection = {
-                    '_id': 1, 'timestamp': 1, 'device_id': 1, 'dispositivo_id': 1,
-                    'sensors': 1, 'datos': 1, 'location': 1, 'metadata': 1
-                }
-                
-                cursor = collection.find(time_query, projection)
-                raw_docs = list(cursor)
-                
-                print(f"[history.py] Fuente '{source_name}': {len(raw_docs)} docs cargados de MongoDB")
-                
-                valid_docs = []
-                rejected_device = 0
-                rejected_timestamp = 0
-                rejected_range = 0
-                
-                for doc in raw_docs:
-                    norm = db._normalize_document(doc)
-                    
-                    # Check 1: Timestamp y device_id válidos
-                    if not norm.get("timestamp") or norm.get("device_id") == "unknown":
-                        rejected_timestamp += 1
-                        continue
-                        
-                    # Check 2: Filtro de dispositivos (EN MEMORIA)
-                    if devices and norm.get("device_id") not in devices:
-                        rejected_device += 1
-                        continue
-
-                    ts = norm["timestamp"]
-                    
-                    # Convertir a datetime si es string
-                    if isinstance(ts, str):
-                        ts = pd.to_datetime(ts, errors='coerce')
-                        if pd.isna(ts):
-                            rejected_timestamp += 1
-                            continue
-                    
-                    # CONVERSIÓN EXPLÍCITA A UTC-3 (CHILE)
-                    target_offset = timedelta(hours=-3)
-                    
-                    if isinstance(ts, datetime):
-                        if ts.tzinfo is not None:
-                            # Timestamp con zona horaria: convertir a local
-                            ts_utc = ts.astimezone(timezone.utc)
-                            ts_local = ts_utc + target_offset
-                            ts = ts_local.replace(tzinfo=None)
-                        else:
-                            # Naive: Asumimos ya está en hora local
-                            pass
-                    
-                    norm["timestamp"] = ts
-                    
-                    # Check 3: Filtro FINAL EXACTO
-                    if start_date <= ts <= end_date:
-                        valid_docs.append(norm)
-                    else:
-                        rejected_range += 1
-
-                print(f"[history.py] Fuente '{source_name}': {len(valid_docs)} docs válidos")
-                print(f"[history.py] Fuente '{source_name}': Rechazados -> device_filter={rejected_device}, timestamp_invalid={rejected_timestamp}, out_of_range={rejected_range}")
-                
-                return valid_docs
-            except Exception as e:
-                print(f"[history.py] ERROR en {source_name}: {e}")
-                return []
-
-        # Ejecución Paralela
-        with ThreadPoolExecutor(max_workers=len(db.sources)) as executor:
-            futures = [executor.submit(load_source, s) for s in db.sources]
-            for f in as_completed(futures):
-                all_norm_docs.extend(f.result())
-
-        if not all_norm_docs: return pd.DataFrame()
-
-        # Convertir a DataFrame
-        df = db._parse_historical_flat(all_norm_docs)
+        # El repositorio tiene las columnas de TODOS los dispositivos: dejar sólo los sensores con datos
+        base_cols = ['timestamp', 'device_id', 'location']
+        empty_cols = [c for c in df.columns if c not in base_cols and df[c].isna().all()]
+        df = df.drop(columns=empty_cols)
         
-        # Limpieza columnas
-        try:
-            cols_map = {}
-            for c in df.columns:
-                clean = c.lower().strip()
-                if clean in ['temp', 'temperatura']: clean = 'temperature'
-                cols_map[c] = clean
-            df = df.rename(columns=cols_map)
-        except:
-            pass
+        # Limpieza columnas (mismo registro de alias que el resto de normalizadores)
+        df = normalize_sensor_columns(df)
         
         # Ordenar DESC
         if 'timestamp' in df.columns:
@@ -162,22 +67,184 @@ def cargar_datos_rango(start_date: datetime, end_date: datetime, devices: Option
         st.error(f"Error cargando datos: {e}")
         return pd.DataFrame()
 
-def convert_df_to_csv(df):
-    return df.to_csv(index=False).encode('utf-8')
-
-def convert_df_to_excel(df):
+def convert_df_to_format(df, fmt):
+    # Writers por trozos de telemetry_export (Excel write-only, Parquet / Arrow con diccionarios)
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Datos')
+    EXPORT_FORMATS[fmt].writer(frame_chunks(df), output)
     return output.getvalue()
 
+# =============================================================================
+# RESULTADO DE LA BÚSQUEDA: PREPARACIÓN ÚNICA Y ARTEFACTOS MEMORIZADOS
+# =============================================================================
+CATEGORY_COLUMNS = ['device_id', 'location']
+
+def preparar_resultado(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Se aplica UNA vez al cargar (no en cada rerun): timestamps sin zona y device_id / location
+    como categóricas, así el filtro de texto y los alias trabajan sobre los valores distintos.
+    """
+    if df.empty:
+        return df
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        df = df.dropna(subset=['timestamp'])
+        if not df.empty and df['timestamp'].dt.tz is not None:
+            df['timestamp'] = df['timestamp'].dt.tz_localize(None)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def _categorias_que_cumplen(series: pd.Series, match) -> np.ndarray:
+    """Máscara por fila evaluando `match` sólo sobre las categorías (valores distintos)."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    hits = np.asarray(match(series.cat.categories.astype(str)), dtype=bool)
+    # Código -1 (valor nulo) cae en el False agregado al final
+    return np.append(hits, False)[series.cat.codes.to_numpy()]
+
+def filtrar_por_texto(df: pd.DataFrame, text: str, alias_map: Dict[str, str]) -> pd.DataFrame:
+    """Filas cuyo ID, alias o ubicación contienen `text` (sin distinguir mayúsculas, texto literal)."""
+    needle = text.strip().lower()
+    if not needle or df.empty:
+        return df
+
+    def contains(values: pd.Index) -> np.ndarray:
+        return values.str.lower().str.contains(needle, regex=False)
+
+    mask = _categorias_que_cumplen(
+        df['device_id'],
+        lambda ids: contains(ids) | contains(pd.Index([alias_map.get(i, "") for i in ids], dtype=str))
+    )
+    if 'location' in df.columns:
+        mask |= _categorias_que_cumplen(df['location'], contains)
+    return df[mask]
+
+def columna_alias(series: pd.Series, alias_map: Dict[str, str]) -> pd.Series:
+    """Alias de cada dispositivo; sobre una categórica el mapeo se hace una vez por categoría."""
+    return series.map(lambda x: alias_map.get(x, x))
+
+def memo_vista(key) -> Dict:
+    """
+    Artefactos de la vista (filtrado, resumen, vista previa, archivos de descarga) memorizados en la
+    sesión para la combinación actual de búsqueda + filtro de texto. Al cambiar la clave se descartan.
+    """
+    memo = st.session_state.get('history_memo')
+    if memo is None or memo['key'] != key:
+        memo = {'key': key, 'items': {}, 'hits': 0, 'builds': 0}
+        st.session_state.history_memo = memo
+    return memo
+
+def memorizado(memo: Dict, name: str, build):
+    if name in memo['items']:
+        memo['hits'] += 1
+    else:
+        memo['items'][name] = build()
+        memo['builds'] += 1
+    return memo['items'][name]
+
+def resumen_html(df: pd.DataFrame, alias_map: Dict[str, str]) -> str:
+    """Tarjeta de métricas (rango, total, detalle por dispositivo) del resultado filtrado."""
+    dev_counts = df['device_id'].value_counts()
+    dev_counts = dev_counts[dev_counts > 0]
+    summary_items = [
+        f"<span style='background:#e0f2fe; color:#0369a1; padding:2px 8px; border-radius:4px;'>{alias_map.get(dev, dev)}: <b>{count}</b></span>"
+        for dev, count in dev_counts.items()
+    ]
+    dev_summary_html = " ".join(summary_items)
+
+    min_ts = df['timestamp'].min().strftime('%d/%m %H:%M:%S')
+    max_ts = df['timestamp'].max().strftime('%d/%m %H:%M:%S')
+    total_devs = len(dev_counts)
+
+    return f"""
+            <div style="background-color:#ffffff; padding:15px; border-radius:8px; font-size:0.9rem; color:#334155; border:1px solid #e2e8f0; margin-top:15px; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
+                <div style="display:flex; justify-content:space-between; align-items:center; flex-wrap:wrap; gap:20px; border-bottom:1px solid #f1f5f9; padding-bottom:10px; margin-bottom:10px;">
+                    <div style="display:flex; align-items:center; gap:6px;">
+                        {ICON_CLOCK} <span style="font-weight:600;">Rango:</span> {min_ts} — {max_ts}
+                    </div>
+                    <div style="display:flex; align-items:center; gap:6px;">
+                        {ICON_LIST} <span style="font-weight:600;">Total Registros:</span> {len(df)}
+                    </div>
+                    <div style="display:flex; align-items:center; gap:6px;">
+                        {ICON_CPU} <span style="font-weight:600;">Dispositivos:</span> {total_devs}
+                    </div>
+                </div>
+                <div style="font-size:0.8rem; display:flex; align-items:center; gap:8px;">
+                    <span style="color:#64748b;">Detalle:</span> {dev_summary_html}
+                </div>
+            </div>
+            """
+
+def vista_previa(df: pd.DataFrame, alias_map: Dict[str, str], rows: int = 500) -> pd.DataFrame:
+    df_show = df.head(rows)
+    if 'device_id' in df_show.columns:
+        df_show = df_show.assign(Dispositivo=columna_alias(df_show['device_id'], alias_map))
+    base_cols = ['timestamp', 'Dispositivo', 'location']
+    final_cols = [c for c in base_cols if c in df_show.columns] + [c for c in df_show.columns if c not in base_cols and c != 'device_id' and c != '_id']
+    return df_show[final_cols]
+
+# Botones de descarga de la selección: (formato, ayuda, primario)
+SELECTION_DOWNLOADS = [
+    ("csv", "Formato ligero, ideal para análisis de datos masivos.", True),
+    ("xlsx", "Formato Excel con encabezados y formato de celdas.", True),
+    ("parquet", "Columnar comprimido (zstd). Se abre con pd.read_parquet / polars / DuckDB.", False),
+    ("arrow", "Arrow IPC / Feather (lz4). Carga casi instantánea con pd.read_feather / polars.", False),
+]
+
+def boton_descarga(memo: Dict, df: pd.DataFrame, fmt: str, file_base: str, help_txt: str, primary: bool):
+    """
+    El archivo se genera sólo cuando se pide ('Preparar') y queda memorizado para la búsqueda
+    y filtro actuales: en los reruns siguientes el botón de descarga aparece directo.
+    """
+    export_format = EXPORT_FORMATS[fmt]
+    button_type = "primary" if primary else "secondary"
+    data = memo['items'].get(f"file_{fmt}")
+    if data is None and st.button(f"Preparar Selección ({export_format.label})", key=f"prep_{fmt}",
+                                  type=button_type, use_container_width=True, help=help_txt):
+        try:
+            with st.spinner(f"Generando {export_format.label}..."):
+                data = memorizado(memo, f"file_{fmt}", lambda: convert_df_to_format(df, fmt))
+        except Exception as e:
+            st.warning(f"Error generando {export_format.label}: {e}")
+    if data is not None:
+        st.download_button(
+            label=f"Descargar Selección ({export_format.label})",
+            data=data,
+            file_name=f"{file_base}.{export_format.extension}",
+            mime=export_format.mime,
+            key=f"dl_{fmt}",
+            help=help_txt,
+            type=button_type,
+            use_container_width=True
+        )
+
+def descartar_backup():
+    """Borra del disco las partes del último backup generado en esta sesión."""
+    backup = st.session_state.pop("backup", None)
+    if backup:
+        shutil.rmtree(backup["dir"], ignore_errors=True)
+
+def panel_rendimiento(timings: Dict[str, float], memo: Optional[Dict]):
+    """Panel de diagnóstico: latencia del rerun por etapa y reutilización de artefactos."""
+    with st.expander("Diagnóstico de rendimiento", expanded=False):
+        rows = [{"Etapa": name, "ms": round(seconds * 1000, 1)} for name, seconds in timings.items()]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        if memo is not None:
+            st.caption(f"Artefactos memorizados: {len(memo['items'])} | reutilizados: {memo['hits']} | "
+                       f"generados: {memo['builds']}")
+
 def show_view():
+    # Latencia del rerun por etapa (panel de diagnóstico al final)
+    t_rerun = time.perf_counter()
+    timings: Dict[str, float] = {}
+
     c1, c2 = st.columns([5, 2])
     with c1:
         st.subheader("Base de Datos Histórica")
     with c2:
         if st.button("Actualizar Tabla", type="primary", key="refresh_btn", help="Recargar datos"):
-            cargar_datos_rango.clear()
+            get_telemetry_repository().invalidate()
             st.rerun()
 
     # --- 1. CARGA INICIAL ---
@@ -250,19 +317,26 @@ def show_view():
             st.session_state.history_data = None
         if 'last_params' not in st.session_state:
             st.session_state.last_params = None
+        if 'history_version' not in st.session_state:
+            st.session_state.history_version = 0
             
         # Detectar cambios en filtros para limpiar vista vieja
         current_params = (start_time, end_time, tuple(sorted(sel_devices_pre)))
         
         if st.session_state.last_params != current_params and not buscar:
             st.session_state.history_data = None
+            st.session_state.pop('history_memo', None)
             
         if buscar:
             devs_to_search = sel_devices_pre if sel_devices_pre else None
             
+            t_stage = time.perf_counter()
             with st.spinner(f"Consultando..."):
-                st.session_state.history_data = cargar_datos_rango(start_time, end_time, devs_to_search)
+                st.session_state.history_data = preparar_resultado(cargar_datos_rango(start_time, end_time, devs_to_search))
                 st.session_state.last_params = current_params
+                # Nueva carga: invalida los artefactos memorizados de la búsqueda anterior
+                st.session_state.history_version += 1
+            timings["carga"] = time.perf_counter() - t_stage
                 
         df = st.session_state.history_data
 
@@ -279,13 +353,6 @@ def show_view():
             st.warning("No se encontraron registros.")
             return
 
-        # Preprocesamiento
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            df = df.dropna(subset=['timestamp'])
-            if not df.empty and df['timestamp'].dt.tz is not None:
-                df['timestamp'] = df['timestamp'].dt.tz_localize(None)
-
         # --- FILTROS SECUNDARIOS (Texto) ---
         st.markdown("---")
         
@@ -294,64 +361,29 @@ def show_view():
              text_search = st.text_input("Filtrar resultados por Texto (ID, Ubicación)", placeholder="Buscar en resultados cargados...")
 
 
-    # Aplicar Filtros
+    # Aplicar Filtros (memorizado por búsqueda + texto)
     alias_map = alias_map_pre
+    memo = memo_vista((st.session_state.last_params, st.session_state.history_version, text_search.strip().lower()))
 
-    if text_search:
-        s = text_search.lower()
-        if 'location' not in df.columns: df['location'] = ""
-        df['temp_alias'] = df['device_id'].map(lambda x: alias_map.get(x, "").lower())
-        
-        df = df[df['device_id'].astype(str).str.lower().str.contains(s) | 
-                df['location'].astype(str).str.lower().str.contains(s) |
-                df['temp_alias'].str.contains(s)]
-        df = df.drop(columns=['temp_alias'])
+    t_stage = time.perf_counter()
+    df = memorizado(memo, 'filtered', lambda: filtrar_por_texto(df, text_search, alias_map))
+    timings["filtro"] = time.perf_counter() - t_stage
 
     # --- MÉTRICAS DE ESTADO ---
+    t_stage = time.perf_counter()
     if not df.empty:
         try:
-            dev_counts = df['device_id'].value_counts().reset_index()
-            dev_counts.columns = ['device_id', 'count']
-            dev_counts['alias'] = dev_counts['device_id'].apply(lambda x: alias_map.get(x, x))
-            
-            summary_items = []
-            for _, row in dev_counts.iterrows():
-                summary_items.append(f"<span style='background:#e0f2fe; color:#0369a1; padding:2px 8px; border-radius:4px;'>{row['alias']}: <b>{row['count']}</b></span>")
-            
-            dev_summary_html = " ".join(summary_items)
-
-            min_ts = df['timestamp'].min().strftime('%d/%m %H:%M:%S')
-            max_ts = df['timestamp'].max().strftime('%d/%m %H:%M:%S')
-            total_devs = df['device_id'].nunique()
-            
-            st.markdown(f"""
-            <div style="background-color:#ffffff; padding:15px; border-radius:8px; font-size:0.9rem; color:#334155; border:1px solid #e2e8f0; margin-top:15px; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
-                <div style="display:flex; justify-content:space-between; align-items:center; flex-wrap:wrap; gap:20px; border-bottom:1px solid #f1f5f9; padding-bottom:10px; margin-bottom:10px;">
-                    <div style="display:flex; align-items:center; gap:6px;">
-                        {ICON_CLOCK} <span style="font-weight:600;">Rango:</span> {min_ts} — {max_ts}
-                    </div>
-                    <div style="display:flex; align-items:center; gap:6px;">
-                        {ICON_LIST} <span style="font-weight:600;">Total Registros:</span> {len(df)}
-                    </div>
-                    <div style="display:flex; align-items:center; gap:6px;">
-                        {ICON_CPU} <span style="font-weight:600;">Dispositivos:</span> {total_devs}
-                    </div>
-                </div>
-                <div style="font-size:0.8rem; display:flex; align-items:center; gap:8px;">
-                    <span style="color:#64748b;">Detalle:</span> {dev_summary_html}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(memorizado(memo, 'summary', lambda: resumen_html(df, alias_map)), unsafe_allow_html=True)
         except Exception as e:
             st.error(f"Error métricas: {e}")
+    timings["métricas"] = time.perf_counter() - t_stage
 
     # --- 3. SECCIÓN DE DESCARGA ---
+    t_stage = time.perf_counter()
     st.markdown("---")
     res_txt = f"Registros seleccionados: {len(df)}"
     st.markdown(f"#### Exportar Datos ({res_txt})")
     
-    c_down1, c_down2 = st.columns(2)
-    
     try:
         f_start = start_d.strftime('%Y%m%d')
         f_end = end_d.strftime('%Y%m%d')
@@ -361,72 +393,78 @@ def show_view():
         
     file_base = f"biofloc_data_{f_start}_{f_end}"
     
-    with c_down1:
-        csv_data = convert_df_to_csv(df)
-        st.download_button(
-            label="Descargar Selección (CSV)",
-            data=csv_data,
-            file_name=f"{file_base}.csv",
-            mime="text/csv",
-            help="Formato ligero, ideal para análisis de datos masivos.",
-            type="primary",
-            use_container_width=True
-        )
-
-    with c_down2:
-        try:
-            excel_data = convert_df_to_excel(df)
-            st.download_button(
-                label="Descargar Selección (Excel)",
-                data=excel_data,
-                file_name=f"{file_base}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                help="Formato Excel con encabezados y formato de celdas.",
-                type="primary",
-                use_container_width=True
-            )
-        except Exception as e:
-             st.warning(f"Error generando Excel: {e}")
+    # Los archivos se generan sólo al pedirlos (no en cada rerun) y quedan memorizados
+    for row in (SELECTION_DOWNLOADS[:2], SELECTION_DOWNLOADS[2:]):
+        for column, (fmt, help_txt, primary) in zip(st.columns(2), row):
+            with column:
+                boton_descarga(memo, df, fmt, file_base, help_txt, primary)
+    timings["exportación"] = time.perf_counter() - t_stage
 
     st.markdown("<br>", unsafe_allow_html=True)
 
     # --- 4. OPCIÓN: DESCARGAR TODO ---
     with st.expander("Descargar Base de Datos Completa (Backup)", expanded=False):
-        st.info("Esta opción descargará TODOS los datos históricos disponibles. Puede tardar varios minutos.")
-        if st.button("Generar Backup Completo (CSV)"):
+        st.info("Esta opción descargará TODOS los datos históricos disponibles, en un archivo por año "
+                f"(o por mes si el año supera {BACKUP_PART_MAX_BYTES // (1024 * 1024)} MB). Puede tardar varios minutos.")
+        backup_fmt = st.selectbox(
+            "Formato del backup",
+            options=["csv", "parquet", "arrow"],
+            format_func=lambda f: EXPORT_FORMATS[f].label,
+            help="Parquet / Arrow pesan una fracción del CSV y cargan mucho más rápido en pandas."
+        )
+        backup_format = EXPORT_FORMATS[backup_fmt]
+        if st.button(f"Generar Backup Completo ({backup_format.label})"):
+            descartar_backup()
             with st.spinner("Generando backup completo..."):
-                # Usar fecha fija como ancla para que el caché funcione correctamente
-                # (datetime.now() cambia en cada llamada y rompe @st.cache_data)
+                # Días completos desde el origen del proyecto hasta el fin del día actual
                 now = datetime.now()
-                backup_start = datetime(2020, 1, 1)  # Desde el origen del proyecto
-                backup_end = datetime(now.year, now.month, now.day, 23, 59, 59)  # Fin del día actual
-                df_all = cargar_datos_rango(backup_start, backup_end)
-                
-                if not df_all.empty:
-                    csv_all = convert_df_to_csv(df_all)
-                    st.success(f"Backup generado: {len(df_all)} registros.")
-                    st.download_button(
-                        label="Descargar Archivo Backup Completo",
-                        data=csv_all,
-                        file_name=f"FULL_BACKUP_BIOFLOC_{now.strftime('%Y%m%d')}.csv",
-                        mime="text/csv",
-                        type="secondary"
-                    )
+                backup_start = datetime(2020, 1, 1)
+                backup_end = datetime(now.year, now.month, now.day, 23, 59, 59)
+                # Streaming por lotes a archivos temporales, uno por período: no se arma el DataFrame completo
+                backup_dir = tempfile.mkdtemp(prefix="biofloc_backup_")
+                try:
+                    parts = export_backup_parts(db, backup_start, backup_end, backup_dir, backup_fmt)
+                except Exception as e:
+                    shutil.rmtree(backup_dir, ignore_errors=True)
+                    st.error(f"Error generando backup: {e}")
                 else:
-                    st.error("No se encontraron datos para el backup.")
+                    if parts:
+                        st.session_state["backup"] = {"dir": backup_dir, "parts": parts, "format": backup_fmt,
+                                                      "date": now.strftime('%Y%m%d')}
+                    else:
+                        shutil.rmtree(backup_dir, ignore_errors=True)
+                        st.error("No se encontraron datos para el backup.")
+
+        backup = st.session_state.get("backup")
+        if backup:
+            parts = backup["parts"]
+            part_format = EXPORT_FORMATS[backup["format"]]
+            st.success(f"Backup generado: {sum(p.rows for p in parts)} registros en {len(parts)} archivo(s).")
+            # Un solo botón para la parte elegida: el archivo se lee a memoria al servirlo
+            part = parts[st.selectbox(
+                "Parte del backup",
+                options=range(len(parts)),
+                format_func=lambda i: f"{parts[i].label} · {parts[i].rows} registros · {parts[i].size / (1024 * 1024):.1f} MB"
+            )]
+            with open(part.path, "rb") as backup_file:
+                st.download_button(
+                    label=f"Descargar Backup {part.label}",
+                    data=backup_file,
+                    file_name=f"FULL_BACKUP_BIOFLOC_{backup['date']}_{part.label}.{part_format.extension}",
+                    mime=part_format.mime,
+                    type="secondary"
+                )
+            if st.button("Descartar backup"):
+                descartar_backup()
+                st.rerun()
 
     st.markdown("---")
 
     # --- 5. VISTA PREVIA ---
+    t_stage = time.perf_counter()
     st.markdown(f"**Vista Previa (Últimos {min(500, len(df))} registros)**")
     
-    df_show = df.head(500).copy()
-    if 'device_id' in df_show.columns:
-        df_show['Dispositivo'] = df_show['device_id'].apply(lambda x: alias_map.get(x, x))
-        
-    base_cols = ['timestamp', 'Dispositivo', 'location']
-    final_cols = [c for c in base_cols if c in df_show.columns] + [c for c in df_show.columns if c not in base_cols and c != 'device_id' and c != '_id']
-    df_show = df_show[final_cols]
+    df_show = memorizado(memo, 'preview', lambda: vista_previa(df, alias_map))
     
     column_config = {
         "timestamp": st.column_config.DatetimeColumn("Fecha/Hora", format="DD/MM/YYYY HH:mm:ss"),
@@ -445,3 +483,7 @@ def show_view():
         use_container_width=True,
         hide_index=True
     )
+    timings["vista previa"] = time.perf_counter() - t_stage
+
+    timings["total rerun"] = time.perf_counter() - t_rerun
+    panel_rendimiento(timings, memo)
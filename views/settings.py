@@ -3,7 +3,7 @@ import pandas as pd
 from typing import Dict, Any, List
 
 from modules.database import DatabaseConnection
-from modules.config_manager import ConfigManager
+from modules.config_manager import ConfigManager, invalidate_device_metadata
 
 # --- ICONOS SVG ---
 ICON_SAVE = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M19 21H5a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h11l5 5v11a2 2 0 0 1-2 2z"/><polyline points="17 21 17 13 7 13 7 21"/><polyline points="7 3 7 8 15 8"/></svg>'
@@ -77,7 +77,9 @@ def show_view():
     with c1:
         st.subheader("Configuración del Sistema")
     with c2:
-        if st.button("Recargar", type="primary"): st.rerun()
+        if st.button("Recargar", type="primary"):
+            invalidate_device_metadata()
+            st.rerun()
 
     try:
         db = DatabaseConnection()